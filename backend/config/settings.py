@@ -112,7 +112,7 @@ CORS_ALLOW_ALL_ORIGINS = True # For development only
 # DRF Settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -125,4 +125,71 @@ REST_FRAMEWORK = {
     'DEFAULT_PARSER_CLASSES': (
         'djangorestframework_camel_case.parser.CamelCaseJSONParser',
     ),
+    'DEFAULT_THROTTLE_RATES': {
+        'order_track': '30/min', # Per IP, public order tracking lookup
+    },
 }
+
+# Shared cache. With more than one worker, point it at a cache they all share so the version
+# tokens of the process-local caches (content.localcache) reach every process:
+# CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://127.0.0.1:6379/1'}}
+LOCAL_CACHE_TTL_SECONDS = 30 # Process-local copies (settings rows, coupons) reload at least this often regardless
+
+ORDER_TRACK_CACHE_SECONDS = 60
+AUTH_TOKEN_CACHE = None # Cache alias shared by all workers (e.g. Redis) for token -> user lookups; None looks every token up in the DB
+AUTH_TOKEN_CACHE_SECONDS = 60 # Token -> user lookups (users.authentication)
+
+# Login codes (users.otp)
+OTP_TTL_SECONDS = 300
+OTP_MAX_ATTEMPTS = 5 # Wrong guesses per code
+OTP_CACHE = None # Cache alias shared by all workers (e.g. Redis); None keeps codes in the OTP table
+
+# Background report jobs (orders.jobs)
+REPORT_JOB_WORKERS = 2
+REPORT_JOB_STORAGE_DIR = BASE_DIR / 'private' # Finished CSVs; not web-served, admins fetch them via /report-jobs/<id>/download/
+REPORT_JOB_CACHE_SECONDS = 300 # Identical report requests within this window reuse the finished file
+REPORT_JOB_TIMEOUT_SECONDS = 1800 # A Running job older than this is assumed dead and re-run
+REPORT_JOB_STALE_SECONDS = 120 # A Pending job older than this was lost with its process and is re-run
+REPORT_JOB_RETENTION_SECONDS = 86400 # Finished jobs and their CSV files are deleted after this
+
+# Customer segments (orders.rfm): order counts / delivered Tk needed for scores 2, 3, 4 and 5
+RFM_FREQUENCY_BANDS = (2, 3, 5, 8)
+RFM_MONETARY_BANDS = (2000, 5000, 10000, 25000)
+
+# Image proxy for invoices (orders.image_proxy)
+IMAGE_PROXY_CACHE_DIR = BASE_DIR / 'cache' / 'image_proxy'
+IMAGE_PROXY_CACHE_MAX_BYTES = 200 * 1024 * 1024
+IMAGE_PROXY_EVICT_INTERVAL = 300 # Seconds between directory scans when under the size limit
+IMAGE_PROXY_MAX_IMAGE_BYTES = 5 * 1024 * 1024
+IMAGE_PROXY_TIMEOUT = (3, 5) # (connect, read) seconds
+IMAGE_PROXY_MAX_CONCURRENT = 8
+
+# Courier / fulfilment (orders.couriers, orders.fulfilment)
+# Couriers without a base_url here are simulated locally. Example:
+# COURIERS = {
+#     'pathao': {'base_url': 'https://api.pathao.example/v1', 'api_key': '...', 'timeout': (3, 10),
+#                'max_retries': 3, 'backoff': 0.5, 'breaker_threshold': 5, 'breaker_reset_seconds': 30},
+# }
+COURIERS = {}
+COURIER_BATCH_SIZE = 50 # Orders per create_shipments call
+COURIER_MAX_WORKERS = 4 # Courier batches in flight at once
+BULK_SHIP_MAX_ORDERS = 1000
+BULK_CANCEL_MAX_ORDERS = 1000
+SHIPMENT_JOB_WORKERS = 4 # Threads booking single-order shipments off the request thread (orders.shipping)
+SHIPMENT_JOB_STALE_SECONDS = 60 # A Pending shipment job older than this was lost with its process and is re-run
+SHIPMENT_JOB_TIMEOUT_SECONDS = 300 # A Running shipment job older than this is assumed dead and re-run
+
+# Outbound SMS queue (content.sms)
+SMS_WORKERS = 4 # Delivery threads per process
+SMS_TIMEOUT = (3, 10) # (connect, read) seconds
+SMS_MAX_ATTEMPTS = 4
+SMS_RETRY_BACKOFF = 2 # Seconds before the first retry, doubled after each failure
+SMS_DEFAULT_RATE_LIMIT = 10 # Messages per second per gateway
+SMS_RATE_LIMITS = {} # Per gateway host, e.g. {'bulksmsbd.net': 5}
+SMS_SENDING_TIMEOUT_SECONDS = 300 # A claim older than this is assumed dead and re-queued
+
+# Bulk SMS broadcasts (marketing.broadcasts)
+SMS_BROADCAST_BATCH_SIZE = 100 # Numbers per gateway call
+SMS_BROADCAST_WORKERS = 4 # Batches in flight at once
+SMS_BROADCAST_RATE_LIMIT = 2 # Gateway calls per second, leaves room for OTPs
+SMS_BROADCAST_STALE_SECONDS = 300 # A Running broadcast without a heartbeat this long is resumed
@@ -5,9 +5,9 @@ from django.conf.urls.static import static
 from rest_framework.routers import DefaultRouter
 
 from store.views import ProductViewSet, CategoryViewSet, BrandViewSet, ReviewViewSet, InventoryLogViewSet, SupplierViewSet, PurchaseOrderViewSet, QuestionViewSet, WishlistViewSet
-from orders.views import OrderViewSet, PaymentMethodViewSet, FollowUpViewSet, PaymentSettingsViewSet
-from orders.reports import ReportViewSet
-from marketing.views import CouponViewSet, CampaignViewSet, MarketingSettingsViewSet
+from orders.views import OrderViewSet, OrderEventViewSet, PaymentMethodViewSet, FollowUpViewSet, PaymentSettingsViewSet, ShipmentJobViewSet
+from orders.reports import ReportViewSet, ReportJobViewSet
+from marketing.views import CouponViewSet, CampaignViewSet, MarketingSettingsViewSet, SMSBroadcastViewSet
 from content.views import BannerViewSet, FAQViewSet, StaticPageViewSet, ThemeViewSet, SMSConfigViewSet
 from support.views import SupportTicketViewSet, TicketReplyViewSet
 
@@ -18,13 +18,17 @@ router.register(r'brands', BrandViewSet)
 router.register(r'reviews', ReviewViewSet)
 router.register(r'inventory-logs', InventoryLogViewSet)
 router.register(r'orders', OrderViewSet)
+router.register(r'order-events', OrderEventViewSet)
+router.register(r'shipment-jobs', ShipmentJobViewSet)
 router.register(r'payment-methods', PaymentMethodViewSet)
 router.register(r'payment-settings', PaymentSettingsViewSet)
 router.register(r'reports', ReportViewSet, basename='reports')
+router.register(r'report-jobs', ReportJobViewSet)
 router.register(r'followups', FollowUpViewSet)
 router.register(r'coupons', CouponViewSet)
 router.register(r'campaigns', CampaignViewSet)
 router.register(r'marketing-settings', MarketingSettingsViewSet)
+router.register(r'sms-broadcasts', SMSBroadcastViewSet)
 router.register(r'banners', BannerViewSet)
 router.register(r'faqs', FAQViewSet)
 router.register(r'pages', StaticPageViewSet)
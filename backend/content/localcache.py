@@ -0,0 +1,63 @@
+"""
+Process-local copies of hot, rarely-changing data (settings rows, the coupon table).
+
+Each process keeps the value it last loaded together with a version token from
+the shared cache. invalidate() drops this process's copy at once and bumps the
+token after commit, so every process sharing the cache reloads on its next read;
+until then a read costs one cache get and no queries.
+
+The token only reaches other workers through a cache they all share
+(Redis/Memcached, see CACHES in settings). As a fallback, and for writes that
+skip invalidate() (QuerySet.update(), the shell, another service), a copy is
+also reloaded once it is LOCAL_CACHE_TTL_SECONDS old, which bounds how long any
+worker can act on stale data.
+
+Values are shared between threads: treat them as read-only unless the owner says otherwise.
+"""
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+class VersionedLocalCache:
+    def __init__(self, key, load):
+        self.key = key # Version token in the shared cache
+        self.load = load
+        self._entry = None # (version, loaded_at, value)
+        self._lock = threading.Lock()
+
+    def _ttl(self):
+        return getattr(settings, 'LOCAL_CACHE_TTL_SECONDS', 30)
+
+    def get(self):
+        # Read the version before the value, so a save racing this load leaves us with the old version (and a reload)
+        version = cache.get(self.key)
+        entry = self._entry
+        if (entry is None or version is None or entry[0] != version
+                or time.monotonic() - entry[1] >= self._ttl()):
+            if version is None:
+                cache.add(self.key, uuid.uuid4().hex, None)
+                version = cache.get(self.key)
+            value = self.load()
+            with self._lock:
+                self._entry = entry = (version, time.monotonic(), value)
+        return entry[2]
+
+    def peek(self):
+        """The value held by this process, or None if nothing is loaded. Never loads."""
+        entry = self._entry
+        return entry[2] if entry is not None else None
+
+    def invalidate(self):
+        """Drop this process's copy now and tell every process to reload once the transaction commits."""
+        self.reset()
+        transaction.on_commit(lambda: cache.set(self.key, uuid.uuid4().hex, None))
+
+    def reset(self):
+        """Forget the copy in this process only (tests, or after a local-only change)."""
+        with self._lock:
+            self._entry = None
@@ -0,0 +1,19 @@
+import time
+from django.core.management.base import BaseCommand
+from content.sms import process_outbox
+
+class Command(BaseCommand):
+    help = 'Delivers queued SMS messages that are due (retries, and anything left behind by a restart)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=500, help='Max messages per run')
+        parser.add_argument('--loop', type=int, default=0, help='Keep running, sleeping this many seconds between runs')
+
+    def handle(self, *args, **options):
+        while True:
+            count = process_outbox(limit=options['limit'])
+            self.stdout.write(f"Dispatched {count} messages")
+
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
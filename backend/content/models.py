@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from .theme_models import ThemeConfig
 
 class Banner(models.Model):
@@ -72,3 +74,46 @@ class SMSSettings(models.Model):
         if not self.pk and SMSSettings.objects.exists():
             self.pk = SMSSettings.objects.first().pk
         return super(SMSSettings, self).save(*args, **kwargs)
+
+class SMSMessage(models.Model):
+    """Outbox row for one SMS; content.sms delivers it in the background and retries failures."""
+    KIND_CHOICES = (
+        ('otp', 'OTP'),
+        ('notification', 'Notification'),
+        ('test', 'Test'),
+    )
+    STATUS_CHOICES = (
+        ('Queued', 'Queued'),
+        ('Sending', 'Sending'),
+        ('Sent', 'Sent'),
+        ('Failed', 'Failed'),
+    )
+
+    phone_number = models.CharField(max_length=20)
+    message = models.TextField()
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='notification')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Queued')
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(auto_now_add=True) # Retries are pushed back with backoff
+    claimed_at = models.DateTimeField(null=True, blank=True) # When a worker took it (stale claims are re-queued)
+    gateway = models.CharField(max_length=255, blank=True) # Gateway host the last attempt went to
+    response_code = models.IntegerField(null=True, blank=True)
+    response_text = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Outbox poll: due messages, oldest first
+            models.Index(fields=['status', 'next_attempt_at'], name='smsmessage_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} to {self.phone_number} - {self.status}"
+
+@receiver(post_save, sender=SMSSettings)
+@receiver(post_delete, sender=SMSSettings)
+def invalidate_sms_settings(sender, **kwargs):
+    from .singletons import invalidate
+    invalidate(sender)
@@ -0,0 +1,55 @@
+"""
+Process-local cache for the single-row settings models (SMSSettings, PaymentSettings,
+MarketingSettings), on top of content.localcache.
+
+A save or delete bumps the model's version token after commit (receivers at the
+bottom of each app's models.py), so every process sharing the cache reloads on its
+next read; a copy is also reloaded once it is LOCAL_CACHE_TTL_SECONDS old, so a
+worker the token can't reach (LocMem cache, QuerySet.update()) still catches up.
+
+Instances are shared between threads: treat them as read-only and load a fresh
+row before editing.
+"""
+import threading
+
+from .localcache import VersionedLocalCache
+
+_caches = {}
+_lock = threading.Lock()
+
+
+def _version_key(model):
+    return f'singleton:{model._meta.label_lower}:version'
+
+
+def _cache_for(model):
+    label = model._meta.label_lower
+    local = _caches.get(label)
+    if local is None:
+        with _lock:
+            local = _caches.setdefault(label, VersionedLocalCache(
+                _version_key(model), lambda: model.objects.order_by('pk').first()
+            ))
+    return local
+
+
+def get_singleton(model, default=True):
+    """
+    The model's single row. When none exists returns an unsaved instance with the field
+    defaults (nothing is written), or None with default=False.
+    """
+    instance = _cache_for(model).get()
+    if instance is None and default:
+        return model(pk=1)
+    return instance
+
+
+def invalidate(model):
+    """Drop this process's copy now and tell every process to reload once the transaction commits."""
+    _cache_for(model).invalidate()
+
+
+def reset():
+    """Forget all cached rows in this process (tests)."""
+    for local in list(_caches.values()):
+        local.reset()
@@ -0,0 +1,265 @@
+"""
+Outbound SMS queue.
+
+Callers enqueue() a message and return immediately; the SMSMessage row is the
+outbox. Once the row is committed a local worker pool delivers it through one
+pooled requests.Session per gateway, with timeouts and a per-gateway rate limit
+(messages/second). Retryable failures (connection errors, timeouts, 429, 5xx)
+are re-queued with exponential backoff up to SMS_MAX_ATTEMPTS. The
+`send_sms` management command drains anything left due, e.g. after a restart.
+
+OTP messages carry a live login code, so their text is redacted as soon as the
+row is finished (Sent or Failed), and ones still queued once the code has
+expired (OTP_TTL_SECONDS) are failed and redacted instead of sent.
+
+Gateway protocol (bulksmsbd style, mirrored by tests/fake_sms_gateway.py):
+    GET {api_url}?api_key=..&type=text&number=017..,018..&senderid=..&message=..
+        -> 200 {"response_code": 202, ...} on success, any other response_code is a rejection
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import SMSMessage, SMSSettings
+from .singletons import get_singleton
+
+logger = logging.getLogger(__name__)
+
+GATEWAY_OK = 202
+REDACTED = '[redacted]'
+
+
+class SMSError(Exception):
+    """Delivery failed; `retryable` says whether another attempt could succeed."""
+
+    def __init__(self, message, retryable=True, status_code=None, response_text=''):
+        super().__init__(message)
+        self.retryable = retryable
+        self.status_code = status_code
+        self.response_text = response_text
+
+
+class RateLimiter:
+    """Token bucket: `rate` sends per second, bursts up to `rate`. acquire() blocks until a token is free."""
+
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self.tokens = self.rate
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class SMSGateway:
+    def __init__(self, api_url):
+        self.api_url = api_url
+        self.host = urlparse(api_url).netloc
+        self.timeout = getattr(settings, 'SMS_TIMEOUT', (3, 10))
+        rates = getattr(settings, 'SMS_RATE_LIMITS', {})
+        self.limiter = RateLimiter(rates.get(self.host, getattr(settings, 'SMS_DEFAULT_RATE_LIMIT', 10)))
+
+        pool_size = getattr(settings, 'SMS_WORKERS', 4)
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+    def send(self, sms_settings, phone_number, message):
+        """Returns (status_code, response_text); raises SMSError."""
+        return self.send_many(sms_settings, [phone_number], message)
+
+    def send_many(self, sms_settings, phone_numbers, message):
+        """One gateway call for the same text to several numbers (comma separated, as bulksmsbd accepts)."""
+        params = {
+            'api_key': sms_settings.api_key,
+            'type': 'text',
+            'number': ','.join(phone_numbers),
+            'senderid': sms_settings.sender_id if sms_settings.sender_id else '',
+            'message': message,
+        }
+        self.limiter.acquire()
+        try:
+            resp = self.session.get(self.api_url, params=params, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise SMSError(f'Gateway request failed: {e}')
+
+        text = resp.text[:1000]
+        if resp.status_code == 429 or resp.status_code >= 500:
+            raise SMSError(f'Gateway returned {resp.status_code}', status_code=resp.status_code, response_text=text)
+        if resp.status_code >= 400:
+            raise SMSError(f'Gateway rejected request ({resp.status_code})', retryable=False, status_code=resp.status_code, response_text=text)
+        try:
+            code = resp.json().get('response_code', GATEWAY_OK)
+        except (ValueError, AttributeError):
+            code = GATEWAY_OK # Plain-text gateways: a 2xx is all we get
+        if str(code) != str(GATEWAY_OK):
+            raise SMSError(f'Gateway rejected message (response_code {code})', retryable=False, status_code=resp.status_code, response_text=text)
+        return resp.status_code, text
+
+
+_gateways = {}
+_gateways_lock = threading.Lock()
+
+
+def get_gateway(api_url):
+    with _gateways_lock:
+        if api_url not in _gateways:
+            _gateways[api_url] = SMSGateway(api_url)
+        return _gateways[api_url]
+
+
+def reset_gateways():
+    """Drop cached gateways (and their sessions), e.g. after changing SMS settings in tests."""
+    with _gateways_lock:
+        for gateway in _gateways.values():
+            gateway.session.close()
+        _gateways.clear()
+
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'SMS_WORKERS', 4),
+            thread_name_prefix='sms'
+        )
+    return _executor
+
+
+def enqueue(phone_number, message, kind='notification'):
+    """Store the message in the outbox and hand it to a worker after commit."""
+    sms = SMSMessage.objects.create(phone_number=phone_number, message=message, kind=kind)
+    transaction.on_commit(lambda: dispatch(sms.id))
+    return sms
+
+
+def _redact(sms):
+    """Drop the login code from a finished OTP message."""
+    if sms.kind == 'otp':
+        sms.message = REDACTED
+
+
+def dispatch(message_id):
+    if getattr(settings, 'SMS_SYNC', False):
+        deliver(message_id)
+    else:
+        get_executor().submit(deliver, message_id)
+
+
+def _schedule_retry(message_id, delay):
+    if getattr(settings, 'SMS_SYNC', False):
+        return # Left for the send_sms command
+    timer = threading.Timer(delay, dispatch, args=[message_id])
+    timer.daemon = True
+    timer.start()
+
+
+def deliver(message_id):
+    """Make one delivery attempt. Returns the updated SMSMessage, or None if another worker has it."""
+    close_old_connections()
+    try:
+        now = timezone.now()
+        # Claim the message; a row that is already being sent or not yet due is left alone
+        claimed = SMSMessage.objects.filter(id=message_id, status='Queued', next_attempt_at__lte=now).update(
+            status='Sending', claimed_at=now
+        )
+        if not claimed:
+            return None
+        sms = SMSMessage.objects.get(id=message_id)
+        sms.attempts += 1
+
+        sms_settings = get_singleton(SMSSettings, default=False)
+        if not sms_settings or not sms_settings.is_active:
+            sms.status = 'Failed'
+            sms.error = 'SMS gateway is not active'
+            _redact(sms)
+            sms.save()
+            return sms
+
+        gateway = get_gateway(sms_settings.api_url)
+        sms.gateway = gateway.host
+        try:
+            sms.response_code, sms.response_text = gateway.send(sms_settings, sms.phone_number, sms.message)
+            sms.status = 'Sent'
+            sms.sent_at = timezone.now()
+            sms.error = ''
+        except SMSError as e:
+            sms.response_code, sms.response_text, sms.error = e.status_code, e.response_text, str(e)
+            max_attempts = getattr(settings, 'SMS_MAX_ATTEMPTS', 4)
+            # The admin test button reports the first result instead of retrying behind the admin's back
+            if e.retryable and sms.kind != 'test' and sms.attempts < max_attempts:
+                delay = getattr(settings, 'SMS_RETRY_BACKOFF', 2) * (2 ** (sms.attempts - 1))
+                sms.status = 'Queued'
+                sms.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+                sms.save()
+                _schedule_retry(sms.id, delay)
+                return sms
+            sms.status = 'Failed'
+        _redact(sms)
+        sms.save()
+        return sms
+    except Exception:
+        logger.exception('Sending SMS %s failed', message_id)
+        # Don't leave the row stuck in Sending; process_outbox will pick it up again
+        SMSMessage.objects.filter(id=message_id, status='Sending').update(status='Queued')
+        return None
+    finally:
+        close_old_connections()
+
+
+def send_now(phone_number, message, kind='test'):
+    """Enqueue and deliver in the calling thread (admin test button). Returns the SMSMessage."""
+    sms = SMSMessage.objects.create(phone_number=phone_number, message=message, kind=kind)
+    return deliver(sms.id) or SMSMessage.objects.get(id=sms.id)
+
+
+def process_outbox(limit=500, wait=True):
+    """
+    Deliver due messages on the worker pool; messages stuck in Sending longer than
+    SMS_SENDING_TIMEOUT_SECONDS (worker died) are re-queued first and queued OTPs
+    whose code has expired are dropped. Returns the number dispatched.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=getattr(settings, 'SMS_SENDING_TIMEOUT_SECONDS', 300))
+    SMSMessage.objects.filter(status='Sending', claimed_at__lt=stale).update(status='Queued')
+    # A code that has expired is no use to anyone; don't send it, and don't keep it
+    otp_expired = now - timedelta(seconds=getattr(settings, 'OTP_TTL_SECONDS', 300))
+    SMSMessage.objects.filter(kind='otp', status='Queued', created_at__lt=otp_expired).update(
+        status='Failed', error='OTP expired before delivery', message=REDACTED
+    )
+
+    due = list(
+        SMSMessage.objects.filter(status='Queued', next_attempt_at__lte=now)
+        .order_by('next_attempt_at').values_list('id', flat=True)[:limit]
+    )
+    if getattr(settings, 'SMS_SYNC', False):
+        for message_id in due:
+            deliver(message_id)
+        return len(due)
+    futures = [get_executor().submit(deliver, message_id) for message_id in due]
+    if wait:
+        for future in futures:
+            future.result()
+    return len(due)
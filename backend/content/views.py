@@ -49,6 +49,7 @@ class ThemeViewSet(viewsets.ModelViewSet):
 
 from .models import SMSSettings
 from .serializers import SMSSettingsSerializer
+from .singletons import get_singleton
 
 class SMSConfigViewSet(viewsets.ModelViewSet):
     queryset = SMSSettings.objects.all()
@@ -78,23 +79,15 @@ class SMSConfigViewSet(viewsets.ModelViewSet):
         if not phone_number:
             return Response({'error': 'Phone number required'}, status=400)
             
-        settings = SMSSettings.objects.first()
+        settings = get_singleton(SMSSettings, default=False)
         if not settings or not settings.is_active:
              return Response({'error': 'SMS Settings not active or configured'}, status=400)
              
-        import requests
-        try:
-            params = {
-                'api_key': settings.api_key,
-                'type': 'text',
-                'number': phone_number,
-                'senderid': settings.sender_id if settings.sender_id else '',
-                'message': 'Test SMS from Admin Panel'
-            }
-            response = requests.get(settings.api_url, params=params)
-            return Response({
-                'status_code': response.status_code,
-                'response_text': response.text
-            })
-        except Exception as e:
-            return Response({'error': str(e)}, status=500)
+        from .sms import send_now
+        message = send_now(phone_number, 'Test SMS from Admin Panel')
+        if message.status != 'Sent' and message.response_code is None:
+            return Response({'error': message.error}, status=500)
+        return Response({
+            'status_code': message.response_code,
+            'response_text': message.response_text
+        })
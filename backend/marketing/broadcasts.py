@@ -0,0 +1,239 @@
+"""
+Bulk SMS broadcasts.
+
+A run has two resumable phases:
+1. Recipients: the audience queryset is streamed in chunks into SMSBroadcastRecipient
+   (the unique (broadcast, phone) constraint de-duplicates and makes re-runs safe).
+2. Sending: Pending recipients are read in id order, grouped into batches of
+   SMS_BROADCAST_BATCH_SIZE numbers per gateway call and sent from a small thread pool,
+   throttled by SMS_BROADCAST_RATE_LIMIT (calls/second, on top of the gateway's own limit
+   so OTPs keep headroom). Each batch's outcome is written back per recipient.
+
+Each claim of the broadcast gets a new run_token, and a runner stops at the next
+round once its token is replaced (or the broadcast is paused), so pause + resume
+never leaves two runners going. Recipients are claimed with a conditional
+Pending -> Sending update tagged with the run's token, and only rows actually
+claimed are texted, so two runners can't send the same batch.
+
+A worker that dies leaves the broadcast Running with a stale heartbeat; the next
+run_broadcast (send_broadcasts command) picks it up. Its Sending rows are marked
+Failed once their claim is older than SMS_BROADCAST_STALE_SECONDS rather than
+re-sent: marketing texts are sent at most once. Younger Sending rows may belong
+to a runner that is still finishing its round, so they are waited for.
+"""
+import logging
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from content.models import SMSSettings
+from content.singletons import get_singleton
+from content.sms import RateLimiter, SMSError, get_gateway
+from orders.models import CustomerStats
+from .models import SMSBroadcast, SMSBroadcastRecipient
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+RECIPIENT_CHUNK_SIZE = 2000
+SENDING_POLL_SECONDS = 1 # While only other runs' calls are outstanding
+
+
+def interested_audience(params):
+    """Customers who told a follow-up call they want to hear about new products."""
+    return User.objects.filter(followups__is_interested_in_new_products=True).values_list('id', 'phone_number')
+
+
+def winback_audience(params):
+    """Customers whose last delivered order is older than `days` (default 90)."""
+    cutoff = timezone.now() - timedelta(days=int(params.get('days', 90)))
+    return CustomerStats.objects.filter(last_delivered_order_at__lt=cutoff).values_list('customer_id', 'customer__phone_number')
+
+
+def customers_audience(params):
+    """Everyone with at least one delivered order."""
+    return CustomerStats.objects.filter(last_delivered_order_at__isnull=False).values_list('customer_id', 'customer__phone_number')
+
+
+AUDIENCES = {
+    'interested': interested_audience,
+    'winback': winback_audience,
+    'customers': customers_audience,
+}
+
+
+def build_recipients(broadcast):
+    rows = AUDIENCES[broadcast.audience](broadcast.params or {})
+    chunk = []
+    for customer_id, phone_number in rows.iterator(chunk_size=RECIPIENT_CHUNK_SIZE):
+        phone_number = (phone_number or '').strip()
+        if not phone_number:
+            continue
+        chunk.append(SMSBroadcastRecipient(broadcast=broadcast, customer_id=customer_id, phone_number=phone_number))
+        if len(chunk) >= RECIPIENT_CHUNK_SIZE:
+            SMSBroadcastRecipient.objects.bulk_create(chunk, ignore_conflicts=True)
+            chunk = []
+    if chunk:
+        SMSBroadcastRecipient.objects.bulk_create(chunk, ignore_conflicts=True)
+
+    broadcast.recipient_count = broadcast.recipients.count()
+    broadcast.recipients_ready = True
+    broadcast.save(update_fields=['recipient_count', 'recipients_ready'])
+
+
+def _send_batch(gateway, sms_settings, limiter, batch, message):
+    """Returns (recipient ids, error or ''), retrying gateway hiccups with backoff."""
+    ids = [pk for pk, _ in batch]
+    numbers = [number for _, number in batch]
+    max_attempts = getattr(settings, 'SMS_MAX_ATTEMPTS', 4)
+    backoff = getattr(settings, 'SMS_RETRY_BACKOFF', 2)
+    for attempt in range(1, max_attempts + 1):
+        limiter.acquire()
+        try:
+            gateway.send_many(sms_settings, numbers, message)
+            return ids, ''
+        except SMSError as e:
+            if not e.retryable or attempt == max_attempts:
+                return ids, str(e)[:255]
+            time.sleep(backoff * (2 ** (attempt - 1)))
+
+
+def _stale_before():
+    return timezone.now() - timedelta(seconds=getattr(settings, 'SMS_BROADCAST_STALE_SECONDS', 300))
+
+
+def _claim(broadcast_id):
+    """Take the broadcast for a new run; returns the run's token, or None if it isn't ours to run."""
+    token = uuid.uuid4().hex
+    claimed = SMSBroadcast.objects.filter(
+        Q(status='Queued') | Q(status='Running', heartbeat_at__lt=_stale_before()), id=broadcast_id
+    ).update(status='Running', heartbeat_at=timezone.now(), run_token=token)
+    return token if claimed else None
+
+
+def run_broadcast(broadcast_id):
+    """Run (or resume) a broadcast until it completes, is paused or is taken over by a newer run."""
+    close_old_connections()
+    try:
+        token = _claim(broadcast_id)
+        if not token:
+            return
+        broadcast = SMSBroadcast.objects.get(id=broadcast_id)
+        if not broadcast.started_at:
+            broadcast.started_at = timezone.now()
+            broadcast.save(update_fields=['started_at'])
+
+        try:
+            _run(broadcast, token)
+        except Exception as e:
+            logger.exception('Broadcast %s failed', broadcast.id)
+            SMSBroadcast.objects.filter(id=broadcast.id, run_token=token).update(
+                status='Failed', error=str(e), finished_at=timezone.now()
+            )
+    finally:
+        close_old_connections()
+
+
+def _fail_interrupted(broadcast):
+    """Sending rows whose claim went stale: delivery unknown, don't text them twice."""
+    interrupted = broadcast.recipients.filter(
+        Q(claimed_at__lt=_stale_before()) | Q(claimed_at__isnull=True), status='Sending'
+    ).update(status='Failed', error='Interrupted, delivery unknown')
+    if interrupted:
+        SMSBroadcast.objects.filter(id=broadcast.id).update(failed_count=F('failed_count') + interrupted)
+
+
+def _run(broadcast, token):
+    sms_settings = get_singleton(SMSSettings, default=False)
+    if not sms_settings or not sms_settings.is_active:
+        raise SMSError('SMS gateway is not active', retryable=False)
+    gateway = get_gateway(sms_settings.api_url)
+
+    if not broadcast.recipients_ready:
+        build_recipients(broadcast)
+
+    batch_size = max(1, getattr(settings, 'SMS_BROADCAST_BATCH_SIZE', 100))
+    workers = getattr(settings, 'SMS_BROADCAST_WORKERS', 4)
+    limiter = RateLimiter(getattr(settings, 'SMS_BROADCAST_RATE_LIMIT', 2))
+    pending = broadcast.recipients.filter(status='Pending').order_by('id')
+    ours = SMSBroadcastRecipient.objects.filter(broadcast=broadcast, status='Sending', claim_token=token)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sms-broadcast') as pool:
+        while True:
+            # Stop between rounds if an admin paused the broadcast or a newer run took it over
+            alive = SMSBroadcast.objects.filter(id=broadcast.id, status='Running', run_token=token)
+            if alive.update(heartbeat_at=timezone.now()) == 0:
+                return
+            _fail_interrupted(broadcast)
+
+            ids = list(pending.values_list('id', flat=True)[:batch_size * workers])
+            if not ids:
+                if not broadcast.recipients.filter(status='Sending').exists():
+                    break
+                # Another run is still finishing its calls (or a dead one's go stale)
+                time.sleep(SENDING_POLL_SECONDS)
+                continue
+            SMSBroadcastRecipient.objects.filter(id__in=ids, status='Pending').update(
+                status='Sending', claim_token=token, claimed_at=timezone.now()
+            )
+            # Only what this run actually claimed; rows another run got first are theirs
+            rows = list(ours.filter(id__in=ids).order_by('id').values_list('id', 'phone_number'))
+            if not rows:
+                continue
+
+            batches = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+            results = pool.map(lambda batch: _send_batch(gateway, sms_settings, limiter, batch, broadcast.message), batches)
+
+            sent = failed = 0
+            now = timezone.now()
+            with transaction.atomic():
+                for ids, error in results:
+                    if error:
+                        failed += ours.filter(id__in=ids).update(status='Failed', error=error)
+                    else:
+                        sent += ours.filter(id__in=ids).update(status='Sent', sent_at=now)
+                SMSBroadcast.objects.filter(id=broadcast.id).update(
+                    sent_count=F('sent_count') + sent, failed_count=F('failed_count') + failed
+                )
+
+    SMSBroadcast.objects.filter(id=broadcast.id, status='Running', run_token=token).update(
+        status='Completed', finished_at=timezone.now()
+    )
+
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        # Broadcasts are long-running; one at a time per process keeps gateway load predictable
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sms-broadcast-run')
+    return _executor
+
+
+def dispatch(broadcast_id):
+    if getattr(settings, 'SMS_SYNC', False):
+        run_broadcast(broadcast_id)
+    else:
+        get_executor().submit(run_broadcast, broadcast_id)
+
+
+def start(broadcast):
+    transaction.on_commit(lambda: dispatch(broadcast.id))
+
+
+def resume_stalled():
+    """Run broadcasts that are Queued or Running with a dead worker, one after another. Returns their ids."""
+    ids = list(SMSBroadcast.objects.filter(
+        Q(status='Queued') | Q(status='Running', heartbeat_at__lt=_stale_before())
+    ).values_list('id', flat=True))
+    for broadcast_id in ids:
+        run_broadcast(broadcast_id)
+    return ids
@@ -0,0 +1,191 @@
+"""
+Coupon lookup and redemption.
+
+Codes are matched case- and whitespace-insensitively: normalize() is applied on
+save (Coupon.save) and on every lookup. Validation reads a process-local table
+of the active coupons keyed by normalized code (content.localcache: reloaded
+after a coupon save or delete, and at least every LOCAL_CACHE_TTL_SECONDS), so a
+warm validation, single or a whole cart's worth, costs one cache get and no queries.
+
+The table's used_count is a snapshot and only advisory. redeem() is the
+authority: a conditional UPDATE .. SET used_count = used_count + 1 that only
+matches while the coupon is active, unexpired and under its limit, so
+concurrent orders can never take more uses than usage_limit. Call it inside the
+order's transaction so a failed order gives the use back. Afterwards only that
+coupon's entry is refreshed in this process; the rest of the table stays.
+"""
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from django.db.models import F, Q
+from django.utils import timezone
+
+from content.localcache import VersionedLocalCache
+from .models import Coupon
+
+MAX_BATCH = 50 # Codes per validate_many request
+
+CouponEntry = namedtuple('CouponEntry', [
+    'id', 'code', 'discount_type', 'value', 'min_purchase', 'usage_limit', 'used_count', 'expiry_date',
+])
+
+
+class CouponError(Exception):
+    pass
+
+
+class CouponNotFound(CouponError):
+    pass
+
+
+def normalize(code):
+    return str(code or '').strip().upper()
+
+
+def _load():
+    table = {}
+    rows = Coupon.objects.filter(is_active=True).order_by('id').values_list(*CouponEntry._fields)
+    for row in rows:
+        entry = CouponEntry(*row)
+        # Codes saved before normalization could collide; the oldest wins
+        table.setdefault(normalize(entry.code), entry)
+    return table
+
+
+_table = VersionedLocalCache('coupons:version', _load)
+
+
+def table():
+    """{normalized code: CouponEntry} for every active coupon, expired ones included (for the error message)."""
+    return _table.get()
+
+
+def invalidate():
+    """Drop this process's table now and tell every process to reload once the transaction commits."""
+    _table.invalidate()
+
+
+def reset():
+    """Forget the table in this process (tests)."""
+    _table.reset()
+
+
+def _refresh(coupon):
+    """Re-read one coupon into this process's table (dropped if no longer active). Returns the new entry or None."""
+    row = Coupon.objects.filter(pk=coupon.id, is_active=True).values_list(*CouponEntry._fields).first()
+    entry = CouponEntry(*row) if row else None
+    loaded = _table.peek()
+    if loaded is not None:
+        # Single-key writes: readers in other threads see the old or the new entry, never a partial table
+        if entry is None:
+            loaded.pop(normalize(coupon.code), None)
+        else:
+            loaded[normalize(entry.code)] = entry
+    return entry
+
+
+def parse_subtotal(value):
+    """Decimal cart subtotal from request data, None when not given."""
+    if value in (None, ''):
+        return None
+    try:
+        subtotal = Decimal(str(value))
+    except InvalidOperation:
+        raise CouponError('Invalid subtotal')
+    if not subtotal.is_finite() or subtotal < 0:
+        raise CouponError('Invalid subtotal')
+    return subtotal
+
+
+def discount(coupon, subtotal):
+    """Amount taken off `subtotal`, never more than the subtotal itself."""
+    subtotal = Decimal(str(subtotal))
+    if coupon.discount_type == 'percentage':
+        amount = (subtotal * coupon.value / 100).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    else:
+        amount = coupon.value
+    return max(Decimal('0'), min(amount, subtotal))
+
+
+def check(coupon, subtotal=None, today=None):
+    """Raise CouponError if the coupon can't be used now (on a cart of `subtotal`, when given)."""
+    today = today or timezone.now().date()
+    if coupon.expiry_date < today:
+        raise CouponError('Coupon expired')
+    if coupon.usage_limit > 0 and coupon.used_count >= coupon.usage_limit:
+        raise CouponError('Coupon usage limit reached')
+    if subtotal is not None and coupon.min_purchase > 0 and Decimal(str(subtotal)) < coupon.min_purchase:
+        raise CouponError(f'Minimum purchase of Tk {coupon.min_purchase} required.')
+
+
+def lookup(code, subtotal=None):
+    """The usable CouponEntry for `code`; raises CouponNotFound / CouponError."""
+    coupon = table().get(normalize(code))
+    if coupon is None:
+        raise CouponNotFound('Invalid coupon code')
+    check(coupon, subtotal)
+    return coupon
+
+
+def describe(coupon, subtotal=None):
+    result = {
+        'valid': True,
+        'code': coupon.code,
+        'type': coupon.discount_type,
+        'value': coupon.value,
+        'min_purchase': coupon.min_purchase,
+    }
+    if subtotal is not None:
+        result['discount'] = discount(coupon, subtotal)
+    return result
+
+
+def validate_many(codes, subtotal=None):
+    """
+    One result per distinct normalized code, in request order, for cart previews:
+    describe() output when usable, else {'valid': False, 'code', 'error'}. Served from the table.
+    """
+    coupons = table()
+    today = timezone.now().date()
+    results = []
+    seen = set()
+    for code in codes:
+        key = normalize(code)
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        coupon = coupons.get(key)
+        try:
+            if coupon is None:
+                raise CouponNotFound('Invalid coupon code')
+            check(coupon, subtotal, today)
+        except CouponError as e:
+            results.append({'valid': False, 'code': key, 'error': str(e)})
+        else:
+            results.append(describe(coupon, subtotal))
+    return results
+
+
+def redeem(code, subtotal=None):
+    """
+    Take one use of the coupon and return (entry, discount on `subtotal`). Must run in the
+    order's transaction. Raises CouponNotFound / CouponError when it can't be used.
+    """
+    coupon = lookup(code, subtotal)
+    today = timezone.now().date()
+    taken = Coupon.objects.filter(
+        Q(usage_limit=0) | Q(used_count__lt=F('usage_limit')),
+        pk=coupon.id, is_active=True, expiry_date__gte=today,
+    ).update(used_count=F('used_count') + 1)
+
+    if not taken:
+        # Our snapshot was stale: say why from the row itself
+        row = _refresh(coupon)
+        if row is None:
+            raise CouponNotFound('Invalid coupon code')
+        check(row, subtotal, today)
+        raise CouponError('Coupon usage limit reached')
+    if coupon.usage_limit > 0:
+        # update() sends no signals; keep this coupon's count current so previews see the limit approaching
+        _refresh(coupon)
+    return coupon, discount(coupon, subtotal) if subtotal is not None else Decimal('0')
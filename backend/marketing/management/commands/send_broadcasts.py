@@ -0,0 +1,18 @@
+import time
+from django.core.management.base import BaseCommand
+from marketing.broadcasts import resume_stalled
+
+class Command(BaseCommand):
+    help = 'Runs queued SMS broadcasts and resumes any whose worker died mid-run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', type=int, default=0, help='Keep running, sleeping this many seconds between runs')
+
+    def handle(self, *args, **options):
+        while True:
+            ids = resume_stalled()
+            self.stdout.write(f"Ran {len(ids)} broadcasts")
+
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
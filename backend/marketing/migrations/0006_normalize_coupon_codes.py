@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+def normalize_codes(apps, schema_editor):
+    Coupon = apps.get_model('marketing', 'Coupon')
+    taken = set(Coupon.objects.values_list('code', flat=True))
+    for coupon in Coupon.objects.order_by('id'):
+        code = coupon.code.strip().upper()
+        if code == coupon.code:
+            continue
+        if code in taken:
+            # Another coupon already has this code; leave it to be renamed by hand
+            continue
+        taken.discard(coupon.code)
+        taken.add(code)
+        Coupon.objects.filter(pk=coupon.pk).update(code=code)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketing', '0005_smsbroadcast'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_codes, migrations.RunPython.noop),
+    ]
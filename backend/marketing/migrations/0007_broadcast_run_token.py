@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketing', '0006_normalize_coupon_codes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='smsbroadcast',
+            name='run_token',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='smsbroadcastrecipient',
+            name='claim_token',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='smsbroadcastrecipient',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
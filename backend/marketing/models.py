@@ -1,4 +1,7 @@
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.conf import settings
 from store.models import Product
 
 class Coupon(models.Model):
@@ -18,6 +21,11 @@ class Coupon(models.Model):
     expiry_date = models.DateField()
     is_active = models.BooleanField(default=True)
 
+    def save(self, *args, **kwargs):
+        # Stored upper-case and trimmed, the form every lookup uses (marketing.coupons.normalize)
+        self.code = (self.code or '').strip().upper()
+        return super().save(*args, **kwargs)
+
     def __str__(self):
         return self.code
 
@@ -65,3 +73,79 @@ class MarketingSettings(models.Model):
 
     def __str__(self):
         return "Marketing Settings"
+
+class SMSBroadcast(models.Model):
+    """
+    One text sent to an audience (see marketing.broadcasts.AUDIENCES). Recipients are
+    materialized into SMSBroadcastRecipient first, so a run can resume where it stopped.
+    """
+    STATUS_CHOICES = (
+        ('Queued', 'Queued'),
+        ('Running', 'Running'),
+        ('Paused', 'Paused'),
+        ('Completed', 'Completed'),
+        ('Failed', 'Failed'),
+    )
+
+    name = models.CharField(max_length=255)
+    message = models.TextField()
+    audience = models.CharField(max_length=50) # interested, winback, customers
+    params = models.JSONField(default=dict, blank=True) # Audience options, e.g. {'days': 90}
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Queued')
+    recipients_ready = models.BooleanField(default=False) # Audience fully written to the recipient table
+    recipient_count = models.IntegerField(default=0)
+    sent_count = models.IntegerField(default=0)
+    failed_count = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='sms_broadcasts')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True) # Bumped by the running worker; stale = worker died
+    run_token = models.CharField(max_length=32, blank=True) # Set per claim; a runner whose token was replaced stops
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.name} - {self.status}"
+
+class SMSBroadcastRecipient(models.Model):
+    STATUS_CHOICES = (
+        ('Pending', 'Pending'),
+        ('Sending', 'Sending'),
+        ('Sent', 'Sent'),
+        ('Failed', 'Failed'),
+    )
+
+    broadcast = models.ForeignKey(SMSBroadcast, on_delete=models.CASCADE, related_name='recipients')
+    customer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    phone_number = models.CharField(max_length=20)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
+    error = models.CharField(max_length=255, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    # The run that moved it to Sending, and when; Sending rows older than SMS_BROADCAST_STALE_SECONDS were interrupted
+    claim_token = models.CharField(max_length=32, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # One text per number per broadcast, however many times the audience lists it
+        unique_together = ('broadcast', 'phone_number')
+        indexes = [
+            models.Index(fields=['broadcast', 'status', 'id'], name='broadcast_recipient_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.phone_number} - {self.status}"
+
+@receiver(post_save, sender=MarketingSettings)
+@receiver(post_delete, sender=MarketingSettings)
+def invalidate_marketing_settings(sender, **kwargs):
+    from content.singletons import invalidate
+    invalidate(sender)
+
+@receiver(post_save, sender=Coupon)
+@receiver(post_delete, sender=Coupon)
+def invalidate_coupons(sender, **kwargs):
+    from .coupons import invalidate
+    invalidate()
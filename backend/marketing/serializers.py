@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Coupon, Campaign, MarketingSettings
+from .models import Coupon, Campaign, MarketingSettings, SMSBroadcast, SMSBroadcastRecipient
 
 class CouponSerializer(serializers.ModelSerializer):
     class Meta:
@@ -28,3 +28,23 @@ class MarketingSettingsSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Pixel ID length seems invalid (expected 10-25 digits).")
             
         return value
+
+class SMSBroadcastSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SMSBroadcast
+        exclude = ['run_token']
+        read_only_fields = [
+            'status', 'recipients_ready', 'recipient_count', 'sent_count', 'failed_count', 'error',
+            'created_by', 'created_at', 'started_at', 'heartbeat_at', 'finished_at'
+        ]
+
+    def validate_audience(self, value):
+        from .broadcasts import AUDIENCES
+        if value not in AUDIENCES:
+            raise serializers.ValidationError(f"Unknown audience. Choose one of: {', '.join(sorted(AUDIENCES))}.")
+        return value
+
+class SMSBroadcastRecipientSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SMSBroadcastRecipient
+        fields = ['id', 'customer', 'phone_number', 'status', 'error', 'sent_at']
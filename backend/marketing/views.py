@@ -1,17 +1,26 @@
 from rest_framework import viewsets, permissions
-from .models import Coupon, Campaign, CampaignProduct, MarketingSettings
+from .models import Coupon, Campaign, CampaignProduct, MarketingSettings, SMSBroadcast
 from rest_framework import serializers
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.utils import timezone
+from orders.views import StandardResultsSetPagination
+from content.singletons import get_singleton
+from . import coupons
 from rest_framework import status
-from .serializers import MarketingSettingsSerializer
+from .serializers import MarketingSettingsSerializer, SMSBroadcastSerializer, SMSBroadcastRecipientSerializer
 
 class CouponSerializer(serializers.ModelSerializer):
     class Meta:
         model = Coupon
         fields = '__all__'
 
+    def to_internal_value(self, data):
+        # Normalize before the unique check, so 'save10' clashes with an existing 'SAVE10'
+        if isinstance(data, dict) and isinstance(data.get('code'), str):
+            data = {**data, 'code': coupons.normalize(data['code'])}
+        return super().to_internal_value(data)
+
 class CampaignProductSerializer(serializers.ModelSerializer):
     product_name = serializers.ReadOnlyField(source='product.name')
     product_image = serializers.ReadOnlyField(source='product.images') # You might need a serializer method field for image URL
@@ -71,28 +80,29 @@ class CouponViewSet(viewsets.ModelViewSet):
         code = request.data.get('code')
         if not code:
             return Response({'error': 'Code is required'}, status=status.HTTP_400_BAD_REQUEST)
-        
+
         try:
-            coupon = Coupon.objects.get(code=code.upper(), is_active=True)
-            
-            # Check if expired
-            if coupon.expiry_date < timezone.now().date():
-                return Response({'error': 'Coupon expired'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Check usage limit
-            if coupon.usage_limit > 0 and coupon.used_count >= coupon.usage_limit:
-                return Response({'error': 'Coupon usage limit reached'}, status=status.HTTP_400_BAD_REQUEST)
-                
-            return Response({
-                'valid': True,
-                'code': coupon.code,
-                'type': coupon.discount_type,
-                'value': coupon.value,
-                'min_purchase': coupon.min_purchase
-            })
-            
-        except Coupon.DoesNotExist:
-            return Response({'error': 'Invalid coupon code'}, status=status.HTTP_404_NOT_FOUND)
+            subtotal = coupons.parse_subtotal(request.data.get('subtotal'))
+            coupon = coupons.lookup(code, subtotal)
+        except coupons.CouponNotFound as e:
+            return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
+        except coupons.CouponError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(coupons.describe(coupon, subtotal))
+
+    @action(detail=False, methods=['post'], url_path='validate-many', permission_classes=[permissions.AllowAny])
+    def validate_many(self, request):
+        """Cart preview: {codes: [...], subtotal?} -> one result per distinct code, from the cached table."""
+        codes = request.data.get('codes')
+        if not isinstance(codes, list) or not codes:
+            return Response({'error': 'codes must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(codes) > coupons.MAX_BATCH:
+            return Response({'error': f'At most {coupons.MAX_BATCH} codes at once'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            subtotal = coupons.parse_subtotal(request.data.get('subtotal'))
+        except coupons.CouponError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'results': coupons.validate_many(codes, subtotal)})
 
 class CampaignViewSet(viewsets.ModelViewSet):
     queryset = Campaign.objects.all()
@@ -110,6 +120,50 @@ class MarketingSettingsViewSet(viewsets.ModelViewSet):
         return [permission() for permission in permission_classes]
 
     def list(self, request, *args, **kwargs):
-        settings, created = MarketingSettings.objects.get_or_create(id=1)
-        serializer = self.get_serializer(settings)
+        serializer = self.get_serializer(get_singleton(MarketingSettings))
         return Response(serializer.data)
+
+class SMSBroadcastViewSet(viewsets.ModelViewSet):
+    """
+    Bulk SMS to an audience. Creating a broadcast starts it in the background.
+    """
+    queryset = SMSBroadcast.objects.all()
+    serializer_class = SMSBroadcastSerializer
+    permission_classes = [permissions.IsAdminUser]
+    pagination_class = StandardResultsSetPagination
+    http_method_names = ['get', 'post', 'delete', 'head', 'options']
+
+    def perform_create(self, serializer):
+        from . import broadcasts
+        broadcast = serializer.save(created_by=self.request.user)
+        broadcasts.start(broadcast)
+
+    @action(detail=True, methods=['post'])
+    def pause(self, request, pk=None):
+        broadcast = self.get_object()
+        if not SMSBroadcast.objects.filter(pk=broadcast.pk, status__in=['Queued', 'Running']).update(status='Paused'):
+            return Response({'error': f'Cannot pause a {broadcast.status} broadcast'}, status=status.HTTP_400_BAD_REQUEST)
+        broadcast.refresh_from_db()
+        return Response(self.get_serializer(broadcast).data)
+
+    @action(detail=True, methods=['post'])
+    def resume(self, request, pk=None):
+        from . import broadcasts
+        broadcast = self.get_object()
+        # Failed runs (e.g. gateway switched off) can be resumed too; sent recipients are skipped
+        if not SMSBroadcast.objects.filter(pk=broadcast.pk, status__in=['Paused', 'Failed']).update(status='Queued', error=''):
+            return Response({'error': f'Cannot resume a {broadcast.status} broadcast'}, status=status.HTTP_400_BAD_REQUEST)
+        broadcasts.start(broadcast)
+        broadcast.refresh_from_db()
+        return Response(self.get_serializer(broadcast).data)
+
+    @action(detail=True, methods=['get'])
+    def recipients(self, request, pk=None):
+        broadcast = self.get_object()
+        queryset = broadcast.recipients.order_by('id')
+        if request.query_params.get('status'):
+            queryset = queryset.filter(status=request.query_params['status'])
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(SMSBroadcastRecipientSerializer(page, many=True).data)
+        return Response(SMSBroadcastRecipientSerializer(queryset, many=True).data)
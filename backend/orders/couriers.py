@@ -0,0 +1,289 @@
+"""
+Courier adapter layer.
+
+Each courier (Pathao, Steadfast, RedX) is an adapter looked up by name through the registry.
+Adapters configured in settings.COURIERS talk HTTP through one pooled session per courier, with
+timeouts, retry with backoff and a circuit breaker so a down courier fails fast instead of
+holding API workers. Unconfigured couriers (and 'Manual') fall back to the local simulation.
+
+HTTP protocol (mirrored by tests/fake_courier.py):
+    POST {base_url}/shipments            {"orders": [{merchant_order_id, recipient_name, recipient_phone, address, amount}]}
+        -> {"shipments": [{merchant_order_id, tracking_number, label_url, status} | {merchant_order_id, error}]}
+    GET  {base_url}/tracking?tracking_numbers=a,b   -> {"statuses": {"a": "in_transit", ...}}
+    POST {base_url}/shipments/<tracking_number>/cancel
+"""
+import random
+from abc import ABC, abstractmethod
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+
+class CourierError(Exception):
+    pass
+
+
+class CourierUnavailable(CourierError):
+    """Raised without calling out while the circuit breaker is open."""
+
+
+# Courier status -> what it means for our order
+STATUS_MAP = {
+    'pickup_pending': 'Shipped',
+    'picked_up': 'Shipped',
+    'in_transit': 'Shipped',
+    'delivered': 'Delivered',
+    'returned': 'Returned',
+    'return_in_transit': 'Returned',
+    'cancelled': 'Returned',
+    'lost': 'Lost',
+}
+
+
+class CircuitBreaker:
+    """
+    Closed until `threshold` consecutive failures, then open (calls refused) for `reset_after`
+    seconds, then half-open: exactly one trial call goes through and its outcome closes or
+    re-opens the breaker. A trial that never reports back frees the slot after another `reset_after`.
+    """
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, threshold=5, reset_after=30):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.state = self.CLOSED
+        self.opened_at = None # When it opened, or when the half-open trial started
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_after:
+                return False
+            # Open long enough (or the last trial went missing): this caller is the trial
+            self.state = self.HALF_OPEN
+            self.opened_at = time.monotonic()
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.state = self.CLOSED
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class CourierAdapter(ABC):
+    name = 'manual'
+    tracking_prefix = 'TRK'
+    batch_size = 50
+
+    def __init__(self, config=None):
+        self.config = config or {}
+
+    @abstractmethod
+    def create_shipments(self, orders):
+        """Returns {order_id: {'tracking_number', 'label_url', 'status'} or {'error': message}}"""
+
+    def create_shipment(self, order):
+        result = self.create_shipments([order])[order.id]
+        if 'error' in result:
+            raise CourierError(result['error'])
+        return result
+
+    @abstractmethod
+    def track(self, tracking_numbers):
+        """Returns {tracking_number: mapped status ('Shipped', 'Delivered', 'Returned', 'Lost')}"""
+
+    @abstractmethod
+    def cancel_shipment(self, tracking_number):
+        """Releases the parcel at the courier; returns True."""
+
+
+class SimulatedCourierAdapter(CourierAdapter):
+    """Local stand-in used when a courier has no API credentials configured."""
+
+    def create_shipments(self, orders):
+        results = {}
+        for order in orders:
+            # Generate a realistic looking tracking number
+            tracking_number = f"{self.tracking_prefix}-{random.randint(100000, 999999)}-{order.id}"
+            results[order.id] = {
+                'tracking_number': tracking_number,
+                # Simulate a label URL (would be a PDF from the courier)
+                'label_url': f"https://courier.example.com/labels/{tracking_number}.pdf",
+                'status': 'Pickup Pending'
+            }
+        return results
+
+    def track(self, tracking_numbers):
+        # Nothing moves in the simulation
+        return {tn: 'Shipped' for tn in tracking_numbers}
+
+    def cancel_shipment(self, tracking_number):
+        return True
+
+
+class HTTPCourierAdapter(CourierAdapter):
+    def __init__(self, config=None):
+        super().__init__(config)
+        self.base_url = self.config['base_url'].rstrip('/')
+        self.timeout = self.config.get('timeout', (3, 10))
+        self.max_retries = self.config.get('max_retries', 3)
+        self.backoff = self.config.get('backoff', 0.5)
+        self.batch_size = self.config.get('batch_size', self.batch_size)
+        self.breaker = CircuitBreaker(
+            threshold=self.config.get('breaker_threshold', 5),
+            reset_after=self.config.get('breaker_reset_seconds', 30),
+        )
+
+        pool_size = self.config.get('pool_size', 10)
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        if self.config.get('api_key'):
+            self.session.headers['Authorization'] = f"Bearer {self.config['api_key']}"
+
+    def request(self, method, path, **kwargs):
+        """JSON request with retry/backoff on connection errors, 429 and 5xx."""
+        if not self.breaker.allow():
+            raise CourierUnavailable(f'{self.name} is unavailable, try again shortly')
+
+        url = f"{self.base_url}{path}"
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self.backoff * (2 ** (attempt - 1)))
+            try:
+                resp = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            except requests.RequestException as e:
+                last_error = CourierError(f'{self.name} request failed: {e}')
+                continue
+            if resp.status_code == 429 or resp.status_code >= 500:
+                last_error = CourierError(f'{self.name} returned {resp.status_code}')
+                continue
+            if resp.status_code >= 400:
+                # Our request is wrong; retrying won't help and the courier itself is healthy
+                self.breaker.record_success()
+                raise CourierError(f'{self.name} rejected request ({resp.status_code}): {resp.text[:200]}')
+            self.breaker.record_success()
+            return resp.json()
+
+        self.breaker.record_failure()
+        raise last_error
+
+    def shipment_payload(self, order):
+        address = order.shipping_address if isinstance(order.shipping_address, dict) else {}
+        return {
+            # Couriers de-duplicate on merchant_order_id, which makes retried POSTs safe
+            'merchant_order_id': str(order.id),
+            'recipient_name': order.customer_name,
+            'recipient_phone': order.phone,
+            'address': address,
+            'amount': str(order.total) if order.payment_status != 'Paid' else '0',
+        }
+
+    def create_shipments(self, orders):
+        results = {}
+        for i in range(0, len(orders), self.batch_size):
+            batch = orders[i:i + self.batch_size]
+            try:
+                data = self.request('POST', '/shipments', json={'orders': [self.shipment_payload(o) for o in batch]})
+            except CourierError as e:
+                # Earlier batches already exist at the courier: keep their results, fail only this one
+                for order in batch:
+                    results[order.id] = {'error': str(e)}
+                continue
+            returned = {str(s.get('merchant_order_id')): s for s in data.get('shipments', [])}
+            for order in batch:
+                shipment = returned.get(str(order.id))
+                if not shipment:
+                    results[order.id] = {'error': f'{self.name} returned no shipment'}
+                elif shipment.get('error'):
+                    results[order.id] = {'error': shipment['error']}
+                else:
+                    results[order.id] = {
+                        'tracking_number': shipment['tracking_number'],
+                        'label_url': shipment.get('label_url'),
+                        'status': shipment.get('status', 'Pickup Pending'),
+                    }
+        return results
+
+    def track(self, tracking_numbers):
+        statuses = {}
+        tracking_numbers = list(tracking_numbers)
+        for i in range(0, len(tracking_numbers), self.batch_size):
+            batch = tracking_numbers[i:i + self.batch_size]
+            data = self.request('GET', '/tracking', params={'tracking_numbers': ','.join(batch)})
+            for tracking_number, courier_status in data.get('statuses', {}).items():
+                statuses[tracking_number] = STATUS_MAP.get(str(courier_status).lower(), 'Shipped')
+        return statuses
+
+    def cancel_shipment(self, tracking_number):
+        self.request('POST', f'/shipments/{tracking_number}/cancel')
+        return True
+
+
+_registry = {}
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def register(name, tracking_prefix):
+    """Register an HTTP adapter class under a courier name (case-insensitive)."""
+    def decorator(cls):
+        cls.name = name
+        cls.tracking_prefix = tracking_prefix
+        _registry[name.lower()] = cls
+        return cls
+    return decorator
+
+
+@register('Pathao', 'PTH')
+class PathaoAdapter(HTTPCourierAdapter):
+    pass
+
+
+@register('Steadfast', 'SF')
+class SteadfastAdapter(HTTPCourierAdapter):
+    pass
+
+
+@register('RedX', 'RDX')
+class RedXAdapter(HTTPCourierAdapter):
+    pass
+
+
+def get_adapter(courier_name):
+    """One adapter instance per courier per process, so its HTTP pool and breaker are shared."""
+    key = (courier_name or 'manual').lower()
+    with _instances_lock:
+        if key not in _instances:
+            config = getattr(settings, 'COURIERS', {}).get(key)
+            cls = _registry.get(key)
+            if cls and config and config.get('base_url'):
+                _instances[key] = cls(config)
+            else:
+                adapter = SimulatedCourierAdapter()
+                if cls:
+                    adapter.name, adapter.tracking_prefix = cls.name, cls.tracking_prefix
+                _instances[key] = adapter
+        return _instances[key]
+
+
+def reset_adapters():
+    """Drop cached adapters (settings changed, tests)."""
+    with _instances_lock:
+        _instances.clear()
+
@@ -0,0 +1,78 @@
+"""
+Customer accounts behind checkout orders.
+
+A guest order is linked to the account for its phone number, creating one if
+needed, and the order's name/address fill in whatever the profile is missing.
+Creating is a single INSERT .. ON CONFLICT DO NOTHING followed by a read, so two
+orders from the same new phone at once both end up on the one row without
+catching IntegrityError; the profile is then written only if a field changed.
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+
+User = get_user_model()
+
+
+def _split(name):
+    parts = (name or '').split(' ')
+    return parts[0], ' '.join(parts[1:])
+
+
+def name_from_order(shipping_address, customer_name):
+    """(first, last) from the shipping address, else from a customer_name that isn't 'Guest' or a phone number."""
+    first_name = shipping_address.get('first_name') or shipping_address.get('firstName')
+    last_name = shipping_address.get('last_name') or shipping_address.get('lastName')
+    if not first_name and shipping_address.get('name'):
+        first_name, last_name = _split(shipping_address['name'])
+    if not first_name and customer_name and customer_name != 'Guest' and not customer_name.replace(' ', '').isdigit():
+        first_name, last_name = _split(customer_name)
+    return first_name, last_name or ''
+
+
+def profile_changes(user, shipping_address, customer_name):
+    """Fields to set on the user: only a missing or placeholder name and an empty address are filled in."""
+    changes = {}
+    first_name, last_name = name_from_order(shipping_address, customer_name)
+    current = user.first_name
+    if first_name and (not current or current.isdigit() or current == 'Guest') and (first_name, last_name) != (user.first_name, user.last_name):
+        changes['first_name'] = first_name
+        changes['last_name'] = last_name
+    if shipping_address and not (user.shipping_address and any(user.shipping_address.values())):
+        changes['shipping_address'] = shipping_address
+        if not user.billing_address:
+            changes['billing_address'] = shipping_address
+    return changes
+
+
+def update_profile(user, shipping_address, customer_name):
+    changes = profile_changes(user, shipping_address or {}, customer_name)
+    if changes:
+        for field, value in changes.items():
+            setattr(user, field, value)
+        user.save(update_fields=list(changes))
+    return user
+
+
+def resolve_guest(phone, customer_name, shipping_address):
+    """The account for a guest order's phone, created with the order's profile if new. None if it can't be had."""
+    shipping_address = shipping_address or {}
+    first_name, last_name = name_from_order(shipping_address, customer_name)
+    if not first_name:
+        first_name, last_name = _split(customer_name or 'Guest')
+
+    User.objects.bulk_create([User(
+        username=phone,
+        phone_number=phone,
+        first_name=first_name,
+        last_name=last_name,
+        password=make_password(None), # Unusable until they set one
+        shipping_address=shipping_address,
+        billing_address=shipping_address,
+    )], ignore_conflicts=True)
+
+    # Ours, or the row a concurrent order (or an earlier signup) created. Missing only if
+    # the phone is taken as someone else's username
+    user = User.objects.filter(phone_number=phone).first()
+    if user is not None:
+        update_profile(user, shipping_address, customer_name)
+    return user
@@ -0,0 +1,142 @@
+"""
+Materialized follow-up work queues.
+
+PendingFollowUp holds the Delivered orders still waiting for a post-purchase
+call, CustomerStats the per-customer totals the recurring queue and the RFM
+segments (orders.rfm) sort and filter on. Both are refreshed for just the affected orders/customers whenever
+an order's status changes (state.apply_changes / bulk_transition, Order saves)
+or a follow-up is saved or deleted, so the call-center lists are plain indexed
+reads instead of correlated subqueries over every delivered order.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Exists, Max, Min, OuterRef, Q, Sum
+from django.utils import timezone
+
+from . import rfm
+from .models import Order, FollowUp, PendingFollowUp, CustomerStats
+
+RECURRING_DAYS = 30
+
+
+def completed_post_purchase():
+    # A 'Follow Later' call keeps the order in the queue
+    return FollowUp.objects.filter(order=OuterRef('pk'), followup_type='Post-Purchase').exclude(status='Follow Later')
+
+
+def refresh_pending(order_ids):
+    """Add/remove queue rows for the given orders."""
+    order_ids = {pk for pk in order_ids if pk}
+    if not order_ids:
+        return
+    eligible = dict(
+        Order.objects.filter(pk__in=order_ids, status='Delivered')
+        .exclude(Exists(completed_post_purchase()))
+        .values_list('id', 'created_at')
+    )
+    with transaction.atomic():
+        PendingFollowUp.objects.filter(order_id__in=order_ids - eligible.keys()).delete()
+        PendingFollowUp.objects.bulk_create(
+            [PendingFollowUp(order_id=pk, order_created_at=created_at) for pk, created_at in eligible.items()],
+            ignore_conflicts=True,
+        )
+
+
+def refresh_customers(customer_ids):
+    """Recompute CustomerStats rows for the given customers (one grouped query per source table)."""
+    customer_ids = {pk for pk in customer_ids if pk}
+    if not customer_ids:
+        return
+    delivered = Q(status='Delivered')
+    placed = ~Q(status='Cancelled')
+    totals = {
+        row['customer_id']: row for row in
+        Order.objects.filter(customer_id__in=customer_ids).values('customer_id').annotate(
+            delivered_count=Count('id', filter=delivered),
+            delivered_total=Sum('total', filter=delivered),
+            last_delivered=Max('created_at', filter=delivered),
+            order_count=Count('id', filter=placed),
+            cancelled_count=Count('id', filter=Q(status='Cancelled')),
+            first_order=Min('created_at', filter=placed),
+            last_order=Max('created_at', filter=placed),
+        )
+    }
+    last_followup = dict(
+        FollowUp.objects.filter(customer_id__in=customer_ids).values('customer_id')
+        .annotate(last=Max('created_at')).values_list('customer_id', 'last')
+    )
+    rows = []
+    for pk in customer_ids:
+        row = totals.get(pk, {})
+        delivered_total = row.get('delivered_total') or 0
+        order_count = row.get('order_count', 0)
+        rows.append(CustomerStats(
+            customer_id=pk,
+            delivered_count=row.get('delivered_count', 0),
+            delivered_total=delivered_total,
+            last_delivered_order_at=row.get('last_delivered'),
+            last_followup_at=last_followup.get(pk),
+            order_count=order_count,
+            cancelled_count=row.get('cancelled_count', 0),
+            first_order_at=row.get('first_order'),
+            last_order_at=row.get('last_order'),
+            frequency_score=rfm.frequency_score(order_count),
+            monetary_score=rfm.monetary_score(delivered_total),
+            updated_at=timezone.now(),
+        ))
+    CustomerStats.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=['customer'],
+        update_fields=[
+            'delivered_count', 'delivered_total', 'last_delivered_order_at', 'last_followup_at', 'order_count',
+            'cancelled_count', 'first_order_at', 'last_order_at', 'frequency_score', 'monetary_score', 'updated_at',
+        ],
+    )
+
+
+def orders_changed(order_ids, customer_ids=None):
+    """Hook for order status changes; pass customer_ids when the caller already has them."""
+    order_ids = set(order_ids)
+    if customer_ids is None:
+        customer_ids = Order.objects.filter(pk__in=order_ids, customer__isnull=False).values_list('customer_id', flat=True)
+    refresh_pending(order_ids)
+    refresh_customers(customer_ids)
+
+
+def followups_changed(followups):
+    refresh_pending(f.order_id for f in followups)
+    refresh_customers(f.customer_id for f in followups)
+
+
+def rebuild():
+    """Recompute both queues from scratch (see the rebuild_followup_queues command)."""
+    with transaction.atomic():
+        PendingFollowUp.objects.all().delete()
+        CustomerStats.objects.all().delete()
+        PendingFollowUp.objects.bulk_create(
+            [
+                PendingFollowUp(order_id=pk, order_created_at=created_at)
+                for pk, created_at in Order.objects.filter(status='Delivered')
+                .exclude(Exists(completed_post_purchase())).values_list('id', 'created_at').iterator()
+            ],
+            batch_size=1000,
+        )
+        customer_ids = set(Order.objects.filter(customer__isnull=False).values_list('customer_id', flat=True).distinct())
+        customer_ids |= set(FollowUp.objects.filter(customer__isnull=False).values_list('customer_id', flat=True).distinct())
+        customer_ids = sorted(customer_ids)
+        for start in range(0, len(customer_ids), 1000):
+            refresh_customers(customer_ids[start:start + 1000])
+
+
+def pending_orders():
+    """Orders waiting for a post-purchase call, newest first."""
+    return Order.objects.filter(pending_followup__isnull=False).order_by('-pending_followup__order_created_at')
+
+
+def recurring_customers(days=RECURRING_DAYS):
+    """CustomerStats for customers with a delivery and no follow-up in `days` days, newest order first."""
+    cutoff = timezone.now() - timedelta(days=days)
+    return CustomerStats.objects.filter(
+        Q(last_followup_at__isnull=True) | Q(last_followup_at__lt=cutoff),
+        last_delivered_order_at__isnull=False,
+    ).order_by('-last_delivered_order_at')
@@ -0,0 +1,119 @@
+"""
+Batch fulfilment: ship or cancel many orders in one request.
+
+Orders are grouped by courier and split into batches. Each batch goes to
+CourierService.create_shipments on a bounded thread pool, then all successful orders are
+moved to Shipped with a single bulk_update (see state.bulk_transition).
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .inventory import StockMove, VariantResolver, apply_stock_moves
+from .models import Order, OrderItem
+from .services import CourierService
+from .state import TRANSITIONS, bulk_transition
+
+
+def _create_batch(orders, courier_name):
+    try:
+        return CourierService.create_shipments(orders, courier_name)
+    except Exception as e:
+        return {order.id: {'error': str(e)} for order in orders}
+    finally:
+        # Worker threads get their own DB connection if the courier layer touches the DB
+        close_old_connections()
+
+
+def bulk_ship(assignments, actor=None):
+    """
+    assignments: {order_id: courier_name}
+    Returns a list of per-order results: {id, success, tracking_number, label_url, error}
+    """
+    batch_size = getattr(settings, 'COURIER_BATCH_SIZE', 50)
+    max_workers = getattr(settings, 'COURIER_MAX_WORKERS', 4)
+
+    results = {}
+    # Everything HTTPCourierAdapter.shipment_payload reads, so worker threads don't load deferred fields
+    orders = Order.objects.filter(pk__in=list(assignments)).only(
+        'id', 'status', 'customer_name', 'phone', 'shipping_address', 'total', 'payment_status',
+    )
+    groups = {}
+    for order in orders:
+        if 'Shipped' not in TRANSITIONS.get(order.status, set()):
+            results[order.id] = {'id': order.id, 'success': False, 'error': f'Cannot ship order in status {order.status}'}
+            continue
+        groups.setdefault(assignments[order.id], []).append(order)
+
+    batches = [
+        (courier_name, group[i:i + batch_size])
+        for courier_name, group in groups.items()
+        for i in range(0, len(group), batch_size)
+    ]
+
+    shipments = {}
+    if batches:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as pool:
+            futures = [pool.submit(_create_batch, batch, courier_name) for courier_name, batch in batches]
+            for future in futures:
+                shipments.update(future.result())
+
+    updates = {}
+    event_data = {}
+    for order_id, shipment in shipments.items():
+        if 'error' in shipment:
+            results[order_id] = {'id': order_id, 'success': False, 'error': shipment['error']}
+            continue
+        courier_name = assignments[order_id]
+        updates[order_id] = {'courier_name': courier_name, 'tracking_number': shipment['tracking_number']}
+        event_data[order_id] = {'courier_name': courier_name, 'tracking_number': shipment['tracking_number']}
+
+    moved, errors = bulk_transition(updates, 'Shipped', actor=actor, data=event_data)
+    for order in moved:
+        shipment = shipments[order.id]
+        results[order.id] = {
+            'id': order.id,
+            'success': True,
+            'tracking_number': shipment['tracking_number'],
+            'label_url': shipment['label_url'],
+        }
+    for order_id, error in errors.items():
+        # Status changed while the courier call was in flight, release the parcel again
+        CourierService.cancel_shipment(shipments[order_id]['tracking_number'], assignments[order_id])
+        results[order_id] = {'id': order_id, 'success': False, 'error': error}
+
+    for order_id in assignments:
+        results.setdefault(order_id, {'id': order_id, 'success': False, 'error': 'Order not found'})
+    return [results[order_id] for order_id in assignments]
+
+
+# Cancelling from here doesn't involve a return; Shipped/Delivered go through resolve_return
+CANCELLABLE_STATUSES = {'Pending', 'Processing'}
+
+
+def cancel_orders(order_ids, actor=None):
+    """
+    Cancel many orders in one transaction: one bulk status update, one item
+    read, then product and variant stock restored with grouped F() updates and
+    bulk InventoryLog inserts (see inventory.apply_stock_moves).
+    Returns (cancelled order ids, {order_id: error}).
+    """
+    actor = actor if actor is not None and actor.is_authenticated else None
+    # Pre-shipping cancellation: no return logic, no loss
+    updates = {order_id: {'return_status': 'None', 'loss_amount': 0} for order_id in order_ids}
+
+    with transaction.atomic():
+        moved, errors = bulk_transition(updates, 'Cancelled', actor=actor, from_statuses=CANCELLABLE_STATUSES)
+        cancelled = [order.pk for order in moved]
+        if cancelled:
+            lines = list(
+                OrderItem.objects.filter(order_id__in=cancelled, product__isnull=False)
+                .values_list('order_id', 'product_id', 'variant_info', 'quantity')
+            )
+            variant_of = VariantResolver(product_id for _, product_id, _, _ in lines)
+            apply_stock_moves([
+                StockMove(product_id, variant_of(product_id, variant_info), quantity, f'Order #{order_id} Cancelled')
+                for order_id, product_id, variant_info, quantity in lines
+            ], reason='Correction', user=actor)
+    return cancelled, errors
@@ -0,0 +1,218 @@
+"""
+Image proxy used by invoice rendering (OrderViewSet.proxy_image).
+
+Upstream images are fetched once through a pooled session, size/content-type checked,
+and kept in a bounded on-disk LRU cache keyed by URL. Later requests are served from disk.
+
+fetch() hands back the file already open, so eviction in another thread or process can
+unlink it without breaking the response being served. The directory is only scanned for
+eviction when this process's running total goes over IMAGE_PROXY_CACHE_MAX_BYTES, or when
+the last scan is older than IMAGE_PROXY_EVICT_INTERVAL (to pick up other processes' files).
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+
+class ImageProxyError(Exception):
+    def __init__(self, message, status=502):
+        super().__init__(message)
+        self.status = status
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+_session = None
+_session_lock = threading.Lock()
+_fetch_slots = None
+_key_locks = [threading.Lock() for _ in range(64)]
+_evict_lock = threading.Lock()
+_usage = None # (cache dir, bytes, monotonic time of the last scan)
+
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            pool_size = _setting('IMAGE_PROXY_MAX_CONCURRENT', 8)
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+    return _session
+
+
+def get_fetch_slots():
+    # Caps upstream fetches in flight so slow image hosts can't tie up every worker
+    global _fetch_slots
+    with _session_lock:
+        if _fetch_slots is None:
+            _fetch_slots = threading.BoundedSemaphore(_setting('IMAGE_PROXY_MAX_CONCURRENT', 8))
+    return _fetch_slots
+
+
+def _key_lock(key):
+    # Concurrent requests for the same URL wait for one fetch instead of each going upstream
+    return _key_locks[int(key[:8], 16) % len(_key_locks)]
+
+
+def cache_dir():
+    path = _setting('IMAGE_PROXY_CACHE_DIR', os.path.join(settings.BASE_DIR, 'cache', 'image_proxy'))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def cache_key(url):
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+
+def _paths(key):
+    base = os.path.join(cache_dir(), key)
+    return base + '.bin', base + '.json'
+
+
+def get_cached(url):
+    """Returns (open file, content_type, key) for a cached image or None. Touches it for LRU."""
+    key = cache_key(url)
+    data_path, meta_path = _paths(key)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        handle = open(data_path, 'rb')
+    except (OSError, ValueError):
+        return None
+    try:
+        os.utime(data_path, None)
+    except OSError:
+        pass # Evicted just now; the open handle still reads it
+    return handle, meta['content_type'], key
+
+
+def fetch(url):
+    """
+    Returns (open file, content_type, key), fetching and caching the image on a miss.
+    The caller closes the file. Raises ImageProxyError on invalid URLs, upstream errors,
+    non-images or oversized bodies.
+    """
+    if not url.startswith(('http://', 'https://')):
+        raise ImageProxyError('Invalid URL', status=400)
+
+    cached = get_cached(url)
+    if cached:
+        return cached
+
+    key = cache_key(url)
+    with _key_lock(key):
+        cached = get_cached(url)
+        if cached:
+            return cached
+
+        slots = get_fetch_slots()
+        if not slots.acquire(timeout=_setting('IMAGE_PROXY_QUEUE_TIMEOUT', 2)):
+            raise ImageProxyError('Image proxy busy, try again', status=503)
+        try:
+            content_type, tmp_path = _download(url)
+        finally:
+            slots.release()
+
+        data_path, meta_path = _paths(key)
+        os.replace(tmp_path, data_path)
+        handle = open(data_path, 'rb')
+        with open(meta_path, 'w') as f:
+            json.dump({'url': url, 'content_type': content_type}, f)
+
+    _added(os.fstat(handle.fileno()).st_size)
+    return handle, content_type, key
+
+
+def _download(url):
+    max_bytes = _setting('IMAGE_PROXY_MAX_IMAGE_BYTES', 5 * 1024 * 1024)
+    timeout = _setting('IMAGE_PROXY_TIMEOUT', (3, 5))
+    try:
+        resp = get_session().get(url, stream=True, timeout=timeout)
+    except requests.RequestException as e:
+        raise ImageProxyError(f'Upstream error: {e}')
+
+    with resp:
+        if resp.status_code != 200:
+            raise ImageProxyError(f'Upstream returned {resp.status_code}')
+
+        content_type = resp.headers.get('content-type', '').split(';')[0].strip().lower()
+        if not content_type.startswith('image/'):
+            raise ImageProxyError('URL is not an image', status=400)
+
+        declared = resp.headers.get('content-length')
+        if declared and declared.isdigit() and int(declared) > max_bytes:
+            raise ImageProxyError('Image too large', status=413)
+
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir(), suffix='.part')
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in resp.iter_content(chunk_size=64 * 1024):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise ImageProxyError('Image too large', status=413)
+                    out.write(chunk)
+        except requests.RequestException as e:
+            os.remove(tmp_path)
+            raise ImageProxyError(f'Upstream error: {e}')
+        except ImageProxyError:
+            os.remove(tmp_path)
+            raise
+
+    return content_type, tmp_path
+
+
+def _added(size):
+    """Count a newly cached file; evict only once over the limit or when the last scan is stale."""
+    global _usage
+    directory = cache_dir()
+    with _evict_lock:
+        if (_usage is not None and _usage[0] == directory
+                and time.monotonic() - _usage[2] < _setting('IMAGE_PROXY_EVICT_INTERVAL', 300)):
+            _usage = (directory, _usage[1] + size, _usage[2])
+            if _usage[1] <= _setting('IMAGE_PROXY_CACHE_MAX_BYTES', 200 * 1024 * 1024):
+                return
+    evict()
+
+
+def evict():
+    """Drop least recently used images until the cache fits IMAGE_PROXY_CACHE_MAX_BYTES."""
+    global _usage
+    max_total = _setting('IMAGE_PROXY_CACHE_MAX_BYTES', 200 * 1024 * 1024)
+    directory = cache_dir()
+    with _evict_lock:
+        entries = []
+        total = 0
+        for entry in os.scandir(directory):
+            if entry.name.endswith('.bin'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue # Removed by another process mid-scan
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        if total > max_total:
+            entries.sort()
+            for _, size, path in entries:
+                if total <= max_total:
+                    break
+                for victim in (path, path[:-4] + '.json'):
+                    try:
+                        os.remove(victim)
+                    except OSError:
+                        pass
+                total -= size
+        _usage = (directory, total, time.monotonic())
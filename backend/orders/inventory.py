@@ -0,0 +1,121 @@
+"""
+Set-based stock adjustments for order items.
+
+Callers collect StockMove rows (positive delta = back into stock, negative =
+taken out) and apply them in one pass: the affected stock rows are locked, stock
+moves through grouped F() updates, the InventoryLog rows are bulk inserted and
+stock_status is recomputed in SQL.
+
+A line that resolved to a variant is stocked on that ProductVariant only (the
+same row store's adjust_stock edits and effective_stock reads); other lines are
+stocked on the Product row.
+"""
+from collections import defaultdict, namedtuple
+
+from django.db import transaction
+from django.db.models import F
+
+from store.models import Product, ProductVariant, InventoryLog, refresh_stock_status
+
+# variant_id is None for simple products or lines that match no combination
+StockMove = namedtuple('StockMove', ['product_id', 'variant_id', 'delta', 'note'])
+
+
+def normalize_variant(v_info):
+    """Comparable form of an item's variant_info (dict order doesn't matter)."""
+    if not v_info:
+        return ""
+    if isinstance(v_info, dict):
+        return str(sorted(v_info.items()))
+    return str(v_info)
+
+
+def item_key(product_id, v_info):
+    """Identity of an order line: product + selected variant."""
+    return (str(product_id) if product_id else None, normalize_variant(v_info))
+
+
+def _attributes_key(attributes):
+    # Cart payloads send {'color': 'Red'}, combinations store {'Color': 'Red'}
+    if not isinstance(attributes, dict) or not attributes:
+        return None
+    return tuple(sorted((str(k).lower(), str(v).lower()) for k, v in attributes.items()))
+
+
+class VariantResolver:
+    """Maps (product_id, variant_info) to a ProductVariant id with one query."""
+
+    def __init__(self, product_ids):
+        self.lookup = {}
+        rows = ProductVariant.objects.filter(product_id__in=set(product_ids)).values_list('id', 'product_id', 'attributes')
+        for variant_id, product_id, attributes in rows:
+            self.lookup.setdefault((product_id, _attributes_key(attributes)), variant_id)
+
+    def __call__(self, product_id, variant_info):
+        key = _attributes_key(variant_info)
+        return self.lookup.get((product_id, key)) if key else None
+
+
+def _grouped_update(model, deltas):
+    # One UPDATE per distinct delta rather than one per row
+    by_delta = defaultdict(list)
+    for pk, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(pk)
+    for delta, pks in by_delta.items():
+        model.objects.filter(pk__in=pks).update(stock_quantity=F('stock_quantity') + delta)
+
+
+def apply_stock_moves(moves, reason, user=None):
+    """
+    Apply StockMove rows to variant or product stock and log each one.
+
+    Only manage_stock products move. A stock row (variant, or product for lines
+    without one) whose net deduction exceeds what it has on hand is skipped
+    entirely, same as at checkout. Returns the moves that were applied.
+    """
+    moves = [m for m in moves if m.product_id and m.delta]
+    if not moves:
+        return []
+
+    product_net = defaultdict(int)
+    variant_net = defaultdict(int)
+    for move in moves:
+        if move.variant_id:
+            variant_net[move.variant_id] += move.delta
+        else:
+            product_net[move.product_id] += move.delta
+
+    with transaction.atomic():
+        product_on_hand = dict(
+            Product.objects.select_for_update()
+            .filter(pk__in={m.product_id for m in moves}, manage_stock=True)
+            .values_list('id', 'stock_quantity')
+        )
+        variant_on_hand = dict(
+            ProductVariant.objects.select_for_update()
+            .filter(pk__in=variant_net.keys(), product_id__in=product_on_hand.keys())
+            .values_list('id', 'stock_quantity')
+        ) if variant_net else {}
+
+        def fits(on_hand, key, delta):
+            return key in on_hand and (delta >= 0 or on_hand[key] >= -delta)
+
+        products = {pid for pid, delta in product_net.items() if fits(product_on_hand, pid, delta)}
+        variants = {vid for vid, delta in variant_net.items() if fits(variant_on_hand, vid, delta)}
+        applied = [m for m in moves if (m.variant_id in variants if m.variant_id else m.product_id in products)]
+        if not applied:
+            return []
+
+        _grouped_update(Product, {pid: product_net[pid] for pid in products})
+        _grouped_update(ProductVariant, {vid: variant_net[vid] for vid in variants})
+        refresh_stock_status({m.product_id for m in applied})
+
+        InventoryLog.objects.bulk_create([
+            InventoryLog(
+                product_id=m.product_id, variant_id=m.variant_id, change_amount=m.delta,
+                reason=reason, note=m.note, user=user
+            )
+            for m in applied
+        ], batch_size=500)
+    return applied
@@ -0,0 +1,145 @@
+import csv
+import hashlib
+import io
+import json
+import logging
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import ReportJob
+
+logger = logging.getLogger(__name__)
+
+# Local worker pool, no broker needed. Jobs are persisted so status survives the worker;
+# the process_report_jobs command re-runs jobs a restart left behind and purges old results.
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'REPORT_JOB_WORKERS', 2),
+            thread_name_prefix='report-job'
+        )
+    return _executor
+
+
+def make_cache_key(report_type, params):
+    payload = json.dumps({'type': report_type, 'params': params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def submit_report(report_type, params, user=None, refresh=False):
+    """
+    Returns (job, created). Reuses a finished job with the same type + params while it is
+    younger than REPORT_JOB_CACHE_SECONDS, or one that is still queued/running.
+    """
+    cache_key = make_cache_key(report_type, params)
+    now = timezone.now()
+
+    if not refresh:
+        cache_seconds = getattr(settings, 'REPORT_JOB_CACHE_SECONDS', 300)
+        cached = ReportJob.objects.filter(
+            cache_key=cache_key, status='Completed', finished_at__gte=now - timedelta(seconds=cache_seconds)
+        ).first()
+        if cached:
+            return cached, False
+
+    # A job stuck in Running past the timeout (worker died) is not worth waiting on
+    timeout = getattr(settings, 'REPORT_JOB_TIMEOUT_SECONDS', 1800)
+    in_flight = ReportJob.objects.filter(cache_key=cache_key, status__in=['Pending', 'Running'], created_at__gte=now - timedelta(seconds=timeout)).first()
+    if in_flight:
+        return in_flight, False
+
+    job = ReportJob.objects.create(
+        report_type=report_type,
+        params=params,
+        cache_key=cache_key,
+        requested_by=user if user and user.is_authenticated else None
+    )
+    # Only hand the id to a worker once the row is visible to other connections
+    transaction.on_commit(lambda: dispatch(job.id))
+    return job, True
+
+
+def dispatch(job_id):
+    if getattr(settings, 'REPORT_JOBS_SYNC', False):
+        run_report_job(job_id)
+    else:
+        get_executor().submit(run_report_job, job_id)
+
+
+def run_report_job(job_id):
+    from .reports import REPORT_BUILDERS
+
+    close_old_connections()
+    try:
+        # Claim the job; if another worker got it first there is nothing to do
+        claimed = ReportJob.objects.filter(id=job_id, status='Pending').update(status='Running', started_at=timezone.now())
+        if not claimed:
+            return
+        job = ReportJob.objects.get(id=job_id)
+
+        try:
+            build_rows, fields = REPORT_BUILDERS[job.report_type]
+            with tempfile.TemporaryFile() as tmp:
+                text = io.TextIOWrapper(tmp, encoding='utf-8', newline='')
+                writer = csv.writer(text)
+                writer.writerow(fields)
+                count = 0
+                for row in build_rows(job.params):
+                    writer.writerow([row[f] for f in fields])
+                    count += 1
+                text.flush()
+                tmp.seek(0)
+                job.result_file.save(f"{job.report_type}_{uuid.uuid4().hex}.csv", File(tmp), save=False)
+                text.detach()
+
+            job.row_count = count
+            job.status = 'Completed'
+        except Exception as e:
+            logger.exception('Report job %s failed', job.id)
+            job.status = 'Failed'
+            job.error = str(e)
+
+        job.finished_at = timezone.now()
+        job.save()
+    finally:
+        close_old_connections()
+
+
+def requeue_stalled():
+    """
+    Run jobs whose worker went away: Pending longer than REPORT_JOB_STALE_SECONDS (the
+    process restarted before a worker picked them up) or Running past REPORT_JOB_TIMEOUT_SECONDS.
+    They run here, one after another. Returns their ids.
+    """
+    now = timezone.now()
+    pending_before = now - timedelta(seconds=getattr(settings, 'REPORT_JOB_STALE_SECONDS', 120))
+    running_before = now - timedelta(seconds=getattr(settings, 'REPORT_JOB_TIMEOUT_SECONDS', 1800))
+    ReportJob.objects.filter(status='Running', started_at__lt=running_before).update(status='Pending', started_at=None)
+    ids = list(ReportJob.objects.filter(status='Pending', created_at__lt=pending_before).order_by('id').values_list('id', flat=True))
+    for job_id in ids:
+        run_report_job(job_id)
+    return ids
+
+
+def purge_expired():
+    """Delete finished jobs older than REPORT_JOB_RETENTION_SECONDS together with their files. Returns the count."""
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'REPORT_JOB_RETENTION_SECONDS', 86400))
+    expired = ReportJob.objects.filter(status__in=['Completed', 'Failed'], finished_at__lt=cutoff)
+    count = 0
+    for job in expired.only('id', 'result_file').iterator():
+        if job.result_file:
+            job.result_file.delete(save=False)
+        count += 1
+    expired.delete()
+    return count
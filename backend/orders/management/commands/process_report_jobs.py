@@ -0,0 +1,19 @@
+import time
+from django.core.management.base import BaseCommand
+from orders.jobs import purge_expired, requeue_stalled
+
+class Command(BaseCommand):
+    help = 'Re-runs report jobs whose worker died and deletes expired report files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', type=int, default=0, help='Keep running, sleeping this many seconds between runs')
+
+    def handle(self, *args, **options):
+        while True:
+            ids = requeue_stalled()
+            purged = purge_expired()
+            self.stdout.write(f"Re-ran {len(ids)} stalled jobs, purged {purged} expired")
+
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
@@ -0,0 +1,18 @@
+import time
+from django.core.management.base import BaseCommand
+from orders.shipping import requeue_stalled
+
+class Command(BaseCommand):
+    help = 'Re-runs courier bookings (shipment jobs) whose worker died'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', type=int, default=0, help='Keep running, sleeping this many seconds between runs')
+
+    def handle(self, *args, **options):
+        while True:
+            ids = requeue_stalled()
+            self.stdout.write(f"Re-ran {len(ids)} stalled shipment jobs")
+
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
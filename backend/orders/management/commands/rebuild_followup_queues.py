@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from orders import followups
+from orders.models import PendingFollowUp, CustomerStats
+
+class Command(BaseCommand):
+    help = 'Recomputes the pending follow-up queue and customer stats from orders and follow-ups'
+
+    def handle(self, *args, **options):
+        followups.rebuild()
+        self.stdout.write(
+            f"{PendingFollowUp.objects.count()} orders pending follow-up, "
+            f"{CustomerStats.objects.count()} customer stats rows"
+        )
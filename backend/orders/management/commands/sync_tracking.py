@@ -0,0 +1,30 @@
+import time
+from django.core.management.base import BaseCommand
+from orders.tracking import sync_tracking
+
+class Command(BaseCommand):
+    help = 'Polls couriers for shipped parcels and marks them Delivered / returned'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=5000, help='Max parcels to check per run')
+        parser.add_argument('--interval', type=int, default=30, help='Skip parcels polled within this many minutes')
+        parser.add_argument('--courier', action='append', dest='couriers', help='Only this courier (repeatable)')
+        parser.add_argument('--loop', type=int, default=0, help='Keep running, sleeping this many seconds between runs')
+
+    def handle(self, *args, **options):
+        while True:
+            summary = sync_tracking(
+                limit=options['limit'],
+                min_interval_minutes=options['interval'],
+                couriers=options['couriers'],
+            )
+            self.stdout.write(
+                f"Checked {summary['checked']}, polled {summary['polled']}: "
+                f"{summary['delivered']} delivered, {summary['returned']} returned"
+            )
+            for courier_name, error in summary['errors'].items():
+                self.stderr.write(f"{courier_name}: {error}")
+
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
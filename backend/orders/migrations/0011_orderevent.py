@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:24
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('orders', '0010_reportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('created', 'Created'), ('status', 'Status'), ('payment_status', 'Payment Status'), ('verification_status', 'Verification Status'), ('return_status', 'Return Status')], max_length=30)),
+                ('from_value', models.CharField(blank=True, max_length=50)),
+                ('to_value', models.CharField(blank=True, max_length=50)),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('actor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='orders.order')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['event_type', 'to_value', 'id'], name='orderevent_type_to_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0011_orderevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='tracking_polled_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'tracking_polled_at'], name='order_tracking_poll_idx'),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:40
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Exists, Max, OuterRef, Sum
+import django.db.models.deletion
+
+
+def populate_queues(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    FollowUp = apps.get_model('orders', 'FollowUp')
+    PendingFollowUp = apps.get_model('orders', 'PendingFollowUp')
+    CustomerStats = apps.get_model('orders', 'CustomerStats')
+
+    completed = FollowUp.objects.filter(order=OuterRef('pk'), followup_type='Post-Purchase').exclude(status='Follow Later')
+    PendingFollowUp.objects.bulk_create([
+        PendingFollowUp(order_id=pk, order_created_at=created_at)
+        for pk, created_at in Order.objects.filter(status='Delivered').exclude(Exists(completed)).values_list('id', 'created_at')
+    ], batch_size=1000)
+
+    stats = {}
+    for row in Order.objects.filter(status='Delivered', customer__isnull=False).values('customer_id').annotate(
+        count=Count('id'), total=Sum('total'), last=Max('created_at')
+    ):
+        stats[row['customer_id']] = CustomerStats(
+            customer_id=row['customer_id'], delivered_count=row['count'],
+            delivered_total=row['total'] or 0, last_delivered_order_at=row['last'],
+        )
+    for customer_id, last in FollowUp.objects.filter(customer__isnull=False).values('customer_id').annotate(
+        last=Max('created_at')
+    ).values_list('customer_id', 'last'):
+        stats.setdefault(customer_id, CustomerStats(customer_id=customer_id)).last_followup_at = last
+    CustomerStats.objects.bulk_create(stats.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_otp'),
+        ('orders', '0013_order_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerStats',
+            fields=[
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='order_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('delivered_count', models.IntegerField(default=0)),
+                ('delivered_total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('last_delivered_order_at', models.DateTimeField(blank=True, null=True)),
+                ('last_followup_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PendingFollowUp',
+            fields=[
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='pending_followup', serialize=False, to='orders.order')),
+                ('order_created_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='followup',
+            index=models.Index(fields=['-created_at'], name='followup_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pendingfollowup',
+            index=models.Index(fields=['-order_created_at'], name='pendingfollowup_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customerstats',
+            index=models.Index(fields=['-last_delivered_order_at'], name='custstats_last_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customerstats',
+            index=models.Index(fields=['last_followup_at'], name='custstats_last_followup_idx'),
+        ),
+        migrations.RunPython(populate_queues, migrations.RunPython.noop),
+    ]
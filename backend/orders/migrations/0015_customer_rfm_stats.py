@@ -0,0 +1,89 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:01
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Q
+
+
+def _score(value, bands):
+    if not value or value <= 0:
+        return 0
+    return 1 + sum(1 for threshold in bands if value >= threshold)
+
+
+def populate_rfm(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    CustomerStats = apps.get_model('orders', 'CustomerStats')
+    frequency_bands = getattr(settings, 'RFM_FREQUENCY_BANDS', (2, 3, 5, 8))
+    monetary_bands = getattr(settings, 'RFM_MONETARY_BANDS', (2000, 5000, 10000, 25000))
+
+    placed = ~Q(status='Cancelled')
+    totals = {
+        row['customer_id']: row for row in
+        Order.objects.filter(customer__isnull=False).values('customer_id').annotate(
+            order_count=Count('id', filter=placed),
+            cancelled_count=Count('id', filter=Q(status='Cancelled')),
+            first_order=Min('created_at', filter=placed),
+            last_order=Max('created_at', filter=placed),
+        )
+    }
+    existing = CustomerStats.objects.in_bulk()
+    rows = []
+    for customer_id, row in totals.items():
+        stats = existing.get(customer_id) or CustomerStats(customer_id=customer_id)
+        stats.order_count = row['order_count']
+        stats.cancelled_count = row['cancelled_count']
+        stats.first_order_at = row['first_order']
+        stats.last_order_at = row['last_order']
+        stats.frequency_score = _score(stats.order_count, frequency_bands)
+        stats.monetary_score = _score(stats.delivered_total, monetary_bands)
+        rows.append(stats)
+    # Customers whose only orders are still open had no stats row before
+    fields = ['order_count', 'cancelled_count', 'first_order_at', 'last_order_at', 'frequency_score', 'monetary_score']
+    CustomerStats.objects.bulk_update([s for s in rows if s.customer_id in existing], fields, batch_size=1000)
+    CustomerStats.objects.bulk_create([s for s in rows if s.customer_id not in existing], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0014_followup_queues'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customerstats',
+            name='cancelled_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='customerstats',
+            name='first_order_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='customerstats',
+            name='frequency_score',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='customerstats',
+            name='last_order_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='customerstats',
+            name='monetary_score',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='customerstats',
+            name='order_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='customerstats',
+            index=models.Index(fields=['frequency_score', 'monetary_score', 'last_order_at'], name='custstats_rfm_idx'),
+        ),
+        migrations.RunPython(populate_rfm, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0015_customer_rfm_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='coupon_code',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='discount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:40
+
+from django.db import migrations, models
+import orders.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0016_order_coupon'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reportjob',
+            name='result_file',
+            field=models.FileField(blank=True, null=True, storage=orders.models.ReportFileStorage(), upload_to='reports/'),
+        ),
+    ]
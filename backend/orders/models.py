@@ -1,5 +1,10 @@
+import os
+
 from django.db import models
 from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from store.models import Product
 
 class Order(models.Model):
@@ -39,9 +44,12 @@ class Order(models.Model):
     # Fulfillment
     courier_name = models.CharField(max_length=50, blank=True, null=True) # Pathao, Steadfast, Manual
     tracking_number = models.CharField(max_length=100, blank=True, null=True)
+    tracking_polled_at = models.DateTimeField(blank=True, null=True) # Last courier status check (sync_tracking)
     
     subtotal = models.DecimalField(max_digits=10, decimal_places=2)
     shipping_cost = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    coupon_code = models.CharField(max_length=50, blank=True, null=True) # Redeemed at checkout (marketing.coupons)
+    discount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     total = models.DecimalField(max_digits=10, decimal_places=2)
     
     verification_status = models.CharField(max_length=20, choices=VERIFICATION_STATUS_CHOICES, default='Pending')
@@ -53,9 +61,55 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # In-flight parcels, least recently polled first
+            models.Index(fields=['status', 'tracking_polled_at'], name='order_tracking_poll_idx'),
+            # Admin list / ledger / pending follow-ups: newest first, optionally within one status
+            models.Index(fields=['-created_at'], name='order_created_idx'),
+            models.Index(fields=['status', '-created_at'], name='order_status_created_idx'),
+            models.Index(fields=['payment_status', '-created_at'], name='order_payment_created_idx'),
+            models.Index(fields=['verification_status', '-created_at'], name='order_verify_created_idx'),
+            # A customer's own order list
+            models.Index(fields=['customer', '-created_at'], name='order_customer_created_idx'),
+            # Risk history for guests (batch_risk): covers the grouped counts without touching rows
+            models.Index(fields=['phone', 'status', 'payment_status'], name='order_phone_risk_idx'),
+            models.Index(fields=['email', 'status', 'payment_status'], name='order_email_risk_idx'),
+        ]
+
     def __str__(self):
         return f"Order #{self.id} - {self.customer_name}"
 
+class OrderEvent(models.Model):
+    """
+    Append-only history of order state changes, written in the same transaction as the
+    change itself (see orders.state). Consumers read it incrementally by id.
+    """
+    EVENT_TYPE_CHOICES = (
+        ('created', 'Created'),
+        ('status', 'Status'),
+        ('payment_status', 'Payment Status'),
+        ('verification_status', 'Verification Status'),
+        ('return_status', 'Return Status'),
+    )
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='events')
+    event_type = models.CharField(max_length=30, choices=EVENT_TYPE_CHOICES)
+    from_value = models.CharField(max_length=50, blank=True)
+    to_value = models.CharField(max_length=50, blank=True)
+    data = models.JSONField(default=dict, blank=True) # e.g. courier/tracking on ship, loss on return
+    actor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['event_type', 'to_value', 'id'], name='orderevent_type_to_idx'),
+        ]
+
+    def __str__(self):
+        return f"Order #{self.order_id} {self.event_type}: {self.from_value} -> {self.to_value}"
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True)
@@ -118,9 +172,62 @@ class FollowUp(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at'], name='followup_created_idx'), # List order, calls today
+        ]
+
     def __str__(self):
         return f"{self.followup_type} - {self.customer} - {self.status}"
 
+class PendingFollowUp(models.Model):
+    """
+    Work queue for post-purchase calls: one row per Delivered order that has no
+    completed 'Post-Purchase' follow-up yet. Maintained by orders.followups.
+    """
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, primary_key=True, related_name='pending_followup')
+    order_created_at = models.DateTimeField() # Copy of Order.created_at so the queue sorts on its own index
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-order_created_at'], name='pendingfollowup_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Follow up Order #{self.order_id}"
+
+class CustomerStats(models.Model):
+    """
+    Per-customer order and follow-up totals, kept up to date by orders.followups
+    whenever an order's status changes or a follow-up is logged.
+    """
+    customer = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='order_stats')
+    delivered_count = models.IntegerField(default=0)
+    delivered_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    last_delivered_order_at = models.DateTimeField(null=True, blank=True) # created_at of the newest Delivered order
+    last_followup_at = models.DateTimeField(null=True, blank=True)
+    # RFM inputs (orders.rfm): every order that wasn't cancelled counts towards recency and frequency,
+    # monetary is delivered_total. Scores are 1-5 bands from settings, 0 = nothing yet
+    order_count = models.IntegerField(default=0)
+    cancelled_count = models.IntegerField(default=0)
+    first_order_at = models.DateTimeField(null=True, blank=True)
+    last_order_at = models.DateTimeField(null=True, blank=True)
+    frequency_score = models.PositiveSmallIntegerField(default=0)
+    monetary_score = models.PositiveSmallIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Recurring queue: customers with deliveries, newest order first
+            models.Index(fields=['-last_delivered_order_at'], name='custstats_last_order_idx'),
+            models.Index(fields=['last_followup_at'], name='custstats_last_followup_idx'),
+            # Segment queries: score bands as IN lists, then a recency range
+            models.Index(fields=['frequency_score', 'monetary_score', 'last_order_at'], name='custstats_rfm_idx'),
+        ]
+
+    def __str__(self):
+        return f"Stats for {self.customer}"
+
 class PaymentSettings(models.Model):
     vat_percentage = models.DecimalField(max_digits=5, decimal_places=2, default=5.00)
     inside_dhaka_shipping = models.DecimalField(max_digits=10, decimal_places=2, default=60.00)
@@ -139,3 +246,96 @@ class PaymentSettings(models.Model):
 
     def __str__(self):
         return "Global Payment Settings"
+
+class ReportFileStorage(FileSystemStorage):
+    """REPORT_JOB_STORAGE_DIR: outside MEDIA_ROOT and without a URL, so files are only served by ReportJobViewSet.download."""
+
+    @property
+    def base_location(self):
+        return settings.REPORT_JOB_STORAGE_DIR
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+    def url(self, name):
+        raise ValueError('Report files have no public URL')
+
+
+class ReportJob(models.Model):
+    STATUS_CHOICES = (
+        ('Pending', 'Pending'),
+        ('Running', 'Running'),
+        ('Completed', 'Completed'),
+        ('Failed', 'Failed'),
+    )
+
+    report_type = models.CharField(max_length=50) # sales_ledger, product_velocity, inventory_audit, followup_pending
+    params = models.JSONField(default=dict, blank=True)
+    cache_key = models.CharField(max_length=64, db_index=True) # sha256 of report_type + params
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
+    result_file = models.FileField(upload_to='reports/', storage=ReportFileStorage(), blank=True, null=True)
+    row_count = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='report_jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.report_type} #{self.id} - {self.status}"
+
+class ShipmentJob(models.Model):
+    """One courier booking requested from the admin, run off the request thread by orders.shipping."""
+    STATUS_CHOICES = ReportJob.STATUS_CHOICES
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='shipment_jobs')
+    courier_name = models.CharField(max_length=50)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
+    tracking_number = models.CharField(max_length=100, blank=True)
+    label_url = models.CharField(max_length=500, blank=True)
+    error = models.TextField(blank=True)
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='shipment_jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Shipment for order #{self.order_id} via {self.courier_name} - {self.status}"
+
+@receiver(post_save, sender=Order)
+def refresh_followup_queues_for_order(sender, instance, created, **kwargs):
+    # A brand new order only matters to the call queue if it was recorded as already Delivered,
+    # but it always moves the customer's recency/frequency
+    if created and instance.status != 'Delivered':
+        from .followups import refresh_customers
+        refresh_customers([instance.customer_id])
+        return
+    from .followups import orders_changed
+    orders_changed([instance.pk], [instance.customer_id])
+
+@receiver(post_delete, sender=Order)
+def refresh_customer_stats_for_order(sender, instance, **kwargs):
+    from .followups import refresh_customers
+    refresh_customers([instance.customer_id])
+
+@receiver(post_save, sender=FollowUp)
+@receiver(post_delete, sender=FollowUp)
+def refresh_followup_queues(sender, instance, origin=None, **kwargs):
+    from .followups import refresh_pending, refresh_customers
+    refresh_pending([instance.order_id])
+    # Follow-ups cascading from a deleted customer: their stats row goes with them
+    if origin is None or origin is instance or getattr(origin, 'model', None) is FollowUp:
+        refresh_customers([instance.customer_id])
+
+@receiver(post_save, sender=PaymentSettings)
+@receiver(post_delete, sender=PaymentSettings)
+def invalidate_payment_settings(sender, **kwargs):
+    from content.singletons import invalidate
+    invalidate(sender)
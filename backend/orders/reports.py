@@ -1,12 +1,221 @@
-from rest_framework import viewsets, status
+import csv
+from rest_framework import viewsets, mixins, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAdminUser
-from django.db.models import Sum, Count, F, ExpressionWrapper, DecimalField
+from rest_framework.utils.encoders import JSONEncoder
+from django.http import StreamingHttpResponse, FileResponse
+from django.db.models import Sum, Count, Max, F, Value, ExpressionWrapper, DecimalField
+from django.db.models.functions import Coalesce
 from django.utils import timezone
-from datetime import timedelta
-from .models import Order
-from store.models import Product
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import ValidationError
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from .models import Order, OrderItem, ReportJob
+from .serializers import ReportJobSerializer
+from .followups import pending_orders
+from .views import StandardResultsSetPagination
+from store.models import Product, effective_stock_expression
+
+def day_bounds(field, start_date=None, end_date=None):
+    """
+    Filter kwargs for whole days [start_date, end_date] on a datetime field.
+    A plain range rather than `__date`, so the created_at indexes can serve it.
+    """
+    tz = timezone.get_current_timezone()
+    bounds = {}
+    for name, value, lookup, offset in (('start_date', start_date, 'gte', 0), ('end_date', end_date, 'lt', 1)):
+        if not value:
+            continue
+        try:
+            day = parse_date(str(value))
+        except ValueError:
+            day = None
+        if day is None:
+            raise ValidationError({name: 'Expected a date as YYYY-MM-DD.'})
+        bounds[f'{field}__{lookup}'] = timezone.make_aware(datetime.combine(day + timedelta(days=offset), time.min), tz)
+    return bounds
+
+
+LEDGER_FIELDS = ['id', 'date', 'customer', 'items', 'total', 'status']
+LEDGER_CHUNK_SIZE = 2000
+
+
+def ledger_queryset(params):
+    """
+    Orders for the sales ledger with the item count summed in SQL.
+    params: any mapping with .get (request.query_params works)
+    """
+    queryset = Order.objects.all().order_by('-created_at')
+
+    start_date = params.get('start_date')
+    end_date = params.get('end_date')
+    status_param = params.get('status')
+
+    queryset = queryset.filter(**day_bounds('created_at', start_date, end_date))
+    if status_param and status_param != 'all':
+        queryset = queryset.filter(status=status_param)
+
+    return queryset.annotate(
+        item_count=Coalesce(Sum('items__quantity'), 0)
+    ).values('id', 'created_at', 'customer_name', 'item_count', 'total', 'status')
+
+
+def ledger_row(values):
+    return {
+        'id': values['id'],
+        'date': values['created_at'].date(),
+        'customer': values['customer_name'],
+        'items': values['item_count'],
+        'total': values['total'],
+        'status': values['status']
+    }
+
+
+def iter_ledger_rows(params):
+    # Built (and the dates validated) on call, not on first next(): a bad date is a 400, not a broken stream
+    queryset = ledger_queryset(params)
+    # Server-side chunks keep memory flat no matter how long the range is
+    return (ledger_row(values) for values in queryset.iterator(chunk_size=LEDGER_CHUNK_SIZE))
+
+
+def stream_json(rows):
+    encoder = JSONEncoder()
+    yield '['
+    for index, row in enumerate(rows):
+        yield (',' if index else '') + encoder.encode(row)
+    yield ']'
+
+
+class _Echo:
+    # csv.writer only needs an object with write(); hand the line straight back
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows, fields):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([row[f] for f in fields])
+
+
+VELOCITY_FIELDS = ['name', 'sold', 'revenue', 'stock']
+
+
+def velocity_queryset(params):
+    """
+    Units sold and revenue per product, most sold first, as one SQL query.
+    params: start_date, end_date, limit
+    """
+    items = OrderItem.objects.filter(order__status__in=['Shipped', 'Delivered', 'Processing', 'Pending']) # Exclude cancelled?
+
+    start_date = params.get('start_date')
+    end_date = params.get('end_date')
+
+    items = items.filter(**day_bounds('order__created_at', start_date, end_date))
+
+    # Aggregate in the DB: one row per product, stock joined in the same query.
+    # Revenue is summed as Decimal and only converted for the JSON payload.
+    line_total = ExpressionWrapper(F('price') * F('quantity'), output_field=DecimalField(max_digits=14, decimal_places=2))
+    grouped = items.filter(product__isnull=False).values('product').annotate(
+        name=Max('product_name'),
+        sold=Sum('quantity'),
+        revenue=Sum(line_total),
+        stock=F('product__stock_quantity'),
+    ).values('name', 'sold', 'revenue', 'stock')
+
+    # Lines whose product was deleted are grouped by the name they were sold under
+    orphans = items.filter(product__isnull=True).values('product_name').annotate(
+        name=F('product_name'),
+        sold=Sum('quantity'),
+        revenue=Sum(line_total),
+        stock=Value(0),
+    ).values('name', 'sold', 'revenue', 'stock')
+
+    rows = grouped.union(orphans, all=True).order_by('-sold', 'name')
+
+    limit = str(params.get('limit') or '')
+    if limit.isdigit():
+        rows = rows[:int(limit)]
+    return rows
+
+
+def velocity_row(row):
+    return {
+        'name': row['name'],
+        'sold': row['sold'],
+        'revenue': float(row['revenue'] or Decimal('0')),
+        'stock': row['stock'] or 0,
+    }
+
+
+def velocity_rows(params):
+    return [velocity_row(row) for row in velocity_queryset(params)]
+
+
+INVENTORY_FIELDS = ['id', 'name', 'sku', 'category', 'stock', 'value', 'status']
+
+
+def inventory_queryset(params):
+    queryset = Product.objects.select_related('category').annotate(
+        effective_stock=effective_stock_expression(),
+    ).annotate(
+        stock_value=ExpressionWrapper(F('price') * F('effective_stock'), output_field=DecimalField(max_digits=14, decimal_places=2)),
+    ).order_by('name')
+
+    # stock_status already respects each product's threshold, manage_stock and variant stock
+    status_param = params.get('status')
+    if status_param in ('Low Stock', 'Out of Stock', 'In Stock'):
+        queryset = queryset.filter(stock_status=status_param)
+    return queryset
+
+
+def inventory_totals(queryset):
+    totals = queryset.aggregate(total_value=Sum('stock_value'), total_stock=Sum('effective_stock'))
+    return {
+        'total_value': float(totals['total_value'] or Decimal('0')),
+        'total_stock': totals['total_stock'] or 0,
+    }
+
+
+def inventory_row(p):
+    return {
+        'id': p.id,
+        'name': p.name,
+        'sku': p.sku or f"SKU-{p.id}",
+        'category': p.category.name if p.category else 'Uncategorized',
+        'stock': p.effective_stock,
+        'value': float(p.stock_value or Decimal('0')),
+        'status': p.stock_status
+    }
+
+
+FOLLOWUP_FIELDS = ['order_id', 'date', 'customer', 'phone', 'total']
+
+
+def iter_followup_rows(params):
+    """Delivered orders still waiting for their post-purchase call."""
+    queryset = pending_orders().values('id', 'created_at', 'customer_name', 'phone', 'total')
+    for values in queryset.iterator(chunk_size=LEDGER_CHUNK_SIZE):
+        yield {
+            'order_id': values['id'],
+            'date': values['created_at'].date(),
+            'customer': values['customer_name'],
+            'phone': values['phone'],
+            'total': values['total'],
+        }
+
+
+# report_type -> (row iterator, csv columns). Used by background report jobs.
+REPORT_BUILDERS = {
+    'sales_ledger': (iter_ledger_rows, LEDGER_FIELDS),
+    'product_velocity': (velocity_rows, VELOCITY_FIELDS),
+    'inventory_audit': (lambda params: (inventory_row(p) for p in inventory_queryset(params).iterator()), INVENTORY_FIELDS),
+    'followup_pending': (iter_followup_rows, FOLLOWUP_FIELDS),
+}
+
 
 class ReportViewSet(viewsets.ViewSet):
     permission_classes = [IsAdminUser]
@@ -15,68 +224,40 @@ class ReportViewSet(viewsets.ViewSet):
     def sales_ledger(self, request):
         """
         Returns filtered list of orders with calculated totals.
-        Query Params: start_date, end_date, status
+        Query Params: start_date, end_date, status, page, page_size, export (json, csv)
         """
-        queryset = Order.objects.all().order_by('-created_at')
-        
-        start_date = request.query_params.get('start_date')
-        end_date = request.query_params.get('end_date')
-        status_param = request.query_params.get('status')
-
-        if start_date:
-            queryset = queryset.filter(created_at__date__gte=start_date)
-        if end_date:
-            queryset = queryset.filter(created_at__date__lte=end_date)
-        if status_param and status_param != 'all':
-            queryset = queryset.filter(status=status_param)
-
-        data = []
-        for order in queryset:
-            data.append({
-                'id': order.id,
-                'date': order.created_at.date(),
-                'customer': order.customer_name,
-                'items': sum(item.quantity for item in order.items.all()),
-                'total': order.total,
-                'status': order.status
-            })
-            
-        return Response(data)
+        export = request.query_params.get('export')
+        if export in ('json', 'csv'):
+            rows = iter_ledger_rows(request.query_params)
+            if export == 'csv':
+                response = StreamingHttpResponse(stream_csv(rows, LEDGER_FIELDS), content_type='text/csv')
+                response['Content-Disposition'] = 'attachment; filename="sales_ledger.csv"'
+            else:
+                response = StreamingHttpResponse(stream_json(rows), content_type='application/json')
+            return response
+
+        if request.query_params.get('page'):
+            paginator = StandardResultsSetPagination()
+            page = paginator.paginate_queryset(ledger_queryset(request.query_params), request)
+            return paginator.get_paginated_response([ledger_row(v) for v in page])
+
+        return Response(list(iter_ledger_rows(request.query_params)))
 
     @action(detail=False, methods=['get'])
     def product_velocity(self, request):
         """
         Returns product sales performance.
-        Query Params: start_date, end_date
+        Query Params: start_date, end_date, limit (top N by units sold), page, page_size
         """
-        # sales logic based on OrderItems
-        from orders.models import OrderItem
-        
-        items = OrderItem.objects.filter(order__status__in=['Shipped', 'Delivered', 'Processing', 'Pending']) # Exclude cancelled?
-        
-        start_date = request.query_params.get('start_date')
-        end_date = request.query_params.get('end_date')
-        
-        if start_date:
-            items = items.filter(order__created_at__date__gte=start_date)
-        if end_date:
-            items = items.filter(order__created_at__date__lte=end_date)
-            
-        # Aggregate
-        stats = {}
-        for item in items:
-            pid = item.product.id if item.product else f"del_{item.id}"
-            if pid not in stats:
-                stats[pid] = {
-                    'name': item.product_name,
-                    'sold': 0,
-                    'revenue': 0,
-                    'stock': item.product.stock_quantity if item.product else 0
-                }
-            stats[pid]['sold'] += item.quantity
-            stats[pid]['revenue'] += float(item.price) * item.quantity
-            
-        return Response(list(stats.values()))
+        rows = velocity_queryset(request.query_params)
+
+        # Pagination is opt-in so existing callers keep getting a plain list
+        if request.query_params.get('page'):
+            paginator = StandardResultsSetPagination()
+            page = paginator.paginate_queryset(rows, request)
+            return paginator.get_paginated_response([velocity_row(row) for row in page])
+
+        return Response([velocity_row(row) for row in rows])
 
     @action(detail=False, methods=['get'])
     def inventory_audit(self, request):
@@ -84,40 +265,83 @@ class ReportViewSet(viewsets.ViewSet):
         Returns inventory status.
         Query Params: status (Low Stock, Out of Stock, In Stock), page, page_size
         """
-        queryset = Product.objects.all().order_by('name')
-        status_param = request.query_params.get('status')
-        
-        # Filter at DB level for better performance
-        if status_param == 'Low Stock':
-            queryset = queryset.filter(stock_quantity__lt=5, stock_quantity__gt=0)
-        elif status_param == 'Out of Stock':
-            queryset = queryset.filter(stock_quantity=0)
-        elif status_param == 'In Stock':
-            queryset = queryset.filter(stock_quantity__gte=5)
+        queryset = inventory_queryset(request.query_params)
 
         # Pagination
         from rest_framework.pagination import PageNumberPagination
         paginator = PageNumberPagination()
         paginator.page_size = 20
         result_page = paginator.paginate_queryset(queryset, request)
-        
-        data = []
-        for p in result_page:
-            stock = p.stock_quantity
-            status = 'In Stock'
-            if stock == 0:
-                status = 'Out of Stock'
-            elif stock < 5:
-                status = 'Low Stock'
-
-            data.append({
-                'id': p.id,
-                'name': p.name,
-                'sku': p.sku or f"SKU-{p.id}",
-                'category': p.category.name if p.category else 'Uncategorized',
-                'stock': stock,
-                'value': float(p.price) * stock,
-                'status': status
-            })
-            
-        return paginator.get_paginated_response(data)
+
+        data = [inventory_row(p) for p in result_page]
+        response = paginator.get_paginated_response(data)
+        response.data['totals'] = inventory_totals(queryset)
+        return response
+
+    @action(detail=False, methods=['get'])
+    def low_stock(self, request):
+        """
+        Lightweight feed of products at or below their low stock threshold, for polling.
+        Query Params: include_out_of_stock (default true), limit (default 100)
+        """
+        statuses = ['Low Stock']
+        if request.query_params.get('include_out_of_stock', 'true').lower() != 'false':
+            statuses.append('Out of Stock')
+
+        limit = request.query_params.get('limit', '100')
+        limit = min(int(limit), 1000) if limit.isdigit() else 100
+
+        # Filtered and ordered on the (stock_status, name) index, no joins
+        rows = Product.objects.filter(stock_status__in=statuses).order_by('stock_status', 'name').annotate(
+            effective_stock=effective_stock_expression()
+        ).values('id', 'name', 'sku', 'effective_stock', 'low_stock_threshold', 'stock_status')[:limit]
+
+        return Response([{
+            'id': r['id'],
+            'name': r['name'],
+            'sku': r['sku'] or f"SKU-{r['id']}",
+            'stock': r['effective_stock'],
+            'threshold': r['low_stock_threshold'],
+            'status': r['stock_status'],
+        } for r in rows])
+
+class ReportJobViewSet(mixins.CreateModelMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Background report generation.
+    POST {report_type, params, refresh} -> job (reused if an identical report is cached or in flight)
+    GET /report-jobs/<id>/ to poll, /report-jobs/<id>/download/ for the CSV once Completed.
+    """
+    queryset = ReportJob.objects.all()
+    serializer_class = ReportJobSerializer
+    permission_classes = [IsAdminUser]
+    pagination_class = StandardResultsSetPagination
+
+    def create(self, request, *args, **kwargs):
+        from .jobs import submit_report
+
+        report_type = request.data.get('report_type')
+        if report_type not in REPORT_BUILDERS:
+            return Response(
+                {'error': f"Unknown report type. Choose one of: {', '.join(REPORT_BUILDERS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        params = request.data.get('params') or {}
+        if not isinstance(params, dict):
+            return Response({'error': 'params must be an object'}, status=status.HTTP_400_BAD_REQUEST)
+        params = {k: v for k, v in params.items() if v not in (None, '')}
+
+        job, created = submit_report(report_type, params, user=request.user, refresh=bool(request.data.get('refresh')))
+        serializer = self.get_serializer(job)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED if created else status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        job = self.get_object()
+        if job.status != 'Completed' or not job.result_file:
+            return Response({'error': f'Report is {job.status}', 'status': job.status}, status=status.HTTP_409_CONFLICT)
+        try:
+            handle = job.result_file.open('rb')
+        except FileNotFoundError:
+            return Response({'error': 'Report file is no longer available, request it again'}, status=status.HTTP_410_GONE)
+        return FileResponse(handle, as_attachment=True, filename=f"{job.report_type}_{job.id}.csv")
@@ -0,0 +1,71 @@
+"""
+Recency / frequency / monetary customer segments over CustomerStats.
+
+Frequency (orders not cancelled) and monetary (delivered total) are stored as
+1-5 scores against the fixed RFM_FREQUENCY_BANDS / RFM_MONETARY_BANDS, so they
+only change when the customer's orders do (orders.followups.refresh_customers).
+Recency depends on today, so segments filter last_order_at by date instead of
+storing a score. Every segment is score IN (...) lists plus one last_order_at
+range, which custstats_rfm_idx answers without touching the table rows.
+Segments may overlap (a champion is also loyal). After changing the bands run
+the rebuild_followup_queues command to rescore everyone.
+"""
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import CustomerStats
+
+ALL_SCORES = (0, 1, 2, 3, 4, 5)
+
+# Days since the last order: min_days <= recency < max_days (None = no limit)
+Segment = namedtuple('Segment', ['frequency', 'monetary', 'min_days', 'max_days'])
+
+SEGMENTS = {
+    'champions': Segment((4, 5), (4, 5), 0, 30),
+    'loyal': Segment((3, 4, 5), ALL_SCORES, 0, 90),
+    'new': Segment((1,), ALL_SCORES, 0, 30),
+    'at_risk': Segment((3, 4, 5), ALL_SCORES, 90, 365),
+    'hibernating': Segment((1, 2), ALL_SCORES, 90, 365),
+    'lost': Segment((1, 2, 3, 4, 5), ALL_SCORES, 365, None),
+}
+
+
+def _score(value, bands):
+    if not value or value <= 0:
+        return 0
+    return 1 + sum(1 for threshold in bands if value >= threshold)
+
+
+def frequency_score(order_count):
+    return _score(order_count, getattr(settings, 'RFM_FREQUENCY_BANDS', (2, 3, 5, 8)))
+
+
+def monetary_score(total):
+    return _score(total, getattr(settings, 'RFM_MONETARY_BANDS', (2000, 5000, 10000, 25000)))
+
+
+def segment_filter(name, prefix='', now=None):
+    """Filter kwargs for the segment; `prefix` is the path to CustomerStats (e.g. 'order_stats__')."""
+    segment = SEGMENTS[name]
+    now = now or timezone.now()
+    kwargs = {
+        f'{prefix}frequency_score__in': segment.frequency,
+        f'{prefix}monetary_score__in': segment.monetary,
+        f'{prefix}last_order_at__lte': now - timedelta(days=segment.min_days),
+    }
+    if segment.max_days is not None:
+        kwargs[f'{prefix}last_order_at__gt'] = now - timedelta(days=segment.max_days)
+    return kwargs
+
+
+def segment_customers(name, now=None):
+    """CustomerStats in the segment, most recent order first."""
+    return CustomerStats.objects.filter(**segment_filter(name, now=now)).order_by('-last_order_at')
+
+
+def segment_counts(now=None):
+    now = now or timezone.now()
+    return {name: CustomerStats.objects.filter(**segment_filter(name, now=now)).count() for name in SEGMENTS}
@@ -1,8 +1,15 @@
+from collections import defaultdict
+from decimal import Decimal
 from rest_framework import serializers
-from django.db.models import Q
-from .models import Order, OrderItem, VerificationLog, PaymentMethod, FollowUp, PaymentSettings
+from django.db import transaction
+from django.db.models import Q, Count
+from .models import Order, OrderItem, OrderEvent, VerificationLog, PaymentMethod, FollowUp, PaymentSettings, ReportJob, ShipmentJob
 from store.models import Product
 from store.serializers import ProductSerializer
+from .customers import resolve_guest, update_profile
+from marketing import coupons
+from .inventory import item_key, normalize_variant, StockMove, VariantResolver, apply_stock_moves
+from .state import TRACKED_FIELDS, InvalidTransition, check_transition, tracked_events, record_created
 
 class OrderItemProductSerializer(serializers.ModelSerializer):
     class Meta:
@@ -26,6 +33,29 @@ class PaymentSettingsSerializer(serializers.ModelSerializer):
         model = PaymentSettings
         fields = '__all__'
 
+class ReportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ReportJob
+        exclude = ['cache_key', 'result_file']
+        read_only_fields = ['status', 'row_count', 'error', 'requested_by', 'created_at', 'started_at', 'finished_at']
+
+class ShipmentJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ShipmentJob
+        fields = '__all__'
+        read_only_fields = ['order', 'courier_name', 'status', 'tracking_number', 'label_url', 'error', 'requested_by', 'created_at', 'started_at', 'finished_at']
+
+
+class OrderEventSerializer(serializers.ModelSerializer):
+    actor_name = serializers.SerializerMethodField()
+
+    class Meta:
+        model = OrderEvent
+        fields = '__all__'
+
+    def get_actor_name(self, obj):
+        return obj.actor.username if obj.actor else 'System'
+
 
 class VerificationLogSerializer(serializers.ModelSerializer):
     admin_name = serializers.SerializerMethodField()
@@ -83,6 +113,71 @@ class FollowUpSerializer(serializers.ModelSerializer):
             'email': obj.customer.email
         }
 
+def item_quantity(item):
+    """Whole, positive quantity of a submitted order line (1 when omitted); ValidationError otherwise."""
+    value = item.get('quantity', 1)
+    try:
+        quantity = int(value)
+    except (TypeError, ValueError):
+        quantity = None
+    if quantity is None or quantity < 1 or str(quantity) != str(value).strip():
+        raise serializers.ValidationError({'items': f'Invalid quantity: {value!r}'})
+    return quantity
+
+def risk_from_counts(total_count, relevant_total, cancelled_count):
+    # If this is the FIRST order, history is empty.
+    if total_count <= 1:
+        return {'score': 100, 'label': 'New User'}
+
+    # Exclude 'Pending' from "history" logic, check completed ones for risk.
+    if not relevant_total:
+        return {'score': 100, 'label': 'No History'}
+
+    success_rate = ((relevant_total - cancelled_count) / relevant_total) * 100
+
+    if success_rate < 50:
+        return {'score': round(success_rate), 'label': 'High Risk'}
+    elif success_rate < 80:
+        return {'score': round(success_rate), 'label': 'Medium Risk'}
+    return {'score': round(success_rate), 'label': 'High Probability'}
+
+
+def batch_risk(orders):
+    """
+    Risk score/label for each order, keyed by order id.
+    History is the customer's orders, or for guests their email (else phone) orders.
+    One grouped query per identity kind instead of several queries per order.
+    """
+    def identity(order):
+        if order.customer_id:
+            return ('customer_id', order.customer_id)
+        if order.email:
+            return ('email', order.email)
+        return ('phone', order.phone)
+
+    keys = {}
+    for order in orders:
+        field, value = identity(order)
+        keys.setdefault(field, set()).add(value)
+
+    counts = {}
+    relevant = ~Q(status='Pending')
+    failed = relevant & (Q(status='Cancelled') | Q(payment_status='Failed'))
+    for field, values in keys.items():
+        rows = Order.objects.filter(**{f'{field}__in': values}).values(field).annotate(
+            total_count=Count('id'),
+            relevant_total=Count('id', filter=relevant),
+            cancelled_count=Count('id', filter=failed),
+        )
+        for row in rows:
+            counts[(field, row[field])] = (row['total_count'], row['relevant_total'], row['cancelled_count'])
+
+    return {
+        order.pk: risk_from_counts(*counts.get(identity(order), (0, 0, 0)))
+        for order in orders
+    }
+
+
 class OrderSerializer(serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
     verification_logs = VerificationLogSerializer(many=True, read_only=True)
@@ -102,6 +197,7 @@ class OrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = '__all__'
+        extra_kwargs = {'discount': {'read_only': True}} # Worked out from coupon_code on create
 
     def get_risk_score(self, obj):
         return self._calculate_risk(obj)['score']
@@ -110,48 +206,26 @@ class OrderSerializer(serializers.ModelSerializer):
         return self._calculate_risk(obj)['label']
 
     def _calculate_risk(self, obj):
-        # Identify customer orders
-        if obj.customer:
-            orders = Order.objects.filter(customer=obj.customer)
-        else:
-            orders = Order.objects.filter(phone=obj.phone) | Order.objects.filter(email=obj.email)
-            if obj.email:
-                orders = orders.filter(email=obj.email) # Refine if email exists
-        
-        # Exclude current order from history analysis? 
-        # Actually user wants "Full Data Full History". 
-        # If this is the FIRST order, history is empty.
-        
-        total_count = orders.count()
-        if total_count <= 1:
-            return {'score': 100, 'label': 'New User'}
-        
-        # Calculate success rate
-        # Exclude 'Pending' from "history" logic usually, but user said "Full History".
-        # Let's check completed ones for risk.
-        completed_or_failed = orders.exclude(status='Pending')
-        if not completed_or_failed.exists():
-             return {'score': 100, 'label': 'No History'}
-
-        cancelled_count = completed_or_failed.filter(Q(status='Cancelled') | Q(payment_status='Failed')).count()
-        relevant_total = completed_or_failed.count()
-        
-        success_rate = ((relevant_total - cancelled_count) / relevant_total) * 100
-        
-        if success_rate < 50:
-            return {'score': round(success_rate), 'label': 'High Risk'}
-        elif success_rate < 80:
-            return {'score': round(success_rate), 'label': 'Medium Risk'}
-        return {'score': round(success_rate), 'label': 'High Probability'}
+        # Risk is computed for the whole page at once (see batch_risk) and kept in the
+        # serializer context, so a list costs a few grouped queries instead of several per row
+        cache = self.context.setdefault('_risk_cache', {})
+        if obj.pk not in cache:
+            instances = [obj]
+            if isinstance(self.parent, serializers.ListSerializer) and self.parent.instance is not None:
+                instances = list(self.parent.instance)
+            cache.update(batch_risk(instances))
+        return cache[obj.pk]
+
+    def _payment_method_names(self):
+        # One query per serializer run instead of a PaymentMethod lookup per row
+        if '_payment_method_names' not in self.context:
+            self.context['_payment_method_names'] = dict(PaymentMethod.objects.values_list('id', 'name'))
+        return self.context['_payment_method_names']
 
     def get_payment_method_label(self, obj):
         method = obj.payment_method
         if method and method.isdigit():
-            try:
-                pm = PaymentMethod.objects.get(id=int(method))
-                return pm.name
-            except PaymentMethod.DoesNotExist:
-                return method
+            return self._payment_method_names().get(int(method), method)
         return method
 
     def to_representation(self, instance):
@@ -181,6 +255,7 @@ class OrderSerializer(serializers.ModelSerializer):
 
         return ret
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         # Check for items in initial_data (raw payload) as 'items' is read-only
         items_data = self.initial_data.get('items')
@@ -189,60 +264,135 @@ class OrderSerializer(serializers.ModelSerializer):
         
         payload_items = items_data if items_data is not None else cart_items
 
+        # Status edits go through the same transition rules as ship/cancel
+        if 'status' in validated_data:
+            try:
+                check_transition(instance.status, validated_data['status'])
+            except InvalidTransition as e:
+                raise serializers.ValidationError({'status': str(e)})
+        before = {field: getattr(instance, field) for field in TRACKED_FIELDS}
+
         # Update Order fields
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         instance.save()
+
+        request = self.context.get('request')
+        actor = request.user if request and request.user.is_authenticated else None
+        OrderEvent.objects.bulk_create(tracked_events(instance.pk, before, validated_data, actor=actor))
         
-        # Handle Items
+        # Handle Items: diff against the existing lines instead of delete + re-create
         if payload_items is not None:
-            instance.items.all().delete()
-            from store.models import Product
-            
-            for item in payload_items:
-                # Robust extraction of Product ID
-                p_id = item.get('id') or item.get('productId')
-                
-                # Robustness: Handle if p_id itself is a dict (nested product object)
-                if isinstance(p_id, dict):
-                    p_id = p_id.get('id')
-
-                # If product is a nested dict (common in frontend state)
-                product_field = item.get('product')
-                if isinstance(product_field, dict):
-                    p_id = product_field.get('id')
-                elif product_field:
-                    p_id = product_field
-
-                if not p_id:
-                    continue # Skip invalid items
-
-                # Robust extraction of other fields
-                qty = item.get('quantity', 1)
-                price = item.get('price', 0)
-                name = item.get('name') or item.get('productName')
-                image = item.get('image')
-
-                # Variant Info
-                v_info = item.get('variantInfo') or item.get('variant_info')
-                
-                try:
-                    product_instance = Product.objects.get(id=p_id)
-                    
-                    OrderItem.objects.create(
-                        order=instance,
-                        product=product_instance,
-                        product_name=name or product_instance.name,
-                        price=price,
-                        quantity=qty,
-                        image=image,
-                        variant_info=v_info
-                    )
-                except Product.DoesNotExist:
-                     continue
+            self._sync_items(instance, payload_items, actor)
 
         return instance
 
+    def _sync_items(self, instance, payload_items, actor):
+        """
+        Diff the submitted lines against the order's current items (keyed by
+        product + variant) and apply bulk creates/updates/deletes. Stock moves
+        by the quantity difference, logged in the same transaction.
+        """
+        wanted = {}
+        for item in payload_items:
+            # Robust extraction of Product ID
+            p_id = item.get('id') or item.get('productId')
+
+            # Robustness: Handle if p_id itself is a dict (nested product object)
+            if isinstance(p_id, dict):
+                p_id = p_id.get('id')
+
+            # If product is a nested dict (common in frontend state)
+            product_field = item.get('product')
+            if isinstance(product_field, dict):
+                p_id = product_field.get('id')
+            elif product_field:
+                p_id = product_field
+
+            if not p_id:
+                continue # Skip invalid items
+
+            v_info = item.get('variantInfo') or item.get('variant_info')
+            key = item_key(p_id, v_info)
+            if key in wanted:
+                wanted[key]['quantity'] += item_quantity(item)
+                continue
+            wanted[key] = {
+                'product_id': p_id,
+                'quantity': item_quantity(item),
+                'price': item.get('price'),
+                'name': item.get('name') or item.get('productName'),
+                'image': item.get('image'),
+                'variant_info': v_info,
+            }
+
+        products = Product.objects.in_bulk([w['product_id'] for w in wanted.values()])
+        products = {str(pk): p for pk, p in products.items()}
+
+        existing = {}
+        to_delete = []
+        for line in instance.items.all():
+            key = item_key(line.product_id, line.variant_info)
+            if key in existing or key not in wanted:
+                to_delete.append(line)
+            else:
+                existing[key] = line
+
+        variant_of = VariantResolver([p.pk for p in products.values()] + [l.product_id for l in to_delete + list(existing.values())])
+        deltas = defaultdict(int)
+        to_create, to_update = [], []
+        for key, data in wanted.items():
+            product = products.get(key[0])
+            if product is None:
+                continue
+            line = existing.pop(key, None)
+            if line is None:
+                to_create.append(OrderItem(
+                    order=instance,
+                    product=product,
+                    product_name=data['name'] or product.name,
+                    price=data['price'] if data['price'] is not None else product.price,
+                    quantity=data['quantity'],
+                    image=data['image'],
+                    variant_info=data['variant_info'],
+                ))
+                deltas[product.pk, variant_of(product.pk, data['variant_info'])] -= data['quantity']
+                continue
+            deltas[product.pk, variant_of(product.pk, line.variant_info)] += line.quantity - data['quantity']
+            new_values = {
+                'product_name': data['name'] or line.product_name,
+                'price': Decimal(str(data['price'])) if data['price'] is not None else line.price,
+                'quantity': data['quantity'],
+                'image': data['image'],
+                'variant_info': data['variant_info'],
+            }
+            if any(getattr(line, f) != v for f, v in new_values.items()):
+                for f, v in new_values.items():
+                    setattr(line, f, v)
+                to_update.append(line)
+        # Lines whose product vanished from the catalogue are dropped, as before
+        to_delete.extend(existing.values())
+        for line in to_delete:
+            if line.product_id:
+                deltas[line.product_id, variant_of(line.product_id, line.variant_info)] += line.quantity
+
+        if to_delete:
+            OrderItem.objects.filter(pk__in=[line.pk for line in to_delete]).delete()
+        if to_update:
+            OrderItem.objects.bulk_update(
+                to_update, ['product_name', 'price', 'quantity', 'image', 'variant_info']
+            )
+        if to_create:
+            OrderItem.objects.bulk_create(to_create)
+
+        # A cancelled order's stock was already returned; edits don't move it again
+        if instance.status != 'Cancelled':
+            note = f'Order #{instance.id} Edited'
+            apply_stock_moves(
+                [StockMove(pid, vid, delta, note) for (pid, vid), delta in deltas.items()], reason='Order', user=actor
+            )
+
+    @transaction.atomic
     def create(self, validated_data):
         # --- BACKEND VALIDATION ---
         # Ensure shipping address is present and not empty
@@ -304,102 +454,31 @@ class OrderSerializer(serializers.ModelSerializer):
         print(f"Shipping Address: {validated_data.get('shipping_address')}")
         print(f"Payment Method: {validated_data.get('payment_method')}")
         
-        # --- UPDATE USER NAME IF GENERIC ---
-        try:
-            user = validated_data.get('customer')
-            
-            # --- NEW: Guest to User Conversion Logic ---
-            if not user:
-                phone = validated_data.get('phone')
-                if phone:
-                    from django.contrib.auth import get_user_model
-                    User = get_user_model()
-                    
-                    # Check if user exists by phone
-                    try:
-                        existing_user = User.objects.get(phone_number=phone)
-                        validated_data['customer'] = existing_user
-                        user = existing_user
-                        print(f"Linked Guest Order to Existing User: {phone}")
-                    except User.DoesNotExist:
-                        # Create new user
-                        try:
-                            # Username must be unique, use phone
-                            new_user = User.objects.create(
-                                username=phone,
-                                phone_number=phone,
-                                first_name=validated_data.get('customer_name', 'Guest').split(' ')[0],
-                                last_name=" ".join(validated_data.get('customer_name', 'Guest').split(' ')[1:])
-                            )
-                            # Set unverifiable password since they didn't set one
-                            new_user.set_unusable_password() 
-                            new_user.save()
-                            
-                            validated_data['customer'] = new_user
-                            user = new_user
-                            print(f"Created New User for Guest Order: {phone}")
-                        except Exception as create_err:
-                            print(f"Error creating user for guest order: {create_err}")
-
-            # Check if user exists
-            if user:
-                ship_addr = validated_data.get('shipping_address', {})
-                # Try to get name from shipping address
-                first_name = ship_addr.get('first_name') or ship_addr.get('firstName')
-                last_name = ship_addr.get('last_name') or ship_addr.get('lastName')
-                
-                # If single 'name' field in address
-                if not first_name and ship_addr.get('name'):
-                    parts = ship_addr.get('name').split(' ')
-                    first_name = parts[0]
-                    last_name = " ".join(parts[1:]) if len(parts) > 1 else ""
-
-                # Fallback to customer_name from order payload if available and valid
-                if not first_name and validated_data.get('customer_name'):
-                    c_name = validated_data.get('customer_name')
-                    # Ensure it's not a generic guest/phone name
-                    if c_name != 'Guest' and not c_name.replace(' ', '').isdigit():
-                         parts = c_name.split(' ')
-                         first_name = parts[0]
-                         last_name = " ".join(parts[1:]) if len(parts) > 1 else ""
-
-                # UPDATE 1: Fields (Name)
-                # Only update if user has no name or has a numeric/guest name
-                current_first = user.first_name
-                if not current_first or current_first.isdigit() or current_first == 'Guest':
-                    if first_name:
-                        user.first_name = first_name
-                        user.last_name = last_name or ""
-                        print(f"Updated User {user.id} name to {first_name} {user.last_name}")
-
-                # UPDATE 2: Address
-                # Only update if user has no shipping address saved
-                if not user.shipping_address or not any(user.shipping_address.values()):
-                    if ship_addr:
-                        # Ensure we save structured data if possible, or just the dict
-                        user.shipping_address = ship_addr
-                        print(f"Updated User {user.id} shipping address")
-                        
-                        # Also set billing if empty
-                        if not user.billing_address:
-                            user.billing_address = ship_addr
-
-                user.save()
-        except Exception as e:
-            print(f"Failed to update user profile from order: {e}")
-            import traceback
-            traceback.print_exc()
-        # --- END UPDATE USER NAME ---
+        # --- LINK / UPDATE CUSTOMER ACCOUNT ---
+        # Guest orders are linked to (or create) the account for their phone; either way the
+        # order's name and address fill in what the profile is missing (orders.customers)
+        user = validated_data.get('customer')
+        if user:
+            update_profile(user, validated_data.get('shipping_address'), validated_data.get('customer_name'))
+        elif validated_data.get('phone'):
+            validated_data['customer'] = resolve_guest(
+                validated_data['phone'], validated_data.get('customer_name'), validated_data.get('shipping_address')
+            )
+        # --- END LINK / UPDATE CUSTOMER ACCOUNT ---
+
+        # Take one use of the coupon in this transaction, so a failed order gives it back
+        if validated_data.get('coupon_code'):
+            try:
+                coupon, amount = coupons.redeem(validated_data['coupon_code'], validated_data.get('subtotal'))
+            except coupons.CouponError as e:
+                from rest_framework.exceptions import ValidationError
+                raise ValidationError({"coupon_code": str(e)})
+            validated_data['coupon_code'] = coupon.code
+            validated_data['discount'] = amount
         
         order = Order.objects.create(**validated_data)
+        record_created(order, actor=request.user if request else None)
         
-        # Helper to normalize variant info for comparison
-        def normalize_variant(v_info):
-            if not v_info: return ""
-            if isinstance(v_info, dict):
-                return str(sorted(v_info.items()))
-            return str(v_info)
-
         # Aggregation Logic
         aggregated_items = {}
         
@@ -414,18 +493,20 @@ class OrderSerializer(serializers.ModelSerializer):
             key = f"{p_id}_{normalize_variant(variant_info)}"
             
             if key in aggregated_items:
-                aggregated_items[key]['quantity'] += int(item.get('quantity', 1))
+                aggregated_items[key]['quantity'] += item_quantity(item)
             else:
                 aggregated_items[key] = {
                     'product_id': p_id,
-                    'quantity': int(item.get('quantity', 1)),
+                    'quantity': item_quantity(item),
                     'price': item.get('price'),
                     'name': item.get('name'),
                     'image': item.get('image'),
                     'variant_info': variant_info
                 }
 
-        from store.models import Product
+        variant_of = VariantResolver([item_data['product_id'] for item_data in aggregated_items.values()])
+        note = f'Order #{order.id} Placed'
+        moves = []
 
         for key, item_data in aggregated_items.items():
             try:
@@ -440,26 +521,34 @@ class OrderSerializer(serializers.ModelSerializer):
                     image=item_data['image'], # Save the specific variant/product image
                     variant_info=item_data['variant_info'] # Save size/color details
                 )
-                
-                # Deduct Stock
-                if product.manage_stock and product.stock_quantity >= item_data['quantity']:
-                    product.stock_quantity -= item_data['quantity']
-                    product.save()
-                    
-                    # Log Config
-                    from store.models import InventoryLog
-                    InventoryLog.objects.create(
-                        product=product,
-                        change_amount=-item_data['quantity'],
-                        reason='Order',
-                        note=f'Order #{order.id} Placed',
-                        user=validated_data.get('customer')
-                    )
+                moves.append(StockMove(product.pk, variant_of(product.pk, item_data['variant_info']), -item_data['quantity'], note))
                 
             except Product.DoesNotExist:
                 print(f"Product {item_data['product_id']} not found for order {order.id}")
                 pass 
+
+        # Deduct Stock (product and matching variant), skipped where stock is short
+        apply_stock_moves(moves, reason='Order', user=validated_data.get('customer'))
                 
         return order
 
 
+
+
+class OrderListSerializer(OrderSerializer):
+    """
+    Slim row for the admin order table (?slim=true): no nested items or logs,
+    just the item count annotated by the list queryset. Details load on retrieve.
+    """
+    items = None
+    verification_logs = None
+    item_count = serializers.IntegerField(read_only=True)
+
+
+class OrderTrackingSerializer(serializers.ModelSerializer):
+    """Public order tracking: status only, no customer details or risk data."""
+    date = serializers.DateTimeField(source='created_at', read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ['id', 'date', 'status', 'payment_status', 'courier_name', 'tracking_number', 'total', 'updated_at']
@@ -1,38 +1,42 @@
-import uuid
-import random
+from .couriers import get_adapter, CourierError
+
 
 class CourierService:
+    """
+    Entry point the views use for courier calls. The actual work is done by the adapter
+    registered for the courier (see orders.couriers); unconfigured couriers are simulated.
+    """
+
     @staticmethod
     def create_shipment(order, courier_name):
         """
-        Simulate creating a shipment with a 3rd party courier.
-        Returns (tracking_number, label_url)
+        Create a shipment with a 3rd party courier.
+        Returns {'tracking_number', 'label_url', 'status'}, raises CourierError on failure.
+        """
+        return get_adapter(courier_name).create_shipment(order)
+
+    @staticmethod
+    def create_shipments(orders, courier_name):
+        """
+        Batched variant: one call for many orders of the same courier.
+        Returns {order_id: shipment dict or {'error': message}}
         """
-        # In a real app, this would make an API call to Pathao/Steadfast/RedX
-        
-        prefix = "TRK"
-        if courier_name.lower() == 'pathao':
-            prefix = "PTH"
-        elif courier_name.lower() == 'steadfast':
-            prefix = "SF"
-        elif courier_name.lower() == 'redx':
-            prefix = "RDX"
-            
-        # Generate a realistic looking tracking number
-        tracking_number = f"{prefix}-{random.randint(100000, 999999)}-{order.id}"
-        
-        # Simulate a label URL (would be a PDF from the courier)
-        label_url = f"https://courier.example.com/labels/{tracking_number}.pdf"
-        
-        return {
-            'tracking_number': tracking_number,
-            'label_url': label_url,
-            'status': 'Pickup Pending'
-        }
+        try:
+            return get_adapter(courier_name).create_shipments(orders)
+        except CourierError as e:
+            return {order.id: {'error': str(e)} for order in orders}
+
+    @staticmethod
+    def track(tracking_numbers, courier_name):
+        """Returns {tracking_number: 'Shipped' | 'Delivered' | 'Returned' | 'Lost'}"""
+        return get_adapter(courier_name).track(tracking_numbers)
 
     @staticmethod
-    def cancel_shipment(tracking_number):
+    def cancel_shipment(tracking_number, courier_name=None):
         """
-        Simulate cancelling a shipment
+        Cancel a shipment. Best effort: returns False if the courier couldn't be reached.
         """
-        return True
+        try:
+            return get_adapter(courier_name).cancel_shipment(tracking_number)
+        except CourierError:
+            return False
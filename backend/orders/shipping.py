@@ -0,0 +1,123 @@
+"""
+Single-order shipping off the request thread.
+
+OrderViewSet.ship only records a ShipmentJob and returns; once the row is
+committed a local worker books the parcel (CourierService.create_shipment, with
+its timeouts, retries and circuit breaker) and moves the order to Shipped. A
+slow or failing courier therefore holds a worker thread here, never an API
+worker. Admins poll /shipment-jobs/<id>/ for the tracking number and label.
+
+Re-running a job is safe: couriers de-duplicate on merchant_order_id. The
+process_shipment_jobs command re-runs jobs a restart left behind.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .couriers import CourierError
+from .models import Order, ShipmentJob
+from .services import CourierService
+from .state import InvalidTransition, check_transition, transition
+
+logger = logging.getLogger(__name__)
+
+IN_FLIGHT = ('Pending', 'Running')
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'SHIPMENT_JOB_WORKERS', 4),
+            thread_name_prefix='shipment-job'
+        )
+    return _executor
+
+
+def request_shipment(order, courier_name, user=None):
+    """
+    Returns (job, created). An order already waiting on a courier gets its existing job back.
+    Raises InvalidTransition if the order can't be shipped.
+    """
+    check_transition(order.status, 'Shipped')
+    in_flight = ShipmentJob.objects.filter(order=order, status__in=IN_FLIGHT).first()
+    if in_flight:
+        return in_flight, False
+
+    job = ShipmentJob.objects.create(
+        order=order,
+        courier_name=courier_name,
+        requested_by=user if user and user.is_authenticated else None
+    )
+    # Only hand the id to a worker once the row is visible to other connections
+    transaction.on_commit(lambda: dispatch(job.id))
+    return job, True
+
+
+def dispatch(job_id):
+    if getattr(settings, 'SHIPMENT_JOBS_SYNC', False):
+        run_shipment_job(job_id)
+    else:
+        get_executor().submit(run_shipment_job, job_id)
+
+
+def run_shipment_job(job_id):
+    close_old_connections()
+    try:
+        # Claim the job; if another worker got it first there is nothing to do
+        claimed = ShipmentJob.objects.filter(id=job_id, status='Pending').update(status='Running', started_at=timezone.now())
+        if not claimed:
+            return
+        job = ShipmentJob.objects.select_related('requested_by').get(id=job_id)
+
+        try:
+            order = Order.objects.get(pk=job.order_id)
+            check_transition(order.status, 'Shipped')
+            shipment = CourierService.create_shipment(order, job.courier_name)
+            try:
+                transition(
+                    order, 'Shipped', actor=job.requested_by,
+                    data={'courier_name': job.courier_name, 'tracking_number': shipment['tracking_number']},
+                    courier_name=job.courier_name, tracking_number=shipment['tracking_number']
+                )
+            except InvalidTransition:
+                # Status changed while the courier call was in flight, release the parcel again
+                CourierService.cancel_shipment(shipment['tracking_number'], job.courier_name)
+                raise
+            job.tracking_number = shipment['tracking_number']
+            job.label_url = shipment.get('label_url') or ''
+            job.status = 'Completed'
+        except (CourierError, InvalidTransition) as e:
+            job.status = 'Failed'
+            job.error = str(e)
+        except Exception as e:
+            logger.exception('Shipment job %s failed', job.id)
+            job.status = 'Failed'
+            job.error = str(e)
+
+        job.finished_at = timezone.now()
+        job.save()
+    finally:
+        close_old_connections()
+
+
+def requeue_stalled():
+    """
+    Run jobs whose worker went away: Pending longer than SHIPMENT_JOB_STALE_SECONDS (the
+    process restarted before a worker picked them up) or Running past SHIPMENT_JOB_TIMEOUT_SECONDS.
+    They run here, one after another. Returns their ids.
+    """
+    now = timezone.now()
+    pending_before = now - timedelta(seconds=getattr(settings, 'SHIPMENT_JOB_STALE_SECONDS', 60))
+    running_before = now - timedelta(seconds=getattr(settings, 'SHIPMENT_JOB_TIMEOUT_SECONDS', 300))
+    ShipmentJob.objects.filter(status='Running', started_at__lt=running_before).update(status='Pending', started_at=None)
+    ids = list(ShipmentJob.objects.filter(status='Pending', created_at__lt=pending_before).order_by('id').values_list('id', flat=True))
+    for job_id in ids:
+        run_shipment_job(job_id)
+    return ids
@@ -0,0 +1,133 @@
+"""
+Order state machine.
+
+Every status/payment/verification/return change goes through apply_changes(), which checks
+the status transition, updates only the changed columns and appends OrderEvent rows in the
+same transaction. Status changes also refresh the follow-up queues (see followups).
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .followups import orders_changed
+from .models import Order, OrderEvent
+
+# status -> statuses it may move to
+TRANSITIONS = {
+    'Pending': {'Processing', 'Shipped', 'Delivered', 'Cancelled'},
+    'Processing': {'Pending', 'Shipped', 'Delivered', 'Cancelled'},
+    'Shipped': {'Delivered', 'Cancelled'}, # Cancelled after shipping = returned parcel
+    'Delivered': {'Cancelled'},
+    'Cancelled': set(),
+}
+
+TRACKED_FIELDS = ('status', 'payment_status', 'verification_status', 'return_status')
+
+
+class InvalidTransition(Exception):
+    pass
+
+
+def check_transition(from_status, to_status):
+    if from_status == to_status:
+        return
+    if to_status not in TRANSITIONS.get(from_status, set()):
+        raise InvalidTransition(f"Cannot move order from {from_status} to {to_status}")
+
+
+def tracked_events(order_id, before, changes, actor=None, data=None):
+    """Unsaved OrderEvent rows for tracked fields in `changes` that differ from `before`."""
+    events = []
+    for field in TRACKED_FIELDS:
+        if field in changes and changes[field] != before.get(field):
+            events.append(OrderEvent(
+                order_id=order_id,
+                event_type=field,
+                from_value=before.get(field) or '',
+                to_value=changes[field] or '',
+                data=data or {},
+                actor=actor,
+            ))
+    return events
+
+
+def apply_changes(order, actor=None, data=None, **changes):
+    """
+    Update `changes` on the order (only those columns) and log events for tracked fields.
+    Raises InvalidTransition if the status move isn't allowed or the order changed underneath us.
+    """
+    actor = actor if actor is not None and actor.is_authenticated else None
+    with transaction.atomic():
+        before = Order.objects.select_for_update().filter(pk=order.pk).values(*TRACKED_FIELDS).get()
+        if 'status' in changes:
+            check_transition(before['status'], changes['status'])
+
+        changes['updated_at'] = timezone.now()
+        # Guard on the status we validated against so concurrent transitions can't both win
+        updated = Order.objects.filter(pk=order.pk, status=before['status']).update(**changes)
+        if not updated:
+            raise InvalidTransition('Order was modified concurrently, reload and retry')
+
+        events = tracked_events(order.pk, before, changes, actor=actor, data=data)
+        OrderEvent.objects.bulk_create(events)
+        if changes.get('status', before['status']) != before['status']:
+            orders_changed([order.pk])
+
+    for field, value in changes.items():
+        setattr(order, field, value)
+    return events
+
+
+def transition(order, to_status, actor=None, data=None, **changes):
+    return apply_changes(order, actor=actor, data=data, status=to_status, **changes)
+
+
+def record_created(order, actor=None):
+    actor = actor if actor is not None and actor.is_authenticated else None
+    return OrderEvent.objects.create(order=order, event_type='created', to_value=order.status, actor=actor)
+
+
+def bulk_transition(updates, to_status, actor=None, data=None, from_statuses=None):
+    """
+    Move many orders to `to_status` with one bulk_update and one event insert.
+    updates: {order_id: {extra field: value}} (use {} for no extra fields)
+    data: optional {order_id: event data}
+    from_statuses: optional narrower set of statuses the move is allowed from
+    Returns (orders moved, {order_id: error}) - orders that can't make the move are left alone.
+    """
+    actor = actor if actor is not None and actor.is_authenticated else None
+    data = data or {}
+    extra_fields = sorted({field for changes in updates.values() for field in changes})
+    errors = {}
+    moved = []
+    events = []
+    now = timezone.now()
+
+    with transaction.atomic():
+        current = Order.objects.select_for_update().filter(pk__in=list(updates)).only('id', *TRACKED_FIELDS, *extra_fields)
+        for order in current:
+            if from_statuses is not None and order.status not in from_statuses:
+                errors[order.pk] = f'Cannot move order from {order.status} to {to_status}'
+                continue
+            try:
+                check_transition(order.status, to_status)
+            except InvalidTransition as e:
+                errors[order.pk] = str(e)
+                continue
+            before = {field: getattr(order, field) for field in TRACKED_FIELDS}
+            changes = dict(updates[order.pk], status=to_status)
+            for field, value in changes.items():
+                setattr(order, field, value)
+            order.updated_at = now
+            events.extend(tracked_events(order.pk, before, changes, actor=actor, data=data.get(order.pk)))
+            moved.append(order)
+
+        if moved:
+            Order.objects.bulk_update(moved, ['status', 'updated_at', *extra_fields], batch_size=500)
+            OrderEvent.objects.bulk_create(events, batch_size=500)
+            orders_changed([order.pk for order in moved])
+
+    moved_ids = {order.pk for order in moved}
+    for order_id in updates:
+        if order_id not in errors and order_id not in moved_ids:
+            errors[order_id] = 'Order not found'
+    return moved, errors
@@ -0,0 +1,90 @@
+"""
+Courier tracking sync: batches in-flight tracking numbers per courier, asks the courier for
+their status and applies Delivered / return transitions in bulk.
+Run periodically through `manage.py sync_tracking`.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .couriers import CourierError
+from .models import Order
+from .services import CourierService
+from .state import bulk_transition
+
+
+def _track_courier(courier_name, tracking_numbers):
+    try:
+        return courier_name, CourierService.track(tracking_numbers, courier_name), None
+    except CourierError as e:
+        return courier_name, {}, str(e)
+    finally:
+        close_old_connections()
+
+
+def sync_tracking(limit=5000, min_interval_minutes=30, couriers=None):
+    """
+    Poll up to `limit` shipped parcels that haven't been checked in `min_interval_minutes`,
+    least recently polled first. Returns a summary dict.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(minutes=min_interval_minutes)
+
+    in_flight = Order.objects.filter(status='Shipped', tracking_number__isnull=False).exclude(tracking_number='')
+    in_flight = in_flight.filter(Q(tracking_polled_at__isnull=True) | Q(tracking_polled_at__lt=cutoff))
+    if couriers:
+        in_flight = in_flight.filter(courier_name__in=couriers)
+    rows = list(
+        in_flight.order_by(F('tracking_polled_at').asc(nulls_first=True), 'id').values_list('id', 'courier_name', 'tracking_number')[:limit]
+    )
+
+    groups = {}
+    order_by_tracking = {}
+    for order_id, courier_name, tracking_number in rows:
+        groups.setdefault(courier_name or 'Manual', []).append(tracking_number)
+        order_by_tracking[tracking_number] = order_id
+
+    statuses = {}
+    errors = {}
+    if groups:
+        max_workers = min(getattr(settings, 'COURIER_MAX_WORKERS', 4), len(groups))
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for courier_name, result, error in pool.map(lambda g: _track_courier(*g), groups.items()):
+                statuses.update(result)
+                if error:
+                    errors[courier_name] = error
+
+    delivered = {}
+    returned = {}
+    event_data = {}
+    for tracking_number, courier_status in statuses.items():
+        order_id = order_by_tracking.get(tracking_number)
+        if order_id is None:
+            continue
+        if courier_status == 'Delivered':
+            delivered[order_id] = {}
+        elif courier_status in ('Returned', 'Lost'):
+            # Same shape as a manual return: Cancelled with a return waiting to be resolved
+            returned[order_id] = {'return_status': 'Pending'}
+        else:
+            continue
+        event_data[order_id] = {'source': 'sync_tracking', 'courier_status': courier_status}
+
+    moved_delivered, _ = bulk_transition(delivered, 'Delivered', data=event_data)
+    moved_returned, _ = bulk_transition(returned, 'Cancelled', data=event_data)
+
+    # Only parcels the courier actually answered for count as polled; failed couriers retry next run
+    polled_ids = [order_by_tracking[tn] for tn in statuses if tn in order_by_tracking]
+    Order.objects.filter(pk__in=polled_ids).update(tracking_polled_at=now)
+
+    return {
+        'checked': len(rows),
+        'polled': len(polled_ids),
+        'delivered': len(moved_delivered),
+        'returned': len(moved_returned),
+        'errors': errors,
+    }
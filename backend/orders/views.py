@@ -1,14 +1,23 @@
 from rest_framework import viewsets, status, filters
-from django.db.models import Sum
+from django.db.models import Sum, Prefetch
+from django.http import FileResponse, HttpResponseNotModified
+from django.db.models.functions import Coalesce
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.throttling import SimpleRateThrottle
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import Order, VerificationLog, PaymentMethod, FollowUp, PaymentSettings
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from .models import Order, OrderItem, OrderEvent, VerificationLog, PaymentMethod, FollowUp, PendingFollowUp, PaymentSettings, ShipmentJob
+from . import followups
+from content.singletons import get_singleton
+from .state import apply_changes, InvalidTransition
 from .serializers import (
-    OrderSerializer, VerificationLogSerializer, PaymentMethodSerializer,
-    FollowUpSerializer, PaymentSettingsSerializer
+    OrderSerializer, OrderListSerializer, OrderTrackingSerializer, OrderEventSerializer, VerificationLogSerializer, PaymentMethodSerializer,
+    FollowUpSerializer, PaymentSettingsSerializer, ShipmentJobSerializer
 )
 
 class StandardResultsSetPagination(PageNumberPagination):
@@ -16,6 +25,21 @@ class StandardResultsSetPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 1000
 
+class OrderTrackRateThrottle(SimpleRateThrottle):
+    """Per-IP limit for the public tracking lookup, logged in or not."""
+    scope = 'order_track'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+def with_order_details(queryset):
+    """Everything OrderSerializer walks per row, loaded in a fixed number of queries."""
+    return queryset.select_related('customer').prefetch_related(
+        Prefetch('items', queryset=OrderItem.objects.select_related('product')),
+        Prefetch('verification_logs', queryset=VerificationLog.objects.select_related('admin_user')),
+    )
+
+
 class OrderViewSet(viewsets.ModelViewSet):
     queryset = Order.objects.all().order_by('-created_at')
     serializer_class = OrderSerializer
@@ -24,6 +48,7 @@ class OrderViewSet(viewsets.ModelViewSet):
     filterset_fields = {
         'status': ['exact'],
         'payment_status': ['exact'],
+        'verification_status': ['exact'],
         'created_at': ['gte', 'lte'],
         'customer__id': ['exact'],
     }
@@ -31,17 +56,32 @@ class OrderViewSet(viewsets.ModelViewSet):
     ordering_fields = ['created_at', 'total', 'status']
     
     def get_permissions(self):
-        if self.action in ['create', 'retrieve', 'proxy_image']: 
+        if self.action in ['create', 'retrieve', 'track', 'proxy_image']: 
             return [AllowAny()] # Allow guests to create, view, and use proxy
         return [IsAuthenticated()] # Admins or Users for list/update
 
+    def is_slim_list(self):
+        return self.action == 'list' and self.request.query_params.get('slim') in ('1', 'true', 'True')
+
+    def get_serializer_class(self):
+        if self.is_slim_list():
+            return OrderListSerializer
+        return super().get_serializer_class()
+
     def get_queryset(self):
         user = self.request.user
         if user.is_staff:
-            return Order.objects.all().order_by('-created_at')
-        if user.is_authenticated:
-            return Order.objects.filter(customer=user).order_by('-created_at')
-        return Order.objects.none() # Guests can't list orders, they only see one after creation via direct ID if allowed
+            queryset = Order.objects.all().order_by('-created_at')
+        elif user.is_authenticated:
+            queryset = Order.objects.filter(customer=user).order_by('-created_at')
+        else:
+            return Order.objects.none() # Guests can't list orders, they only see one after creation via direct ID if allowed
+
+        if self.is_slim_list():
+            return queryset.select_related('customer').annotate(item_count=Coalesce(Sum('items__quantity'), 0))
+        if self.action in ('list', 'retrieve'):
+            return with_order_details(queryset)
+        return queryset
 
     @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
     def stats(self, request):
@@ -73,32 +113,92 @@ class OrderViewSet(viewsets.ModelViewSet):
             # Auto-update status based on outcome
             outcome = serializer.validated_data.get('outcome')
             if outcome == 'Confirmed':
-                order.verification_status = 'Verified'
-                order.save()
+                apply_changes(order, actor=request.user, data={'outcome': outcome}, verification_status='Verified')
             elif outcome in ['Wrong Number', 'No Answer']:
-                order.verification_status = 'Unreachable'
-                order.save()
+                apply_changes(order, actor=request.user, data={'outcome': outcome}, verification_status='Unreachable')
 
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=True, methods=['get'], permission_classes=[IsAdminUser])
+    def events(self, request, pk=None):
+        order = self.get_object()
+        serializer = OrderEventSerializer(order.events.select_related('actor'), many=True)
+        return Response(serializer.data)
+
     @action(detail=True, methods=['post'], permission_classes=[IsAdminUser])
     def ship(self, request, pk=None):
+        """
+        Book the parcel with the courier in the background (orders.shipping) and return the job:
+        202 when queued, 200 if the order already has one in flight. Poll /shipment-jobs/<id>/.
+        """
+        from .shipping import request_shipment
+
         order = self.get_object()
         courier_name = request.data.get('courier_name', 'Manual')
-        
-        from .services import CourierService
-        shipment = CourierService.create_shipment(order, courier_name)
-        
-        order.status = 'Shipped'
-        order.courier_name = courier_name
-        order.tracking_number = shipment['tracking_number']
-        order.save()
-        
+        try:
+            job, created = request_shipment(order, courier_name, user=request.user)
+        except InvalidTransition as e:
+            return Response({'error': str(e)}, status=400)
+        return Response(ShipmentJobSerializer(job).data, status=status.HTTP_202_ACCEPTED if created else status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser])
+    def bulk_ship(self, request):
+        """
+        Ship many orders at once.
+        Body: {order_ids: [..], courier_name: 'Pathao'} and/or {orders: [{id, courier_name}, ..]}
+        Returns per-order results.
+        """
+        default_courier = request.data.get('courier_name', 'Manual')
+        assignments = {}
+        try:
+            for order_id in request.data.get('order_ids') or []:
+                assignments[int(order_id)] = default_courier
+            for entry in request.data.get('orders') or []:
+                assignments[int(entry['id'])] = entry.get('courier_name') or default_courier
+        except (TypeError, ValueError, KeyError):
+            return Response({'error': 'Invalid order ids'}, status=400)
+
+        if not assignments:
+            return Response({'error': 'No orders given'}, status=400)
+        max_orders = getattr(settings, 'BULK_SHIP_MAX_ORDERS', 1000)
+        if len(assignments) > max_orders:
+            return Response({'error': f'At most {max_orders} orders per request'}, status=400)
+
+        from .fulfilment import bulk_ship
+        results = bulk_ship(assignments, actor=request.user)
+        return Response({
+            'shipped': sum(1 for r in results if r['success']),
+            'failed': sum(1 for r in results if not r['success']),
+            'results': results
+        })
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser])
+    def bulk_cancel(self, request):
+        """
+        Cancel many pre-shipping orders at once and restore their stock.
+        Body: {order_ids: [..]}
+        """
+        try:
+            order_ids = list(dict.fromkeys(int(order_id) for order_id in request.data.get('order_ids') or []))
+        except (TypeError, ValueError):
+            return Response({'error': 'Invalid order ids'}, status=400)
+
+        if not order_ids:
+            return Response({'error': 'No orders given'}, status=400)
+        max_orders = getattr(settings, 'BULK_CANCEL_MAX_ORDERS', 1000)
+        if len(order_ids) > max_orders:
+            return Response({'error': f'At most {max_orders} orders per request'}, status=400)
+
+        from .fulfilment import cancel_orders
+        cancelled, errors = cancel_orders(order_ids, actor=request.user)
         return Response({
-            'status': 'Shipped',
-            'tracking_number': order.tracking_number,
-            'label_url': shipment['label_url']
+            'cancelled': len(cancelled),
+            'failed': len(errors),
+            'results': [
+                {'id': order_id, 'success': order_id not in errors, 'error': errors.get(order_id)}
+                for order_id in order_ids
+            ]
         })
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
@@ -107,26 +207,11 @@ class OrderViewSet(viewsets.ModelViewSet):
         
         if order.status in ['Shipped', 'Delivered', 'Cancelled']:
             return Response({'error': 'Cannot cancel order in current status'}, status=400)
-            
-        order.status = 'Cancelled'
-        order.return_status = 'None' # Fix: Do not trigger return logic for pre-shipping cancellation
-        order.loss_amount = 0 # Ensure no loss is calculated
-        order.save()
-        
-        # Restore Stock
-        from store.models import InventoryLog
-        for item in order.items.all():
-            if item.product and item.product.manage_stock:
-                item.product.stock_quantity += item.quantity
-                item.product.save()
-                
-                InventoryLog.objects.create(
-                    product=item.product,
-                    change_amount=item.quantity,
-                    reason='Correction', # Or 'Order Cancelled'
-                    note=f'Order #{order.id} Cancelled',
-                    user=request.user if not request.user.is_anonymous else None
-                )
+
+        from .fulfilment import cancel_orders
+        cancelled, errors = cancel_orders([order.pk], actor=request.user)
+        if errors:
+            return Response({'error': errors[order.pk]}, status=400)
         
         return Response({'status': 'Cancelled'})
 
@@ -138,18 +223,16 @@ class OrderViewSet(viewsets.ModelViewSet):
         if not action or action not in ['Returned', 'Lost']:
             return Response({'error': 'Invalid action. Must be Returned or Lost.'}, status=400)
             
-        order.return_status = action
-        
         if action == 'Returned':
             # Loss is usually just the shipping cost (sunk cost) + fees
-            order.loss_amount = order.shipping_cost # + fee?
+            loss_amount = order.shipping_cost # + fee?
             print(f"Resolving Return: Shipping Cost = {order.shipping_cost}")
         elif action == 'Lost':
             # We lost the goods and the shipping
-            order.loss_amount = order.total
+            loss_amount = order.total
             print(f"Resolving Lost: Total Order Value = {order.total}")
 
-        order.save()
+        apply_changes(order, actor=request.user, data={'loss_amount': str(loss_amount)}, return_status=action, loss_amount=loss_amount)
         print(f"Saved Loss Amount: {order.loss_amount}")
         response_data = {
             'status': f'Return marked as {action}', 
@@ -159,7 +242,7 @@ class OrderViewSet(viewsets.ModelViewSet):
         print(f"DEBUG: resolve_return response: {response_data}")
         return Response(response_data)
 
-    @action(detail=False, methods=['get'], permission_classes=[AllowAny])
+    @action(detail=False, methods=['get'], permission_classes=[AllowAny], throttle_classes=[OrderTrackRateThrottle])
     def track(self, request):
         order_id = request.query_params.get('id')
         phone = request.query_params.get('phone')
@@ -172,50 +255,90 @@ class OrderViewSet(viewsets.ModelViewSet):
             
         # Normalize ID (remove potential #)
         search_id = order_id.strip().replace('#', '')
-        
-        try:
-            # Try to match ID (int or string) and Phone
-            # We filter by `id` or `id` string representation if necessary, but `id` is usually AutoField (int).
-            # If `id` is UUID, it's string. Let's assume int for ID but handle potential ValueError if user sends garbage.
-            
-            # Using filter instead of get to handle potential duplicates or safety
-            orders = Order.objects.filter(id=search_id, phone=phone)
-            
-            if not orders.exists():
-                return Response({'error': 'Order not found with provided details.'}, status=status.HTTP_404_NOT_FOUND)
-                
-            order = orders.first()
-            serializer = self.get_serializer(order)
-            return Response(serializer.data)
-            
+        if not search_id.isdigit():
+            return Response({'error': 'Invalid Order ID format.'}, status=status.HTTP_400_BAD_REQUEST)
+        phone = phone.strip()
+
+        # Short-lived cache (misses included) so refreshes and hammering don't reach the DB
+        cache_key = 'order_track:' + hashlib.sha256(f'{search_id}:{phone}'.encode()).hexdigest()
+        data = cache.get(cache_key)
+        if data is None:
+            # Single primary key lookup; phone is checked on that one row
+            order = Order.objects.filter(id=int(search_id), phone=phone).only(
+                'id', 'created_at', 'status', 'payment_status', 'courier_name', 'tracking_number', 'total', 'updated_at'
+            ).first()
+            data = OrderTrackingSerializer(order).data if order else {}
+            cache.set(cache_key, data, getattr(settings, 'ORDER_TRACK_CACHE_SECONDS', 60))
 
-        except ValueError:
-             return Response({'error': 'Invalid Order ID format.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not data:
+            return Response({'error': 'Order not found with provided details.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(data)
 
     @action(detail=False, methods=['get'], permission_classes=[AllowAny])
     def proxy_image(self, request):
+        """
+        Streams an external image through the on-disk proxy cache.
+        Query Params: url, mode=data_uri (JSON {'image': 'data:...'} for the invoice renderer)
+        """
         url = request.query_params.get('url')
         if not url:
             return Response({'error': 'URL required'}, status=400)
-        
-        import requests
+
+        from .image_proxy import fetch, ImageProxyError
         try:
-            # Basic validation
-            if not url.startswith('http'):
-                return Response({'error': 'Invalid URL'}, status=400)
-                
-            resp = requests.get(url, stream=True, timeout=10)
-            
-            # Convert to Base64
+            handle, content_type, key = fetch(url)
+        except ImageProxyError as e:
+            return Response({'error': str(e)}, status=e.status)
+
+        if request.query_params.get('mode') == 'data_uri':
             import base64
-            encoded = base64.b64encode(resp.content).decode('utf-8')
-            content_type = resp.headers.get('content-type', 'image/jpeg')
-            
-            data_uri = f"data:{content_type};base64,{encoded}"
-            
-            return Response({'image': data_uri})
-        except Exception as e:
-            return Response({'error': str(e)}, status=400)
+            with handle:
+                encoded = base64.b64encode(handle.read()).decode('utf-8')
+            return Response({'image': f"data:{content_type};base64,{encoded}"})
+
+        etag = f'"{key}"'
+        if request.headers.get('If-None-Match') == etag:
+            handle.close()
+            response = HttpResponseNotModified()
+        else:
+            response = FileResponse(handle, content_type=content_type)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'public, max-age=86400'
+        return response
+
+
+class OrderEventViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Event feed for incremental consumers: poll with ?after=<last seen id>.
+    Filters: event_type, to_value, order
+    """
+    queryset = OrderEvent.objects.select_related('actor').order_by('id')
+    serializer_class = OrderEventSerializer
+    permission_classes = [IsAdminUser]
+    pagination_class = StandardResultsSetPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = {
+        'event_type': ['exact'],
+        'to_value': ['exact'],
+        'order': ['exact'],
+    }
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        after = self.request.query_params.get('after')
+        if after and after.isdigit():
+            queryset = queryset.filter(id__gt=int(after))
+        return queryset
+
+
+class ShipmentJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """Courier bookings started by OrderViewSet.ship; poll one for its tracking number and label. Filter: order, status"""
+    queryset = ShipmentJob.objects.all()
+    serializer_class = ShipmentJobSerializer
+    permission_classes = [IsAdminUser]
+    pagination_class = StandardResultsSetPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['order', 'status']
 
 
 class PaymentMethodViewSet(viewsets.ModelViewSet):
@@ -240,9 +363,8 @@ class PaymentSettingsViewSet(viewsets.ModelViewSet):
         return [IsAdminUser()]
 
     def list(self, request, *args, **kwargs):
-        # Always return the single global instance, creating it if needed
-        setting, created = PaymentSettings.objects.get_or_create(id=1)
-        serializer = self.get_serializer(setting)
+        # Always return the single global instance (defaults until an admin saves one)
+        serializer = self.get_serializer(get_singleton(PaymentSettings))
         return Response(serializer.data)
 
     def create(self, request, *args, **kwargs):
@@ -272,6 +394,12 @@ class FollowUpViewSet(viewsets.ModelViewSet):
     }
     pagination_class = StandardResultsSetPagination
 
+    def get_queryset(self):
+        # FollowUpSerializer reads the order, customer and item lines of every row
+        return super().get_queryset().select_related('order', 'customer', 'moderator').prefetch_related(
+            Prefetch('order__items', queryset=OrderItem.objects.only('id', 'order_id', 'quantity', 'product_name'))
+        )
+
     def perform_create(self, serializer):
         serializer.save(moderator=self.request.user)
 
@@ -282,31 +410,15 @@ class FollowUpViewSet(viewsets.ModelViewSet):
         1. Delivered
         2. No 'Post-Purchase' follow-up exists
         """
-        from django.db.models import Subquery, OuterRef
-        
-        # Get orders that are Delivered
-        delivered = Order.objects.filter(status='Delivered')
-        
-        # Exclude if they have a 'Post-Purchase' or successful follow-up attached
-        # Logic: We want orders where NOT EXISTS(FollowUp where order=order and type='Post-Purchase')
-        # OR where existing follow-up is 'Follow Later'
-        
-        # Simplest: Just exclude ones with existing non-later followups of type Post-Purchase
-        completed_followups = FollowUp.objects.filter(
-            order=OuterRef('pk'), 
-            followup_type='Post-Purchase'
-        ).exclude(status='Follow Later')
-        
-        pending_orders = delivered.annotate(
-            has_followup=Subquery(completed_followups.values('id')[:1])
-        ).filter(has_followup__isnull=True).order_by('-created_at')
+        pending_orders = with_order_details(followups.pending_orders())
+        context = self.get_serializer_context()
         
         page = self.paginate_queryset(pending_orders)
         if page is not None:
-            serializer = OrderSerializer(page, many=True)
+            serializer = OrderSerializer(page, many=True, context=context)
             return self.get_paginated_response(serializer.data)
 
-        serializer = OrderSerializer(pending_orders, many=True)
+        serializer = OrderSerializer(pending_orders, many=True, context=context)
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
@@ -316,45 +428,24 @@ class FollowUpViewSet(viewsets.ModelViewSet):
         1. Have at least one Delivered order
         2. Have not been contacted in X days (default 30)
         """
-        from django.utils import timezone
-        from datetime import timedelta
-        from django.db.models import Max, Count, Sum, Q
-        
-        days_threshold = int(request.query_params.get('days', 30))
-        cutoff_date = timezone.now() - timedelta(days=days_threshold)
-        
-        User = Order.customer.field.related_model
-        
-        # Get users with delivered orders
-        active_customers = User.objects.filter(orders__status='Delivered').distinct()
-        
-        # Annotate with last follow-up date
-        customers = active_customers.annotate(
-            last_followup=Max('followups__created_at'),
-            last_order_date=Max('orders__created_at'),
-            total_spent=Sum('orders__total', filter=Q(orders__status='Delivered')),
-            order_count=Count('orders', filter=Q(orders__status='Delivered'))
-        )
-        
-        # Filter: Last follow-up is None OR older than threshold
-        eligible_customers = customers.filter(
-            Q(last_followup__isnull=True) | Q(last_followup__lt=cutoff_date)
-        ).order_by('-last_order_date') 
+        days_threshold = int(request.query_params.get('days', followups.RECURRING_DAYS))
+        eligible_customers = followups.recurring_customers(days_threshold).select_related('customer')
         
         # Manually pagination since we are returning custom data, not Model instances exactly
         page = self.paginate_queryset(eligible_customers)
         if page is not None:
             data = []
-            for c in page:
+            for stats in page:
+                c = stats.customer
                 data.append({
                     'id': c.id,
                     'customerName': c.get_full_name() or c.username,
                     'phone': c.phone_number,
                     'email': c.email,
-                    'last_order_date': c.last_order_date,
-                    'last_followup_date': c.last_followup,
-                    'total_spent': c.total_spent,
-                    'order_count': c.order_count
+                    'last_order_date': stats.last_delivered_order_at,
+                    'last_followup_date': stats.last_followup_at,
+                    'total_spent': stats.delivered_total,
+                    'order_count': stats.delivered_count
                 })
             return self.get_paginated_response(data)
             
@@ -362,36 +453,18 @@ class FollowUpViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def stats(self, request):
-        from django.db.models import Avg, Count, Q, Subquery, OuterRef
+        from django.db.models import Avg
         from django.utils import timezone
         
-        # 1. Pending Post-Purchase Count (Must match 'pending' action logic)
-        delivered = Order.objects.filter(status='Delivered')
-        completed_followups = FollowUp.objects.filter(
-            order=OuterRef('pk'), 
-            followup_type='Post-Purchase'
-        ).exclude(status='Follow Later')
-        
-        pending_count = delivered.annotate(
-            has_followup=Subquery(completed_followups.values('id')[:1])
-        ).filter(has_followup__isnull=True).count()
-        
-        # 2. Recurring Count (Must match 'recurring' action logic)
-        days_threshold = 30
-        cutoff_date = timezone.now() - timezone.timedelta(days=days_threshold)
-        User = Order.customer.field.related_model
-        
-        active_customers = User.objects.filter(orders__status='Delivered').distinct()
+        # 1. Pending Post-Purchase Count (same queue the 'pending' action lists)
+        pending_count = PendingFollowUp.objects.count()
         
-        # We need to count customers where last_followup is null or < cutoff
-        # Efficient approach: Exclude customers who HAVE a recent followup
-        recurring_count = active_customers.exclude(
-            followups__created_at__gte=cutoff_date
-        ).count()
+        # 2. Recurring Count (same filter as the 'recurring' action)
+        recurring_count = followups.recurring_customers().count()
         
         # 3. Calls Today
-        today = timezone.now().date()
-        calls_today = FollowUp.objects.filter(created_at__date=today).count()
+        today_start = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        calls_today = FollowUp.objects.filter(created_at__gte=today_start).count()
         
         # 4. Avg Rating
         avg_rating = FollowUp.objects.aggregate(Avg('rating'))['rating__avg'] or 0
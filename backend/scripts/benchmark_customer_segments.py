@@ -0,0 +1,102 @@
+"""
+RFM segment query timings over a large CustomerStats table (orders.rfm).
+
+Seeds a throwaway SQLite database (never the dev db.sqlite3) with customers and
+their stats rows directly, then times the count and first page of every segment.
+
+    python scripts/benchmark_customer_segments.py --customers 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+import django
+
+# Add the project root to the python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--customers', type=int, default=1000000)
+parser.add_argument('--repeat', type=int, default=3, help='Runs per query; the best time is reported')
+args = parser.parse_args()
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+django.setup()
+
+from django.conf import settings
+db_path = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+settings.DATABASES['default']['NAME'] = db_path
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.utils import timezone
+
+from orders import rfm
+from orders.models import CustomerStats
+
+User = get_user_model()
+
+
+def seed():
+    rng = random.Random(42)
+    now = timezone.now()
+    batch_size = 20000
+    for start in range(0, args.customers, batch_size):
+        stop = min(start + batch_size, args.customers)
+        User.objects.bulk_create([User(username=f'bench{i}', phone_number=f'018{i:08d}') for i in range(start, stop)])
+        ids = User.objects.filter(username__in=[f'bench{i}' for i in range(start, stop)]).values_list('id', flat=True)
+        rows = []
+        for pk in ids:
+            orders = min(int(rng.expovariate(0.5)) + 1, 40)
+            delivered = sum(1 for _ in range(orders) if rng.random() < 0.8)
+            total = Decimal(delivered * rng.randrange(500, 4000))
+            last = now - timedelta(minutes=rng.randrange(3 * 365 * 24 * 60))
+            rows.append(CustomerStats(
+                customer_id=pk, order_count=orders, cancelled_count=orders - delivered,
+                delivered_count=delivered, delivered_total=total,
+                first_order_at=last - timedelta(days=rng.randrange(400)), last_order_at=last,
+                last_delivered_order_at=last if delivered else None,
+                frequency_score=rfm.frequency_score(orders), monetary_score=rfm.monetary_score(total),
+            ))
+        CustomerStats.objects.bulk_create(rows)
+
+
+def best_of(fn):
+    best = None
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def main():
+    print(f'Building {db_path} with {args.customers} customers...')
+    call_command('migrate', verbosity=0)
+    started = time.perf_counter()
+    seed()
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    print(f'Seeded in {time.perf_counter() - started:.0f}s\n')
+
+    print(f"{'segment':12} {'customers':>10} {'count ms':>9} {'page ms':>8}  plan")
+    for name in rfm.SEGMENTS:
+        queryset = rfm.segment_customers(name)
+        count = queryset.count()
+        count_ms = best_of(lambda: queryset.count())
+        page_ms = best_of(lambda: list(queryset.all()[:50]))
+        plan = queryset.values('customer_id').explain().splitlines()[0]
+        print(f'{name:12} {count:10} {count_ms:9.1f} {page_ms:8.1f}  {plan}')
+
+    os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
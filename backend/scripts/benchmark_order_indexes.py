@@ -0,0 +1,166 @@
+"""
+Query plans and timings for the hot order filters, before and after the
+0013_order_hot_filter_indexes migration.
+
+Seeds a throwaway SQLite database (never the dev db.sqlite3), runs each query
+shape used by OrderViewSet, ReportViewSet, FollowUpViewSet and batch_risk with
+orders at 0012, then migrates to 0013 and runs them again.
+
+    python scripts/benchmark_order_indexes.py --orders 500000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+import django
+
+# Add the project root to the python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--orders', type=int, default=500000)
+parser.add_argument('--customers', type=int, default=50000)
+parser.add_argument('--db', help='SQLite file to build (default: a temp file, removed afterwards)')
+parser.add_argument('--repeat', type=int, default=3, help='Runs per query; the best time is reported')
+args = parser.parse_args()
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+django.setup()
+
+from django.conf import settings
+db_path = args.db or os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+settings.DATABASES['default']['NAME'] = db_path
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from orders.models import Order, FollowUp
+from orders.reports import day_bounds
+
+User = get_user_model()
+STATUSES = ['Pending'] * 2 + ['Processing'] + ['Shipped'] * 2 + ['Delivered'] * 10 + ['Cancelled'] * 2
+PAYMENT_STATUSES = ['Pending'] * 6 + ['Paid'] * 3 + ['Failed']
+VERIFICATION_STATUSES = ['Verified'] * 8 + ['Pending', 'Unreachable']
+
+
+def seed():
+    rng = random.Random(42)
+    now = timezone.now()
+    User.objects.bulk_create([
+        User(username=f'bench{i}', phone_number=f'018{i:08d}', email=f'bench{i}@example.com')
+        for i in range(args.customers)
+    ], batch_size=5000)
+    customer_ids = list(User.objects.values_list('id', flat=True))
+
+    # Spread orders over two years; created_at is auto_now_add, so switch that off while seeding
+    Order._meta.get_field('created_at').auto_now_add = False
+    batch = []
+    for i in range(args.orders):
+        guest = rng.random() < 0.4
+        customer_id = None if guest else rng.choice(customer_ids)
+        n = rng.randrange(args.customers)
+        batch.append(Order(
+            customer_id=customer_id,
+            customer_name=f'Customer {n}',
+            phone=f'017{n:08d}',
+            email=f'guest{n}@example.com' if guest and rng.random() < 0.5 else None,
+            status=rng.choice(STATUSES),
+            payment_status=rng.choice(PAYMENT_STATUSES),
+            verification_status=rng.choice(VERIFICATION_STATUSES),
+            payment_method='Cash on Delivery',
+            subtotal=Decimal('1000'), total=Decimal('1060'),
+            created_at=now - timedelta(minutes=rng.randrange(2 * 365 * 24 * 60)),
+        ))
+        if len(batch) == 10000:
+            Order.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        Order.objects.bulk_create(batch)
+    Order._meta.get_field('created_at').auto_now_add = True
+
+
+def pending_followup_orders():
+    # The 0012-era pending follow-up query (since replaced by the PendingFollowUp queue)
+    completed = FollowUp.objects.filter(order=OuterRef('pk'), followup_type='Post-Purchase').exclude(status='Follow Later')
+    return Order.objects.filter(status='Delivered').annotate(
+        has_followup=Subquery(completed.values('id')[:1])
+    ).filter(has_followup__isnull=True).order_by('-created_at')
+
+
+def query_shapes():
+    sample = Order.objects.filter(customer__isnull=True).values_list('phone', 'email')[:25]
+    phones = [phone for phone, _ in sample]
+    emails = [email for _, email in sample if email] or ['guest1@example.com']
+    customer_id = Order.objects.exclude(customer=None).values_list('customer_id', flat=True).first()
+    last_month = (timezone.now() - timedelta(days=30)).date()
+
+    relevant = ~Q(status='Pending')
+    failed = relevant & (Q(status='Cancelled') | Q(payment_status='Failed'))
+    counts = dict(total_count=Count('id'), relevant_total=Count('id', filter=relevant), cancelled_count=Count('id', filter=failed))
+
+    newest = Order.objects.order_by('-created_at')
+    return [
+        ('admin list', newest.values('id')[:25]),
+        ('admin list ?status', newest.filter(status='Pending').values('id')[:25]),
+        ('admin list ?payment_status', newest.filter(payment_status='Failed').values('id')[:25]),
+        ('admin list ?verification_status', newest.filter(verification_status='Unreachable').values('id')[:25]),
+        ('sales ledger, last 30 days', newest.filter(**day_bounds('created_at', last_month)).values('id', 'total')),
+        ('customer order list', newest.filter(customer_id=customer_id).values('id')[:25]),
+        ('risk counts by phone', Order.objects.filter(phone__in=phones).values('phone').annotate(**counts)),
+        ('risk counts by email', Order.objects.filter(email__in=emails).values('email').annotate(**counts)),
+        ('pending follow-ups', pending_followup_orders().values('id')[:25]),
+    ]
+
+
+def measure(label):
+    results = {}
+    for name, queryset in query_shapes():
+        plan = queryset.explain()
+        best = None
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            list(queryset.all())  # fresh clone, not the result cache
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = (plan, best)
+    print(f'\n=== {label} ===')
+    for name, (plan, best) in results.items():
+        print(f'\n-- {name}: {best * 1000:.1f} ms')
+        print(plan)
+    return results
+
+
+def main():
+    print(f'Building {db_path} with {args.orders} orders...')
+    call_command('migrate', verbosity=0)
+    call_command('migrate', 'orders', '0012', verbosity=0)
+    started = time.perf_counter()
+    seed()
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    print(f'Seeded in {time.perf_counter() - started:.0f}s')
+
+    before = measure('before (orders 0012)')
+    call_command('migrate', 'orders', '0013', verbosity=0)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    after = measure('after (orders 0013)')
+
+    print('\n=== summary (best of %d) ===' % args.repeat)
+    for name in before:
+        print(f'{name:36} {before[name][1] * 1000:9.1f} ms -> {after[name][1] * 1000:9.1f} ms')
+
+    if not args.db:
+        os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
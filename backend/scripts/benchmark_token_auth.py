@@ -0,0 +1,91 @@
+"""
+Requests/second on an authenticated endpoint with DRF's TokenAuthentication versus
+users.authentication.CachedTokenAuthentication.
+
+Runs in-process through the Django test client against a throwaway SQLite
+database (never the dev db.sqlite3), so the numbers are framework + auth + view
+cost without network or server overhead.
+
+    python scripts/benchmark_token_auth.py --requests 5000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import django
+
+# Add the project root to the python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--requests', type=int, default=5000)
+parser.add_argument('--path', default='/api/users/me/')
+parser.add_argument('--repeat', type=int, default=3, help='Runs per variant; the best is reported')
+args = parser.parse_args()
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+django.setup()
+
+from django.conf import settings
+db_path = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+settings.DATABASES['default']['NAME'] = db_path
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import SessionAuthentication, TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from users.authentication import CachedTokenAuthentication
+from users.views import UserViewSet
+
+VARIANTS = [
+    ('TokenAuthentication', TokenAuthentication),
+    ('CachedTokenAuthentication', CachedTokenAuthentication),
+]
+
+
+def run(auth_class, client):
+    UserViewSet.authentication_classes = [auth_class, SessionAuthentication]
+    cache.clear()
+    client.get(args.path) # Warm up (and fill the cache for the cached variant)
+    with CaptureQueriesContext(connection) as ctx:
+        client.get(args.path)
+    queries = len(ctx.captured_queries)
+
+    best = None
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            response = client.get(args.path)
+        elapsed = time.perf_counter() - started
+        assert response.status_code == 200, response.status_code
+        best = elapsed if best is None else min(best, elapsed)
+    return args.requests / best, queries
+
+
+def main():
+    call_command('migrate', verbosity=0)
+    user = get_user_model().objects.create_user('bench', 'bench@example.com', 'password', role='Admin', is_staff=True)
+    token = Token.objects.create(user=user)
+    client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    print(f'{args.requests} x GET {args.path}, best of {args.repeat}')
+    results = {}
+    for name, auth_class in VARIANTS:
+        results[name] = run(auth_class, client)
+        rps, queries = results[name]
+        print(f'{name:28} {rps:8.0f} req/s  {queries} queries/request')
+
+    base, cached = results['TokenAuthentication'][0], results['CachedTokenAuthentication'][0]
+    print(f'speedup: {cached / base:.2f}x')
+    os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:21
+
+from django.db import migrations, models
+from django.db.models import Case, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import LessThanOrEqual
+
+
+def populate_stock_status(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    ProductVariant = apps.get_model('store', 'ProductVariant')
+    variant_stock = Subquery(
+        ProductVariant.objects.filter(product=OuterRef('pk'))
+        .values('product').annotate(total=Sum('stock_quantity')).values('total')[:1]
+    )
+    stock = Coalesce(variant_stock, F('stock_quantity'))
+    Product.objects.update(stock_status=Case(
+        When(manage_stock=False, then=Value('In Stock')),
+        When(LessThanOrEqual(stock, 0), then=Value('Out of Stock')),
+        When(LessThanOrEqual(stock, F('low_stock_threshold')), then=Value('Low Stock')),
+        default=Value('In Stock'),
+        output_field=models.CharField(),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0016_wishlist'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='stock_status',
+            field=models.CharField(choices=[('In Stock', 'In Stock'), ('Low Stock', 'Low Stock'), ('Out of Stock', 'Out of Stock')], default='In Stock', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['stock_status', 'name'], name='product_stock_status_idx'),
+        ),
+        migrations.RunPython(populate_stock_status, migrations.RunPython.noop),
+    ]
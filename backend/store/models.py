@@ -2,7 +2,11 @@ from django.db import models
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.utils import timezone
-from django.db.models.signals import post_save
+from django.db.models import Sum, F, Value, Case, When, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import LessThanOrEqual
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 
 from django.utils.text import slugify
 
@@ -53,12 +57,62 @@ class Brand(models.Model):
     def __str__(self):
         return self.name
 
+def stock_status_for(manage_stock, stock, threshold):
+    # Keep in sync with stock_status_expression() below
+    if not manage_stock:
+        return 'In Stock'
+    if stock <= 0:
+        return 'Out of Stock'
+    if stock <= threshold:
+        return 'Low Stock'
+    return 'In Stock'
+
+
+def variant_stock_subquery():
+    # Total stock across a product's variants, NULL when it has none
+    return Subquery(
+        ProductVariant.objects.filter(product=OuterRef('pk'))
+        .values('product')
+        .annotate(total=Sum('stock_quantity'))
+        .values('total')[:1]
+    )
+
+
+def effective_stock_expression():
+    # Variant products are stocked per combination, simple products on the product row
+    return Coalesce(variant_stock_subquery(), F('stock_quantity'))
+
+
+def stock_status_expression():
+    stock = effective_stock_expression()
+    return Case(
+        When(manage_stock=False, then=Value('In Stock')),
+        When(LessThanOrEqual(stock, 0), then=Value('Out of Stock')),
+        When(LessThanOrEqual(stock, F('low_stock_threshold')), then=Value('Low Stock')),
+        default=Value('In Stock'),
+        output_field=models.CharField(),
+    )
+
+
+def refresh_stock_status(product_ids):
+    """
+    Recompute Product.stock_status in SQL for the given products.
+    Call after bulk/F() stock updates that bypass Product.save().
+    """
+    Product.objects.filter(pk__in=product_ids).update(stock_status=stock_status_expression())
+
+
 class Product(models.Model):
     STATUS_CHOICES = (
         ('draft', 'Draft'),
         ('published', 'Published'),
         ('archived', 'Archived'),
     )
+    STOCK_STATUS_CHOICES = (
+        ('In Stock', 'In Stock'),
+        ('Low Stock', 'Low Stock'),
+        ('Out of Stock', 'Out of Stock'),
+    )
 
     name = models.CharField(max_length=255)
     slug = models.SlugField(unique=True, blank=True)
@@ -78,6 +132,13 @@ class Product(models.Model):
     low_stock_threshold = models.IntegerField(default=2)
     allow_backorders = models.BooleanField(default=False)
     on_sale = models.BooleanField(default=False)
+    # Denormalized from stock/threshold/variants so audits and the low stock feed are an indexed filter
+    stock_status = models.CharField(max_length=20, choices=STOCK_STATUS_CHOICES, default='In Stock')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['stock_status', 'name'], name='product_stock_status_idx'),
+        ]
     
     def save(self, *args, **kwargs):
         # Treat empty string SKU as None to avoid unique constraint on multiple empty SKUs
@@ -93,6 +154,15 @@ class Product(models.Model):
         while Product.objects.filter(slug=self.slug).exclude(pk=self.pk).exists():
             self.slug = f"{original_slug}-{counter}"
             counter += 1
+
+        stock = self.stock_quantity
+        if self.pk:
+            variant_stock = self.product_combinations.aggregate(total=Sum('stock_quantity'))['total']
+            if variant_stock is not None:
+                stock = variant_stock
+        self.stock_status = stock_status_for(self.manage_stock, stock, self.low_stock_threshold)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'stock_status'}
             
         super().save(*args, **kwargs)
     
@@ -120,6 +190,11 @@ class ProductVariant(models.Model):
     def __str__(self):
         return f"{self.product.name} - {self.attributes}"
 
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def update_product_stock_status(sender, instance, **kwargs):
+    refresh_stock_status([instance.product_id])
+
 class Review(models.Model):
     STATUS_CHOICES = (
         ('pending', 'Pending'),
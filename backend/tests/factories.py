@@ -0,0 +1,12 @@
+"""Shared model factories for the API tests."""
+from orders.models import Order
+
+
+def make_order(**kwargs):
+    """A guest order with sensible defaults; pass any Order field to override."""
+    data = {
+        'customer_name': 'Guest', 'phone': '01700000000', 'subtotal': 100, 'total': 100,
+        'shipping_address': {'city': 'Dhaka'},
+    }
+    data.update(kwargs)
+    return Order.objects.create(**data)
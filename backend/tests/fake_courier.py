@@ -0,0 +1,97 @@
+"""
+Local fake courier API speaking the protocol in orders.couriers, for tests.
+
+    server = FakeCourierServer().start()
+    settings.COURIERS = {'pathao': {'base_url': server.url, ...}}
+    server.statuses['PTH-1'] = 'delivered'
+    server.fail_next = 2   # next two requests answer 503
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class FakeCourierServer:
+    def __init__(self, prefix='FAKE'):
+        self.prefix = prefix
+        self.statuses = {}
+        self.requests = []
+        self.fail_next = 0
+        self.reject_order_ids = set()
+        self._counter = 0
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.httpd.server_port}'
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, code, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _should_fail(self):
+                with server._lock:
+                    server.requests.append((self.command, self.path))
+                    if server.fail_next:
+                        server.fail_next -= 1
+                        return True
+                return False
+
+            def do_GET(self):
+                if self._should_fail():
+                    return self._reply(503, {'error': 'unavailable'})
+                parsed = urlparse(self.path)
+                if parsed.path == '/tracking':
+                    numbers = parse_qs(parsed.query).get('tracking_numbers', [''])[0].split(',')
+                    return self._reply(200, {'statuses': {n: server.statuses.get(n, 'in_transit') for n in numbers if n}})
+                self._reply(404, {'error': 'not found'})
+
+            def do_POST(self):
+                if self._should_fail():
+                    return self._reply(503, {'error': 'unavailable'})
+                length = int(self.headers.get('Content-Length') or 0)
+                data = json.loads(self.rfile.read(length) or b'{}')
+                if self.path == '/shipments':
+                    shipments = []
+                    for order in data.get('orders', []):
+                        if order['merchant_order_id'] in server.reject_order_ids:
+                            shipments.append({'merchant_order_id': order['merchant_order_id'], 'error': 'Address not serviceable'})
+                            continue
+                        with server._lock:
+                            server._counter += 1
+                            tracking_number = f'{server.prefix}-{server._counter}'
+                        server.statuses[tracking_number] = 'pickup_pending'
+                        shipments.append({
+                            'merchant_order_id': order['merchant_order_id'],
+                            'tracking_number': tracking_number,
+                            'label_url': f'{server.url}/labels/{tracking_number}.pdf',
+                            'status': 'Pickup Pending',
+                        })
+                    return self._reply(200, {'shipments': shipments})
+                if self.path.startswith('/shipments/') and self.path.endswith('/cancel'):
+                    server.statuses[self.path.split('/')[2]] = 'cancelled'
+                    return self._reply(200, {'ok': True})
+                self._reply(404, {'error': 'not found'})
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,71 @@
+"""
+Local fake SMS gateway speaking the protocol in content.sms, for tests.
+
+    gateway = FakeSMSGateway().start()
+    SMSSettings.objects.create(api_url=gateway.url, api_key='k')
+    gateway.fail_next = 2            # next two requests answer 503
+    gateway.delay = 1.0              # every request takes this long
+    gateway.reject_numbers.add('017..')  # any request including it gets response_code 1001
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class FakeSMSGateway:
+    def __init__(self):
+        self.sent = [] # (number, message) accepted
+        self.calls = [] # numbers per request
+        self.requests = 0
+        self.fail_next = 0
+        self.delay = 0
+        self.reject_numbers = set()
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.httpd.server_port}/api/smsapi'
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, code, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if server.delay:
+                    time.sleep(server.delay)
+                params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+                with server._lock:
+                    server.requests += 1
+                    if server.fail_next:
+                        server.fail_next -= 1
+                        return self._reply(503, {'error': 'unavailable'})
+                    numbers = params.get('number', '').split(',')
+                    server.calls.append(numbers)
+                    if server.reject_numbers.intersection(numbers):
+                        return self._reply(200, {'response_code': 1001, 'error_message': 'Invalid number'})
+                    server.sent.extend((number, params.get('message')) for number in numbers)
+                return self._reply(200, {'response_code': 202, 'success_message': 'SMS Submitted Successfully'})
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
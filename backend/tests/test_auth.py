@@ -0,0 +1,66 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from django.contrib.auth import get_user_model
+from users.checks import check_shared_caches
+
+User = get_user_model()
+
+@override_settings(AUTH_TOKEN_CACHE='default')
+class CachedTokenAuthTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user('rina', 'rina@example.com', 'password', role='Support', is_staff=True)
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_repeat_calls_skip_the_token_lookup(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/users/me/').status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/users/me/')
+        self.assertEqual(response.data['username'], 'rina')
+
+        bad = APIClient()
+        bad.credentials(HTTP_AUTHORIZATION='Token nope')
+        self.assertEqual(bad.get('/api/users/me/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_logout_and_rotation_revoke_the_cached_token(self):
+        self.client.get('/api/users/me/')
+        self.assertEqual(self.client.post('/api/users/logout/').status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get('/api/users/me/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.client.get('/api/users/me/')
+        token.delete()
+        Token.objects.create(user=self.user) # Rotated
+        self.assertEqual(self.client.get('/api/users/me/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_user_changes_are_not_served_stale(self):
+        self.client.get('/api/users/me/')
+        self.user.role = 'Manager'
+        self.user.save()
+        self.assertEqual(self.client.get('/api/users/me/').data['role'], 'Manager')
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/users/me/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(AUTH_TOKEN_CACHE=None)
+    def test_without_a_shared_cache_tokens_are_looked_up_every_time(self):
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                self.assertEqual(self.client.get('/api/users/me/').status_code, status.HTTP_200_OK)
+        self.client.post('/api/users/logout/')
+        self.assertEqual(self.client.get('/api/users/me/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_startup_check_flags_a_per_process_cache(self):
+        # The test settings' default cache is LocMem
+        self.assertEqual([w.id for w in check_shared_caches(None)], ['users.W001'])
+        with override_settings(AUTH_TOKEN_CACHE=None):
+            self.assertEqual(check_shared_caches(None), [])
@@ -1,9 +1,13 @@
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from rest_framework.test import APIClient
 from rest_framework import status
 from django.contrib.auth import get_user_model
-from content.models import Banner, FAQ, StaticPage
+from django.core.cache import cache
+from content import singletons
+from content.models import Banner, FAQ, StaticPage, SMSSettings
+from orders.models import PaymentSettings
+from marketing.models import MarketingSettings
 User = get_user_model()
 
 class BannerAPITest(TestCase):
@@ -57,3 +61,44 @@ class FAQAPITest(TestCase):
         response = self.client.post(self.faq_url, self.faq_data, format='json')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(FAQ.objects.count(), 1)
+
+class SettingsSingletonCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        singletons.reset()
+        self.addCleanup(singletons.reset)
+        self.client = APIClient()
+
+    def test_reads_are_query_free_once_warm(self):
+        self.client.get('/api/payment-settings/')
+        self.client.get('/api/marketing-settings/')
+        singletons.get_singleton(SMSSettings, default=False)
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/payment-settings/')
+            self.client.get('/api/marketing-settings/')
+            self.assertIsNone(singletons.get_singleton(SMSSettings, default=False))
+        self.assertEqual(response.data['inside_dhaka_shipping'], '60.00')
+        # Reading the defaults doesn't create rows
+        self.assertFalse(PaymentSettings.objects.exists())
+        self.assertFalse(MarketingSettings.objects.exists())
+
+    def test_saves_invalidate(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.get('/api/payment-settings/')
+        self.client.force_authenticate(user=admin)
+        self.client.post('/api/payment-settings/', {'inside_dhaka_shipping': '70.00'}, format='json')
+        self.assertEqual(self.client.get('/api/payment-settings/').data['inside_dhaka_shipping'], '70.00')
+
+        # Another process saved: only the version key in the shared cache changes here
+        PaymentSettings.objects.update(inside_dhaka_shipping=80)
+        self.assertEqual(self.client.get('/api/payment-settings/').data['inside_dhaka_shipping'], '70.00')
+        cache.set(singletons._version_key(PaymentSettings), 'other-process', None)
+        self.assertEqual(self.client.get('/api/payment-settings/').data['inside_dhaka_shipping'], '80.00')
+
+    def test_stale_copies_expire_without_the_shared_version(self):
+        # A worker whose cache never sees the bump (per-process LocMem) still reloads after the TTL
+        self.client.get('/api/payment-settings/')
+        PaymentSettings.objects.create(inside_dhaka_shipping=90)
+        with override_settings(LOCAL_CACHE_TTL_SECONDS=0):
+            PaymentSettings.objects.update(inside_dhaka_shipping=95)
+            self.assertEqual(self.client.get('/api/payment-settings/').data['inside_dhaka_shipping'], '95.00')
@@ -0,0 +1,211 @@
+import time
+from unittest import mock
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework import status
+from django.contrib.auth import get_user_model
+from orders.models import Order
+from orders.couriers import CircuitBreaker, get_adapter, reset_adapters, CourierError, CourierUnavailable
+from orders.services import CourierService
+from orders.fulfilment import bulk_ship
+from .fake_courier import FakeCourierServer
+from .factories import make_order
+
+User = get_user_model()
+
+class CourierAdapterTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = FakeCourierServer(prefix='PTH').start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.fail_next = 0
+        self.server.requests.clear()
+        self.override = override_settings(COURIERS={'pathao': {
+            'base_url': self.server.url, 'api_key': 'secret', 'timeout': 2,
+            'max_retries': 2, 'backoff': 0, 'breaker_threshold': 2, 'breaker_reset_seconds': 60,
+        }})
+        self.override.enable()
+        reset_adapters()
+
+    def tearDown(self):
+        self.override.disable()
+        reset_adapters()
+
+    def _ship(self, client, order):
+        with self.captureOnCommitCallbacks(execute=True):
+            return client.post(f'/api/orders/{order.id}/ship/', {'courier_name': 'Pathao'}, format='json')
+
+    @override_settings(SHIPMENT_JOBS_SYNC=True)
+    def test_ship_endpoint_uses_configured_courier(self):
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        order = make_order()
+        response = self._ship(client, order)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        job = client.get(f"/api/shipment-jobs/{response.data['id']}/").data
+        self.assertEqual(job['status'], 'Completed')
+        self.assertTrue(job['tracking_number'].startswith('PTH-'))
+        self.assertTrue(job['label_url'].startswith(self.server.url))
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.tracking_number), ('Shipped', job['tracking_number']))
+
+    def test_ship_endpoint_does_not_wait_for_the_courier(self):
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        order = make_order()
+        response = client.post(f'/api/orders/{order.id}/ship/', {'courier_name': 'Pathao'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], 'Pending')
+        self.assertEqual(self.server.requests, [])
+
+        # A second click gets the job already in flight
+        again = client.post(f'/api/orders/{order.id}/ship/', {'courier_name': 'Pathao'}, format='json')
+        self.assertEqual((again.status_code, again.data['id']), (status.HTTP_200_OK, response.data['id']))
+
+    @override_settings(SHIPMENT_JOBS_SYNC=True)
+    def test_failed_booking_leaves_the_order_alone(self):
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        order = make_order()
+        self.server.reject_order_ids = {str(order.id)}
+        self.addCleanup(setattr, self.server, 'reject_order_ids', set())
+        response = self._ship(client, order)
+
+        job = client.get(f"/api/shipment-jobs/{response.data['id']}/").data
+        self.assertEqual((job['status'], job['error']), ('Failed', 'Address not serviceable'))
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'Pending')
+
+    def test_retries_then_succeeds(self):
+        self.server.fail_next = 2
+        order = make_order()
+        shipment = get_adapter('Pathao').create_shipment(order)
+        self.assertTrue(shipment['tracking_number'].startswith('PTH-'))
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_per_order_errors_and_tracking(self):
+        ok, rejected = make_order(), make_order()
+        self.server.reject_order_ids = {str(rejected.id)}
+        results = get_adapter('pathao').create_shipments([ok, rejected])
+        self.assertEqual(results[rejected.id], {'error': 'Address not serviceable'})
+
+        tracking_number = results[ok.id]['tracking_number']
+        self.server.statuses[tracking_number] = 'delivered'
+        self.assertEqual(get_adapter('pathao').track([tracking_number]), {tracking_number: 'Delivered'})
+        self.server.reject_order_ids = set()
+
+    def test_failed_batch_keeps_earlier_shipments(self):
+        orders = [make_order() for _ in range(3)]
+        adapter = get_adapter('pathao')
+        adapter.batch_size = 2
+        real_request = adapter.request
+        calls = []
+
+        def second_batch_fails(method, path, **kwargs):
+            calls.append(path)
+            if len(calls) == 2:
+                raise CourierError('pathao returned 503')
+            return real_request(method, path, **kwargs)
+
+        with mock.patch.object(adapter, 'request', side_effect=second_batch_fails):
+            results = CourierService.create_shipments(orders, 'Pathao')
+        self.assertTrue(results[orders[0].id]['tracking_number'].startswith('PTH-'))
+        self.assertTrue(results[orders[1].id]['tracking_number'].startswith('PTH-'))
+        self.assertEqual(results[orders[2].id], {'error': 'pathao returned 503'})
+
+    def test_circuit_breaker_opens(self):
+        self.server.fail_next = 100
+        adapter = get_adapter('pathao')
+        for _ in range(2):
+            with self.assertRaises(CourierError):
+                adapter.track(['PTH-1'])
+        calls = len(self.server.requests)
+        with self.assertRaises(CourierUnavailable):
+            adapter.track(['PTH-1'])
+        self.assertEqual(len(self.server.requests), calls)
+
+    def test_half_open_breaker_lets_one_trial_through(self):
+        breaker = CircuitBreaker(threshold=1, reset_after=0.05)
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow()) # The trial
+        self.assertFalse(breaker.allow()) # Everyone else waits for it
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertTrue(breaker.allow())
+        self.assertTrue(breaker.allow())
+
+    def test_bulk_ship_across_couriers_and_simulated_fallback(self):
+        orders = [make_order() for _ in range(3)]
+        results = bulk_ship({orders[0].id: 'Pathao', orders[1].id: 'Pathao', orders[2].id: 'Steadfast'})
+        self.assertTrue(all(r['success'] for r in results), results)
+        self.assertTrue(results[0]['tracking_number'].startswith('PTH-'))
+        # Steadfast isn't configured, so it is simulated with its own prefix
+        self.assertTrue(results[2]['tracking_number'].startswith('SF-'))
+
+
+class TrackingSyncTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = FakeCourierServer(prefix='PTH').start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.requests.clear()
+        self.override = override_settings(COURIERS={'pathao': {'base_url': self.server.url, 'batch_size': 2, 'backoff': 0}})
+        self.override.enable()
+        reset_adapters()
+
+    def tearDown(self):
+        self.override.disable()
+        reset_adapters()
+
+    def _shipped(self, tracking_number, courier='Pathao'):
+        return make_order(status='Shipped', courier_name=courier, tracking_number=tracking_number)
+
+    def test_applies_transitions_in_batches(self):
+        from django.core.management import call_command
+        from io import StringIO
+        from orders.models import OrderEvent
+
+        delivered = self._shipped('PTH-A')
+        returned = self._shipped('PTH-B')
+        moving = [self._shipped(f'PTH-{i}') for i in range(3)]
+        manual = self._shipped('TRK-1', courier='Manual')
+        self.server.statuses.update({'PTH-A': 'delivered', 'PTH-B': 'returned'})
+
+        out = StringIO()
+        call_command('sync_tracking', stdout=out)
+        self.assertIn('1 delivered, 1 returned', out.getvalue())
+        # 5 Pathao parcels, batch size 2 -> 3 tracking calls
+        self.assertEqual(len(self.server.requests), 3)
+
+        delivered.refresh_from_db()
+        returned.refresh_from_db()
+        self.assertEqual(delivered.status, 'Delivered')
+        self.assertEqual((returned.status, returned.return_status), ('Cancelled', 'Pending'))
+        self.assertEqual(OrderEvent.objects.filter(to_value='Delivered').count(), 1)
+        self.assertEqual(Order.objects.filter(status='Shipped').count(), 4)
+        self.assertFalse(Order.objects.filter(tracking_polled_at__isnull=True).exists())
+
+        # Everything was just polled, so the next run has nothing to do
+        self.server.requests.clear()
+        call_command('sync_tracking', stdout=StringIO())
+        self.assertEqual(self.server.requests, [])
@@ -0,0 +1,197 @@
+from datetime import timedelta
+from django.test import TestCase, override_settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework import status
+from django.contrib.auth import get_user_model
+from orders.models import Order, FollowUp, PendingFollowUp, CustomerStats
+from orders.state import transition, bulk_transition
+from orders import followups, rfm
+from .factories import make_order
+
+User = get_user_model()
+
+class FollowUpQueueTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_authenticate(user=self.admin)
+        self.customer = User.objects.create(username='rina', phone_number='01711111111', first_name='Rina')
+
+    def test_pending_queue_follows_delivery_and_calls(self):
+        order = make_order(customer=self.customer, status='Shipped')
+        self.assertFalse(PendingFollowUp.objects.exists())
+
+        transition(order, 'Delivered')
+        response = self.client.get('/api/followups/pending/')
+        self.assertEqual([row['id'] for row in response.data['results']], [order.id])
+
+        # 'Follow Later' keeps the order queued; a finished call removes it
+        call = FollowUp.objects.create(order=order, customer=self.customer, status='Follow Later')
+        self.assertTrue(PendingFollowUp.objects.filter(order=order).exists())
+        call.status = 'Called - Successful'
+        call.save()
+        self.assertFalse(PendingFollowUp.objects.filter(order=order).exists())
+
+        call.delete()
+        self.assertTrue(PendingFollowUp.objects.filter(order=order).exists())
+
+        transition(order, 'Cancelled')
+        self.assertFalse(PendingFollowUp.objects.exists())
+
+    def test_pending_list_queries_dont_grow_with_the_page(self):
+        from orders.models import OrderItem
+        from store.models import Product
+        product = Product.objects.create(name='Serum', price=100, stock_quantity=10)
+
+        def deliver(count):
+            orders = [make_order(customer=self.customer, status='Shipped') for _ in range(count)]
+            for order in orders:
+                OrderItem.objects.create(order=order, product=product, product_name='Serum', price=100, quantity=1)
+            bulk_transition({o.id: {} for o in orders}, 'Delivered')
+
+        def queries():
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get('/api/followups/pending/')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(response.data['results']), len(ctx.captured_queries)
+
+        deliver(1)
+        rows, one = queries()
+        deliver(4)
+        self.assertEqual(queries(), (5, one))
+
+    def test_recurring_and_stats_read_the_tables(self):
+        other = User.objects.create(username='karim', phone_number='01722222222')
+        orders = [make_order(customer=self.customer, status='Shipped', total=300) for _ in range(2)]
+        orders.append(make_order(customer=other, status='Shipped', total=50))
+        bulk_transition({o.id: {} for o in orders}, 'Delivered')
+
+        stats = CustomerStats.objects.get(customer=self.customer)
+        self.assertEqual((stats.delivered_count, stats.delivered_total), (2, 600))
+
+        FollowUp.objects.create(customer=other, followup_type='Recurring', status='Called - Successful')
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/followups/recurring/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = response.data['results']
+        self.assertEqual([row['id'] for row in rows], [self.customer.id])
+        self.assertEqual(rows[0]['order_count'], 2)
+        self.assertLessEqual(len(ctx.captured_queries), 4)
+
+        response = self.client.get('/api/followups/stats/')
+        self.assertEqual(response.data['pending_count'], 3)
+        self.assertEqual(response.data['recurring_count'], 1)
+        self.assertEqual(response.data['calls_today'], 1)
+
+        # Contacted long ago: due again
+        FollowUp.objects.filter(customer=other).update(created_at=timezone.now() - timedelta(days=45))
+        followups.refresh_customers([other.id])
+        self.assertEqual(followups.recurring_customers().count(), 2)
+
+    def test_rebuild_matches_incremental_state(self):
+        order = make_order(customer=self.customer, status='Delivered')
+        FollowUp.objects.create(customer=self.customer, followup_type='Recurring')
+        before = list(CustomerStats.objects.values_list('customer_id', 'delivered_count', 'last_followup_at'))
+        followups.rebuild()
+        self.assertEqual(list(PendingFollowUp.objects.values_list('order_id', flat=True)), [order.id])
+        self.assertEqual(list(CustomerStats.objects.values_list('customer_id', 'delivered_count', 'last_followup_at')), before)
+
+    def test_deleting_a_customer_with_followups(self):
+        make_order(customer=self.customer, status='Delivered')
+        FollowUp.objects.create(customer=self.customer, followup_type='Recurring')
+        self.customer.delete()
+        self.assertFalse(CustomerStats.objects.exists())
+
+
+class FollowUpListQueryTest(TestCase):
+    def setUp(self):
+        from orders.models import OrderItem
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_authenticate(user=self.admin)
+        self.OrderItem = OrderItem
+
+    def _seed(self, count, offset=0):
+        for i in range(offset, offset + count):
+            customer = User.objects.create(username=f'c{i}', phone_number=f'0180000{i:04d}', first_name=f'C{i}')
+            order = make_order(customer=customer, customer_name=f'C{i}', status='Delivered')
+            self.OrderItem.objects.create(order=order, product_name='Serum', price=100, quantity=2)
+            self.OrderItem.objects.create(order=order, product_name='Toner', price=50, quantity=1)
+            FollowUp.objects.create(order=order, customer=customer, moderator=self.admin, status='Called - Successful')
+        # A follow-up without an order
+        FollowUp.objects.create(customer=customer, followup_type='Recurring')
+
+    def test_page_cost_does_not_grow_with_rows(self):
+        self._seed(3)
+        with CaptureQueriesContext(connection) as small:
+            response = self.client.get('/api/followups/', {'page_size': 50})
+        self._seed(20, offset=3)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get('/api/followups/', {'page_size': 50})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 25)
+        self.assertEqual(len(large.captured_queries), len(small.captured_queries))
+        self.assertLessEqual(len(large.captured_queries), 5)
+
+        rows = {row['order']: row for row in response.data['results']}
+        self.assertEqual(rows[None]['order_items_summary'], 'General Follow-up')
+        with_order = next(row for row in response.data['results'] if row['order'])
+        self.assertEqual(with_order['order_items_summary'], '2x Serum, 1x Toner')
+        self.assertEqual(with_order['customer_details']['name'], with_order['customer_name'])
+
+
+@override_settings(RFM_FREQUENCY_BANDS=(2, 3, 5, 8), RFM_MONETARY_BANDS=(2000, 5000, 10000, 25000))
+class CustomerRFMTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_authenticate(user=self.admin)
+        self.customer = User.objects.create(username='rina', phone_number='01711111111')
+
+    def test_stats_follow_order_writes(self):
+        first = make_order(customer=self.customer, total=3000)
+        stats = CustomerStats.objects.get(customer=self.customer)
+        self.assertEqual((stats.order_count, stats.frequency_score, stats.monetary_score), (1, 1, 0))
+        self.assertEqual(stats.last_order_at, first.created_at)
+
+        second = make_order(customer=self.customer, total=4000)
+        transition(first, 'Delivered')
+        transition(second, 'Cancelled')
+        stats.refresh_from_db()
+        self.assertEqual(
+            (stats.order_count, stats.cancelled_count, stats.delivered_count, stats.delivered_total),
+            (1, 1, 1, 3000)
+        )
+        self.assertEqual((stats.frequency_score, stats.monetary_score), (1, 2))
+        self.assertEqual(stats.last_order_at, first.created_at)
+
+        before = list(CustomerStats.objects.values_list('order_count', 'cancelled_count', 'last_order_at', 'monetary_score'))
+        followups.rebuild()
+        self.assertEqual(list(CustomerStats.objects.values_list('order_count', 'cancelled_count', 'last_order_at', 'monetary_score')), before)
+
+    def test_segments(self):
+        now = timezone.now()
+        regular = User.objects.create(username='karim', phone_number='01722222222')
+        for _ in range(5):
+            make_order(customer=regular, status='Delivered', total=5000)
+        lapsed = User.objects.create(username='old', phone_number='01733333333')
+        old = make_order(customer=lapsed, total=100)
+        Order.objects.filter(pk=old.pk).update(created_at=now - timedelta(days=400))
+        followups.refresh_customers([lapsed.id])
+        make_order(customer=self.customer)
+
+        self.assertEqual(list(rfm.segment_customers('champions').values_list('customer_id', flat=True)), [regular.id])
+        self.assertEqual(list(rfm.segment_customers('new').values_list('customer_id', flat=True)), [self.customer.id])
+        self.assertEqual(list(rfm.segment_customers('lost').values_list('customer_id', flat=True)), [lapsed.id])
+
+        counts = self.client.get('/api/users/segments/').data
+        self.assertEqual((counts['champions'], counts['loyal'], counts['at_risk']), (1, 1, 0))
+        response = self.client.get('/api/users/', {'segment': 'champions'})
+        self.assertEqual([row['id'] for row in response.data['results']], [regular.id])
+        self.assertEqual(response.data['results'][0]['order_count'], 5)
+        self.assertEqual(self.client.get('/api/users/', {'segment': 'vip'}).status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,120 @@
+import os
+import shutil
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework import status
+from orders import image_proxy
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 100
+
+class StubImageHandler(BaseHTTPRequestHandler):
+    hits = 0
+
+    def do_GET(self):
+        StubImageHandler.hits += 1
+        if self.path.startswith('/img'):
+            self._send(200, 'image/png', PNG)
+        elif self.path.startswith('/big'):
+            self._send(200, 'image/png', PNG * 50)
+        elif self.path.startswith('/page'):
+            self._send(200, 'text/html', b'<html></html>')
+        else:
+            self._send(404, 'text/plain', b'missing')
+
+    def _send(self, code, content_type, body):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ImageProxyTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubImageHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f'http://127.0.0.1:{cls.server.server_port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            IMAGE_PROXY_CACHE_DIR=self.cache_dir,
+            IMAGE_PROXY_MAX_IMAGE_BYTES=2000,
+            IMAGE_PROXY_CACHE_MAX_BYTES=250,
+        )
+        self.settings_override.enable()
+        self.client = APIClient()
+        self.url = '/api/orders/proxy_image/'
+        StubImageHandler.hits = 0
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def _get(self, path, **params):
+        return self.client.get(self.url, {'url': self.base + path, **params})
+
+    def test_streams_and_caches(self):
+        response = self._get('/img/1.png')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('max-age', response['Cache-Control'])
+        self.assertEqual(b''.join(response.streaming_content), PNG)
+
+        response = self._get('/img/1.png')
+        self.assertEqual(b''.join(response.streaming_content), PNG)
+        self.assertEqual(StubImageHandler.hits, 1)
+
+        response = self.client.get(self.url, {'url': self.base + '/img/1.png'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_data_uri_mode(self):
+        response = self._get('/img/2.png', mode='data_uri')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['image'].startswith('data:image/png;base64,'))
+
+    def test_rejects_non_images_and_oversized(self):
+        self.assertEqual(self._get('/page').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self._get('/big').status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertEqual(self._get('/missing').status_code, status.HTTP_502_BAD_GATEWAY)
+        self.assertEqual(self.client.get(self.url, {'url': 'file:///etc/passwd'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_lru_eviction_keeps_cache_bounded(self):
+        # Each image is 108 bytes, the cache holds 250
+        for i in range(3):
+            self._get(f'/img/{i}.png')
+        self._get('/img/0.png')
+        self.assertEqual(StubImageHandler.hits, 4)
+        self._get('/img/2.png')
+        self.assertEqual(StubImageHandler.hits, 4)
+
+    def test_evicted_file_still_serves_and_misses_dont_rescan(self):
+        handle, content_type, _ = image_proxy.fetch(self.base + '/img/5.png')
+        # Another request evicts everything between fetch() and the response
+        with override_settings(IMAGE_PROXY_CACHE_MAX_BYTES=0):
+            image_proxy.evict()
+        self.assertEqual(os.listdir(self.cache_dir), [])
+        with handle:
+            self.assertEqual(handle.read(), PNG)
+
+        with mock.patch('orders.image_proxy.os.scandir', wraps=os.scandir) as scandir:
+            self._get('/img/6.png') # Cache well under the limit: no directory scan
+            self.assertEqual(scandir.call_count, 0)
+            self._get('/img/7.png')
+            self._get('/img/8.png') # Over 250 bytes now
+            self.assertEqual(scandir.call_count, 1)
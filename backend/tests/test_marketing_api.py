@@ -4,6 +4,10 @@ from rest_framework.test import APIClient
 from rest_framework import status
 from marketing.models import Coupon
 from django.utils import timezone
+from django.contrib.auth import get_user_model
+from decimal import Decimal
+from marketing import coupons
+from orders.models import Order
 import datetime
 
 class CouponAPITest(TestCase):
@@ -43,3 +47,81 @@ class CouponAPITest(TestCase):
     def test_validate_invalid_code(self):
         response = self.client.post(self.validate_url, {'code': 'INVALID'}, format='json')
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+class CouponEngineTest(TestCase):
+    def setUp(self):
+        coupons.reset()
+        self.addCleanup(coupons.reset)
+        self.client = APIClient()
+        self.today = timezone.now().date()
+        self.limited = Coupon.objects.create(code=' save10 ', discount_type='percentage', value=10,
+                                             min_purchase=500, usage_limit=2, expiry_date=self.today)
+        Coupon.objects.create(code='FLAT50', discount_type='fixed', value=50, expiry_date=self.today)
+
+    def _checkout(self, code, subtotal=1000):
+        payload = {
+            'customer_name': 'Rina', 'phone': '01755555555', 'payment_method': 'cod', 'subtotal': subtotal,
+            'total': subtotal, 'shipping_address': {'name': 'Rina', 'city': 'Dhaka'}, 'cart_items': [], 'coupon_code': code,
+        }
+        return self.client.post('/api/orders/', payload, format='json')
+
+    def test_codes_are_normalized_on_save_and_lookup(self):
+        self.limited.refresh_from_db()
+        self.assertEqual(self.limited.code, 'SAVE10')
+        response = self.client.post('/api/coupons/validate/', {'code': ' Save10', 'subtotal': 800}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['code'], response.data['discount']), ('SAVE10', Decimal('80.00')))
+
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_authenticate(user=admin)
+        response = self.client.post('/api/coupons/', {'code': 'flat50', 'discount_type': 'fixed', 'value': 5,
+                                                      'expiry_date': str(self.today)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('code', response.data)
+
+    def test_validate_many_is_served_from_the_table(self):
+        coupons.table() # Warm
+        with self.assertNumQueries(0):
+            response = self.client.post('/api/coupons/validate-many/',
+                                        {'codes': ['flat50', 'save10', 'FLAT50 ', 'nope'], 'subtotal': 300}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results']
+        self.assertEqual([(r['code'], r['valid']) for r in results], [('FLAT50', True), ('SAVE10', False), ('NOPE', False)])
+        self.assertEqual(results[0]['discount'], Decimal('50'))
+        self.assertIn('Minimum purchase', results[1]['error'])
+
+        # An edit reaches the table without waiting for a reload
+        Coupon.objects.filter(code='FLAT50').get().delete()
+        self.assertFalse(coupons.validate_many(['FLAT50'])[0]['valid'])
+
+    def test_orders_redeem_up_to_the_usage_limit(self):
+        for _ in range(2):
+            response = self._checkout('save10')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        order = Order.objects.latest('id')
+        self.assertEqual((order.coupon_code, order.discount), ('SAVE10', Decimal('100.00')))
+        self.limited.refresh_from_db()
+        self.assertEqual(self.limited.used_count, 2)
+
+        response = self._checkout('SAVE10')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['coupon_code'], 'Coupon usage limit reached')
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_redeem_trusts_the_row_over_a_stale_table(self):
+        coupons.table()
+        # Another process took the last uses; update() sends no signal, so our table still says 0
+        Coupon.objects.filter(pk=self.limited.pk).update(used_count=2)
+        with self.assertRaisesMessage(coupons.CouponError, 'usage limit'):
+            coupons.redeem('SAVE10', 1000)
+        self.limited.refresh_from_db()
+        self.assertEqual(self.limited.used_count, 2)
+        self.assertEqual(coupons.table()['SAVE10'].used_count, 2)
+
+    def test_redeem_refreshes_only_its_own_entry(self):
+        coupons.table()
+        with self.assertNumQueries(2): # The conditional UPDATE, then re-reading that one row
+            coupons.redeem('save10', 1000)
+        with self.assertNumQueries(0):
+            self.assertEqual(coupons.table()['SAVE10'].used_count, 1)
+            self.assertIn('FLAT50', coupons.table())
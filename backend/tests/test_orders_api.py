@@ -0,0 +1,362 @@
+from django.test import TestCase, override_settings
+from django.db import connection
+from django.core.cache import cache
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework import status
+from django.contrib.auth import get_user_model
+from orders.models import Order, OrderItem, OrderEvent, VerificationLog, PaymentMethod
+from store.models import Product
+from .factories import make_order
+
+User = get_user_model()
+
+class AdminOrderListTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_authenticate(user=self.admin)
+        self.url = '/api/orders/'
+        self.product = Product.objects.create(name='Serum', price=100)
+        self.bkash = PaymentMethod.objects.create(name='Bkash')
+
+    def _seed(self, count, offset=0):
+        for i in range(offset, offset + count):
+            customer = User.objects.create(username=f'c{i}', phone_number=f'0180000{i:04d}')
+            order = make_order(customer=customer, phone=customer.phone_number, payment_method=str(self.bkash.id))
+            OrderItem.objects.create(order=order, product=self.product, product_name='Serum', price=100, quantity=2)
+            VerificationLog.objects.create(order=order, admin_user=self.admin, action='Call', outcome='Confirmed')
+
+    def _count_queries(self, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url, params or {})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries), response
+
+    def test_list_query_count_is_constant(self):
+        self._seed(3)
+        small, response = self._count_queries()
+        self._seed(7, offset=3)
+        large, response = self._count_queries()
+        self.assertEqual(small, large)
+        self.assertEqual(len(response.data['results']), 10)
+
+        row = response.data['results'][0]
+        self.assertEqual(row['payment_method_label'], 'Bkash')
+        self.assertEqual(row['items'][0]['product_details']['name'], 'Serum')
+        self.assertEqual(row['verification_logs'][0]['admin_name'], 'admin')
+        self.assertEqual(row['risk_label'], 'New User')
+
+    def test_slim_list(self):
+        self._seed(2)
+        _, response = self._count_queries({'slim': 'true'})
+        row = response.data['results'][0]
+        self.assertNotIn('items', row)
+        self.assertNotIn('verification_logs', row)
+        self.assertEqual(row['item_count'], 2)
+
+    def test_batched_risk_matches_history(self):
+        customer = User.objects.create(username='repeat', phone_number='01900000000')
+        for status_value in ['Delivered', 'Cancelled', 'Cancelled', 'Pending']:
+            make_order(customer=customer, status=status_value)
+
+        response = self.client.get(self.url)
+        labels = {row['risk_label'] for row in response.data['results']}
+        # 1 of 3 finished orders succeeded -> 33%
+        self.assertEqual(labels, {'High Risk'})
+        self.assertEqual(response.data['results'][0]['risk_score'], 33)
+
+
+@override_settings(SHIPMENT_JOBS_SYNC=True)
+class OrderStateMachineTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_authenticate(user=self.admin)
+        self.order = make_order()
+
+    def _ship(self, courier_name):
+        # The courier is booked by a shipment job once the request commits
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(f'/api/orders/{self.order.id}/ship/', {'courier_name': courier_name}, format='json')
+
+    def test_ship_and_deliver_are_logged(self):
+        response = self._ship('Pathao')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        response = self.client.patch(f'/api/orders/{self.order.id}/', {'status': 'Delivered', 'payment_status': 'Paid'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        events = list(OrderEvent.objects.filter(order=self.order).values_list('event_type', 'from_value', 'to_value'))
+        self.assertEqual(events, [
+            ('status', 'Pending', 'Shipped'),
+            ('status', 'Shipped', 'Delivered'),
+            ('payment_status', 'Pending', 'Paid'),
+        ])
+        shipped = OrderEvent.objects.filter(order=self.order).first()
+        self.assertEqual(shipped.data['courier_name'], 'Pathao')
+        self.assertEqual(shipped.actor, self.admin)
+
+    def test_invalid_transitions_are_rejected(self):
+        self.client.post(f'/api/orders/{self.order.id}/cancel/')
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'Cancelled')
+
+        response = self.client.patch(f'/api/orders/{self.order.id}/', {'status': 'Pending'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self._ship('Pathao')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'Cancelled')
+        self.assertEqual(OrderEvent.objects.filter(order=self.order).count(), 1)
+
+    def test_event_feed_is_incremental(self):
+        self.client.post(f'/api/orders/{self.order.id}/add_log/', {'action': 'Call', 'outcome': 'Confirmed'}, format='json')
+        first = OrderEvent.objects.get()
+        self.assertEqual((first.event_type, first.to_value), ('verification_status', 'Verified'))
+
+        self._ship('RedX')
+        response = self.client.get('/api/order-events/', {'after': first.id})
+        self.assertEqual([e['to_value'] for e in response.data['results']], ['Shipped'])
+        response = self.client.get(f'/api/orders/{self.order.id}/events/')
+        self.assertEqual(len(response.data), 2)
+
+
+class BulkShipTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_authenticate(user=self.admin)
+        self.url = '/api/orders/bulk_ship/'
+
+    def test_ships_many_orders_grouped_by_courier(self):
+        orders = [make_order() for _ in range(5)]
+        cancelled = make_order(status='Cancelled')
+        payload = {
+            'order_ids': [o.id for o in orders[:3]] + [cancelled.id, 999999],
+            'courier_name': 'Pathao',
+            'orders': [{'id': orders[3].id, 'courier_name': 'Steadfast'}, {'id': orders[4].id, 'courier_name': 'RedX'}],
+        }
+        with self.settings(COURIER_BATCH_SIZE=2):
+            response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['shipped'], 5)
+        self.assertEqual(response.data['failed'], 2)
+
+        results = {r['id']: r for r in response.data['results']}
+        self.assertTrue(results[orders[0].id]['tracking_number'].startswith('PTH-'))
+        self.assertTrue(results[orders[3].id]['tracking_number'].startswith('SF-'))
+        self.assertFalse(results[cancelled.id]['success'])
+        self.assertEqual(results[999999]['error'], 'Order not found')
+
+        self.assertEqual(Order.objects.filter(status='Shipped').count(), 5)
+        self.assertEqual(Order.objects.get(id=orders[4].id).courier_name, 'RedX')
+        self.assertEqual(OrderEvent.objects.filter(to_value='Shipped').count(), 5)
+
+
+class OrderTrackingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.url = '/api/orders/track/'
+        self.order = make_order(phone='01711111111', tracking_number='PTH-1', status='Shipped')
+
+    def test_public_lookup_is_slim_and_cached(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url, {'id': f'#{self.order.id}', 'phone': '01711111111'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(response.data['tracking_number'], 'PTH-1')
+        self.assertNotIn('shipping_address', response.data)
+        self.assertNotIn('risk_score', response.data)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url, {'id': self.order.id, 'phone': '01711111111'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+    def test_wrong_phone_and_bad_id(self):
+        response = self.client.get(self.url, {'id': self.order.id, 'phone': '01799999999'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(self.url, {'id': 'abc', 'phone': '01711111111'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rate_limited_per_ip(self):
+        for _ in range(30):
+            self.client.get(self.url, {'id': self.order.id, 'phone': '01711111111'})
+        response = self.client.get(self.url, {'id': self.order.id, 'phone': '01711111111'})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        response = self.client.get(self.url, {'id': self.order.id, 'phone': '01711111111'}, REMOTE_ADDR='10.0.0.9')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class OrderItemEditTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_authenticate(user=self.admin)
+        self.serum = Product.objects.create(name='Serum', price=100, manage_stock=True, stock_quantity=10)
+        self.toner = Product.objects.create(name='Toner', price=50, manage_stock=True, stock_quantity=10)
+        self.mask = Product.objects.create(name='Mask', price=30, manage_stock=True, stock_quantity=10)
+        self.order = make_order()
+        self.serum_line = OrderItem.objects.create(order=self.order, product=self.serum, product_name='Serum', price=100, quantity=2)
+        self.toner_line = OrderItem.objects.create(order=self.order, product=self.toner, product_name='Toner', price=50, quantity=1)
+
+    def test_items_are_diffed_and_stock_moves_by_the_difference(self):
+        from store.models import InventoryLog
+        response = self.client.patch(f'/api/orders/{self.order.id}/', {'items': [
+            {'product': self.serum.id, 'quantity': 5, 'price': 100, 'name': 'Serum'},
+            {'product': self.mask.id, 'quantity': 1, 'price': 30, 'name': 'Mask'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        lines = {i.product_id: i for i in self.order.items.all()}
+        self.assertEqual(set(lines), {self.serum.id, self.mask.id})
+        # The serum line is updated in place, not re-created
+        self.assertEqual(lines[self.serum.id].pk, self.serum_line.pk)
+        self.assertEqual(lines[self.serum.id].quantity, 5)
+
+        stock = dict(Product.objects.values_list('id', 'stock_quantity'))
+        self.assertEqual(stock[self.serum.id], 7)
+        self.assertEqual(stock[self.toner.id], 11)
+        self.assertEqual(stock[self.mask.id], 9)
+        logs = dict(InventoryLog.objects.values_list('product_id', 'change_amount'))
+        self.assertEqual(logs, {self.serum.id: -3, self.toner.id: 1, self.mask.id: -1})
+
+    def test_unchanged_items_write_nothing(self):
+        from store.models import InventoryLog
+        response = self.client.patch(f'/api/orders/{self.order.id}/', {'items': [
+            {'product': self.serum.id, 'quantity': 2, 'price': 100, 'name': 'Serum'},
+            {'product': self.toner.id, 'quantity': 1, 'price': 50, 'name': 'Toner'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            set(self.order.items.values_list('pk', flat=True)), {self.serum_line.pk, self.toner_line.pk}
+        )
+        self.assertFalse(InventoryLog.objects.exists())
+        self.assertEqual(Product.objects.get(pk=self.serum.pk).stock_quantity, 10)
+
+    def test_bad_quantities_are_rejected(self):
+        for quantity in (None, 'two', 0, -3, 1.5):
+            response = self.client.patch(f'/api/orders/{self.order.id}/', {'items': [
+                {'product': self.serum.id, 'quantity': quantity, 'price': 100, 'name': 'Serum'},
+            ]}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, quantity)
+            self.assertIn('quantity', str(response.data['items']))
+        self.assertEqual(self.order.items.count(), 2)
+        self.assertEqual(Product.objects.get(pk=self.serum.pk).stock_quantity, 10)
+
+
+class OrderCancelTest(TestCase):
+    def setUp(self):
+        from store.models import ProductVariant
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_authenticate(user=self.admin)
+        self.serum = Product.objects.create(name='Serum', price=100, stock_quantity=5)
+        self.shirt = Product.objects.create(name='Shirt', price=300, stock_quantity=5)
+        self.red_m = ProductVariant.objects.create(product=self.shirt, attributes={'Color': 'Red', 'Size': 'M'}, price=300, stock_quantity=2)
+
+    def _order(self, status='Pending'):
+        order = make_order(status=status, payment_method='Cash on Delivery')
+        OrderItem.objects.create(order=order, product=self.serum, product_name='Serum', price=100, quantity=1)
+        OrderItem.objects.create(
+            order=order, product=self.shirt, product_name='Shirt', price=300, quantity=2,
+            variant_info={'color': 'Red', 'size': 'M'}
+        )
+        return order
+
+    def test_single_cancel_restores_each_line_to_its_own_stock(self):
+        from store.models import InventoryLog, ProductVariant
+        order = self._order()
+        response = self.client.post(f'/api/orders/{order.id}/cancel/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'Cancelled')
+        self.assertEqual(order.return_status, 'None')
+        self.assertEqual(Product.objects.get(pk=self.serum.pk).stock_quantity, 6)
+        # The shirt line is stocked on its variant; the product row isn't touched
+        self.assertEqual(Product.objects.get(pk=self.shirt.pk).stock_quantity, 5)
+        self.assertEqual(ProductVariant.objects.get(pk=self.red_m.pk).stock_quantity, 4)
+        log = InventoryLog.objects.get(product=self.shirt)
+        self.assertEqual((log.variant_id, log.change_amount, log.note), (self.red_m.pk, 2, f'Order #{order.id} Cancelled'))
+
+        response = self.client.post(f'/api/orders/{order.id}/cancel/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_variant_stock_is_checked_apart_from_the_product_row(self):
+        from store.models import ProductVariant
+        Product.objects.filter(pk=self.shirt.pk).update(stock_quantity=0)
+        ProductVariant.objects.filter(pk=self.red_m.pk).update(stock_quantity=5)
+        response = self.client.post('/api/orders/', {
+            'customer_name': 'Rina', 'phone': '01755555555', 'payment_method': 'cod', 'subtotal': 600, 'total': 600,
+            'shipping_address': {'name': 'Rina', 'city': 'Dhaka'},
+            'cart_items': [{'id': self.shirt.id, 'name': 'Shirt', 'price': 300, 'quantity': 2, 'variant_info': {'color': 'Red', 'size': 'M'}}],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertEqual(ProductVariant.objects.get(pk=self.red_m.pk).stock_quantity, 3)
+
+        self.client.post(f"/api/orders/{response.data['id']}/cancel/")
+        self.assertEqual(ProductVariant.objects.get(pk=self.red_m.pk).stock_quantity, 5)
+        self.assertEqual(Product.objects.get(pk=self.shirt.pk).stock_quantity, 0)
+
+    def test_bulk_cancel_in_constant_queries(self):
+        from store.models import InventoryLog
+        orders = [self._order() for _ in range(3)]
+        shipped = self._order(status='Shipped')
+        ids = [o.id for o in orders] + [shipped.id]
+
+        with CaptureQueriesContext(connection) as small:
+            self.client.post('/api/orders/bulk_cancel/', {'order_ids': ids[:1]}, format='json')
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.post('/api/orders/bulk_cancel/', {'order_ids': ids}, format='json')
+        self.assertEqual(len(large.captured_queries), len(small.captured_queries))
+
+        self.assertEqual(response.data['cancelled'], 2)
+        self.assertEqual(response.data['failed'], 2)
+        self.assertEqual(Order.objects.filter(status='Cancelled').count(), 3)
+        self.assertEqual(Order.objects.get(pk=shipped.pk).status, 'Shipped')
+        self.assertEqual(Product.objects.get(pk=self.serum.pk).stock_quantity, 8)
+        self.assertEqual(InventoryLog.objects.count(), 6)
+
+
+class GuestCheckoutTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def _checkout(self, phone='01755555555', name='Rina Akter', address=None):
+        payload = {
+            'customer_name': name, 'phone': phone, 'payment_method': 'cod', 'subtotal': 100, 'total': 160,
+            'shipping_address': address or {'name': name, 'address': 'Road 1', 'city': 'Dhaka'},
+            'cart_items': [],
+        }
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/orders/', payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        user_writes = [q['sql'] for q in ctx.captured_queries
+                       if q['sql'].startswith(('INSERT', 'UPDATE')) and '"users_user"' in q['sql'].split('(')[0]]
+        return Order.objects.get(pk=response.data['id']), user_writes
+
+    def test_new_phone_creates_the_account_in_one_write(self):
+        order, writes = self._checkout()
+        self.assertEqual(len(writes), 1)
+        user = order.customer
+        self.assertEqual((user.username, user.phone_number, user.first_name, user.last_name), ('01755555555', '01755555555', 'Rina', 'Akter'))
+        self.assertFalse(user.has_usable_password())
+        self.assertEqual(user.shipping_address['city'], 'Dhaka')
+
+        # Same phone again: linked to the same account, and nothing to update
+        again, writes = self._checkout()
+        self.assertEqual(again.customer_id, user.id)
+        self.assertEqual([sql for sql in writes if sql.startswith('UPDATE')], [])
+        self.assertEqual(User.objects.filter(phone_number='01755555555').count(), 1)
+
+    def test_existing_account_only_fills_missing_profile_fields(self):
+        user = User.objects.create(username='guest1', phone_number='01755555555', first_name='Guest',
+                                   shipping_address={'city': 'Khulna'})
+        order, writes = self._checkout()
+        self.assertEqual(order.customer_id, user.id)
+        user.refresh_from_db()
+        self.assertEqual((user.first_name, user.last_name), ('Rina', 'Akter'))
+        self.assertEqual(user.shipping_address, {'city': 'Khulna'}) # Already had one
+        self.assertEqual(len([sql for sql in writes if sql.startswith('UPDATE')]), 1)
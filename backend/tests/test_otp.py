@@ -0,0 +1,89 @@
+from io import StringIO
+from datetime import timedelta
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework import status
+from content.models import SMSSettings
+from users import otp
+from users.models import OTP
+
+PHONE = '01711111111'
+
+@override_settings(OTP_MAX_ATTEMPTS=3)
+class OTPStoreTest(TestCase):
+    def setUp(self):
+        SMSSettings.objects.create(api_key='key')
+        self.client = APIClient()
+
+    def _generate(self):
+        response = self.client.post('/api/users/generate-otp/', {'phone_number': PHONE}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['debug_otp']
+
+    def _verify(self, code):
+        return self.client.post('/api/users/verify-otp/', {'phone_number': PHONE, 'otp': code}, format='json')
+
+    def test_codes_are_hashed_and_single_use(self):
+        self._generate()
+        code = self._generate() # Replaces the first one
+        row = OTP.objects.get()
+        self.assertNotIn(code, row.code_hash)
+
+        with self.assertNumQueries(3): # Unique-index lookup, taking the attempt, then the consuming delete
+            otp.verify(PHONE, code)
+        self.assertFalse(OTP.objects.exists())
+        self.assertEqual(self._verify(code).status_code, status.HTTP_400_BAD_REQUEST)
+
+        code = self._generate()
+        response = self._verify(code)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('token', response.data)
+
+    def test_expired_code_is_rejected(self):
+        code = self._generate()
+        OTP.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        response = self._verify(code)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('expired', response.data['error'])
+
+    def test_wrong_guesses_lock_the_code(self):
+        code = self._generate()
+        wrong = '000000' if code != '000000' else '111111'
+        for _ in range(3):
+            self.assertEqual(self._verify(wrong).data['error'], 'Invalid OTP')
+        self.assertEqual(OTP.objects.get().attempts, 3)
+        response = self._verify(code)
+        self.assertIn('Too many attempts', response.data['error'])
+
+        # A new code starts over
+        self.assertEqual(self._verify(self._generate()).status_code, status.HTTP_200_OK)
+
+    def test_purge_removes_only_expired_rows(self):
+        otp.issue(PHONE)
+        otp.issue('01722222222')
+        OTP.objects.filter(phone_number=PHONE).update(expires_at=timezone.now() - timedelta(minutes=1))
+        call_command('purge_otps', stdout=StringIO())
+        self.assertEqual(list(OTP.objects.values_list('phone_number', flat=True)), ['01722222222'])
+
+    @override_settings(OTP_CACHE='default')
+    def test_cache_store(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        with self.assertNumQueries(0):
+            code = otp.issue(PHONE)
+            with self.assertRaises(otp.OTPError):
+                otp.verify(PHONE, 'nope')
+            otp.verify(PHONE, code)
+        self.assertFalse(OTP.objects.exists())
+        with self.assertRaises(otp.OTPError):
+            otp.verify(PHONE, code)
+
+        code = otp.issue(PHONE)
+        for _ in range(3):
+            with self.assertRaises(otp.OTPError):
+                otp.verify(PHONE, 'nope')
+        with self.assertRaisesMessage(otp.OTPError, 'Too many attempts'):
+            otp.verify(PHONE, code)
@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.utils import timezone
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework import status
+from django.contrib.auth import get_user_model
+from orders.models import Order, OrderItem, ReportJob
+from store.models import Product
+
+User = get_user_model()
+MEDIA_ROOT = tempfile.mkdtemp()
+REPORT_ROOT = tempfile.mkdtemp()
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, REPORT_JOB_STORAGE_DIR=REPORT_ROOT, REPORT_JOBS_SYNC=True)
+class ReportJobAPITest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(REPORT_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_authenticate(user=self.user)
+        self.url = '/api/report-jobs/'
+
+        product = Product.objects.create(name='Serum', price=100, stock_quantity=3)
+        for status_value in ['Delivered', 'Pending']:
+            order = Order.objects.create(
+                customer_name='Guest', phone='01700000000', status=status_value,
+                subtotal=100, total=100, shipping_address={'city': 'Dhaka'}
+            )
+            OrderItem.objects.create(order=order, product=product, product_name='Serum', price=100, quantity=2)
+
+    def _submit(self, payload):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(self.url, payload, format='json')
+
+    def test_job_runs_and_downloads(self):
+        response = self._submit({'report_type': 'sales_ledger', 'params': {'status': 'Delivered'}})
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        job_url = f"{self.url}{response.data['id']}/"
+        response = self.client.get(job_url)
+        self.assertEqual(response.data['status'], 'Completed')
+        self.assertEqual(response.data['row_count'], 1)
+        self.assertNotIn('result_url', response.data)
+
+        # Kept out of MEDIA under a random name: only the admin download action serves it
+        job = ReportJob.objects.get(id=response.data['id'])
+        self.assertTrue(job.result_file.path.startswith(REPORT_ROOT))
+        self.assertNotIn(f"_{job.id}.csv", job.result_file.name)
+        self.assertEqual(os.listdir(MEDIA_ROOT), [])
+
+        response = self.client.get(job_url + 'download/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lines = b''.join(response.streaming_content).decode().strip().splitlines()
+        self.assertEqual(lines[0], 'id,date,customer,items,total,status')
+        self.assertEqual(len(lines), 2)
+
+        anonymous = APIClient()
+        self.assertEqual(anonymous.get(job_url + 'download/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_identical_request_reuses_result(self):
+        first = self._submit({'report_type': 'product_velocity'})
+        second = self._submit({'report_type': 'product_velocity'})
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.data['id'], second.data['id'])
+
+        third = self._submit({'report_type': 'product_velocity', 'refresh': True})
+        self.assertNotEqual(first.data['id'], third.data['id'])
+        self.assertEqual(ReportJob.objects.count(), 2)
+
+    def test_unknown_report_type(self):
+        response = self._submit({'report_type': 'nope'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_stalled_jobs_are_rerun_and_old_results_purged(self):
+        long_ago = timezone.now() - timedelta(hours=2)
+        # Lost with a restarted process: never picked up, and one mid-run
+        lost = ReportJob.objects.create(report_type='product_velocity', cache_key='a')
+        dead = ReportJob.objects.create(report_type='sales_ledger', cache_key='b', status='Running', started_at=long_ago)
+        fresh = ReportJob.objects.create(report_type='product_velocity', cache_key='c')
+        ReportJob.objects.filter(id__in=[lost.id, dead.id]).update(created_at=long_ago)
+
+        call_command('process_report_jobs', stdout=StringIO())
+        self.assertEqual(
+            dict(ReportJob.objects.values_list('id', 'status')),
+            {lost.id: 'Completed', dead.id: 'Completed', fresh.id: 'Pending'},
+        )
+
+        path = ReportJob.objects.get(id=lost.id).result_file.path
+        ReportJob.objects.filter(id=lost.id).update(finished_at=timezone.now() - timedelta(days=2))
+        out = StringIO()
+        call_command('process_report_jobs', stdout=out)
+        self.assertIn('purged 1 expired', out.getvalue())
+        self.assertFalse(ReportJob.objects.filter(id=lost.id).exists())
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(ReportJob.objects.filter(id=dead.id).exists())
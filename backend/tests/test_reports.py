@@ -0,0 +1,178 @@
+import json
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from django.test import TestCase
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework import status
+from django.contrib.auth import get_user_model
+from orders.models import Order, OrderItem
+from store.models import Product, Category, ProductVariant
+
+User = get_user_model()
+
+class ProductVelocityReportTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_authenticate(user=self.user)
+        self.url = '/api/reports/product_velocity/'
+
+        category = Category.objects.create(name='Skin', slug='skin')
+        self.serum = Product.objects.create(name='Serum', price=100, category=category, stock_quantity=7)
+        self.cream = Product.objects.create(name='Cream', price=50, category=category, stock_quantity=3)
+
+        order = self._order('Delivered')
+        OrderItem.objects.create(order=order, product=self.serum, product_name='Serum', price=Decimal('100.10'), quantity=2)
+        OrderItem.objects.create(order=order, product=self.cream, product_name='Cream', price=50, quantity=1)
+        order = self._order('Pending')
+        OrderItem.objects.create(order=order, product=self.serum, product_name='Serum', price=Decimal('100.10'), quantity=1)
+        OrderItem.objects.create(order=order, product=None, product_name='Old Product', price=10, quantity=3)
+        OrderItem.objects.create(order=order, product=None, product_name='Old Product', price=10, quantity=1)
+        # Cancelled orders are not counted
+        order = self._order('Cancelled')
+        OrderItem.objects.create(order=order, product=self.cream, product_name='Cream', price=50, quantity=9)
+
+    def _order(self, status_value):
+        return Order.objects.create(
+            customer_name='Guest', phone='01700000000', status=status_value,
+            subtotal=0, total=0, shipping_address={'city': 'Dhaka'}
+        )
+
+    def test_aggregates_per_product(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = {row['name']: row for row in response.data}
+        self.assertEqual(rows['Serum']['sold'], 3)
+        self.assertEqual(rows['Serum']['revenue'], 300.3)
+        self.assertEqual(rows['Serum']['stock'], 7)
+        self.assertEqual(rows['Cream']['sold'], 1)
+        self.assertEqual(rows['Old Product']['stock'], 0)
+        self.assertEqual(rows['Old Product']['revenue'], 40.0)
+
+    def test_limit_and_pagination(self):
+        response = self.client.get(self.url, {'limit': 2})
+        self.assertEqual([row['name'] for row in response.data], ['Old Product', 'Serum'])
+
+        response = self.client.get(self.url, {'page': 2, 'page_size': 1})
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual([row['name'] for row in response.data['results']], ['Serum'])
+
+    def test_sorted_and_limited_in_sql(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url, {'limit': 1})
+        self.assertEqual(response.data, [{'name': 'Old Product', 'sold': 4, 'revenue': 40.0, 'stock': 0}])
+        self.assertEqual(len(ctx.captured_queries), 1)
+        sql = ctx.captured_queries[0]['sql']
+        self.assertIn('UNION ALL', sql)
+        self.assertIn('LIMIT 1', sql)
+
+class SalesLedgerReportTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_authenticate(user=self.user)
+        self.url = '/api/reports/sales_ledger/'
+
+        product = Product.objects.create(name='Serum', price=100)
+        for status_value, quantities in [('Delivered', [2, 3]), ('Pending', [1]), ('Cancelled', [])]:
+            order = Order.objects.create(
+                customer_name=f'{status_value} Customer', phone='01700000000', status=status_value,
+                subtotal=100, total=Decimal('160.50'), shipping_address={'city': 'Dhaka'}
+            )
+            for qty in quantities:
+                OrderItem.objects.create(order=order, product=product, product_name='Serum', price=100, quantity=qty)
+
+    def test_list_sums_items_in_sql(self):
+        response = self.client.get(self.url, {'status': 'Delivered'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]['items'], 5)
+        self.assertEqual(response.data[0]['customer'], 'Delivered Customer')
+
+        response = self.client.get(self.url)
+        by_customer = {row['customer']: row['items'] for row in response.data}
+        self.assertEqual(by_customer['Cancelled Customer'], 0)
+
+    def test_paginated(self):
+        response = self.client.get(self.url, {'page': 1, 'page_size': 2})
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_date_range_is_whole_days(self):
+        delivered = Order.objects.get(status='Delivered')
+        Order.objects.filter(pk=delivered.pk).update(created_at=datetime(2024, 3, 10, 23, 59, tzinfo=dt_timezone.utc))
+        response = self.client.get(self.url, {'start_date': '2024-03-10', 'end_date': '2024-03-10'})
+        self.assertEqual([row['id'] for row in response.data], [delivered.pk])
+
+        response = self.client.get(self.url, {'start_date': '10/03/2024'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # Rejected before streaming starts, not part way through a 200
+        for export in ('csv', 'json'):
+            response = self.client.get(self.url, {'export': export, 'end_date': 'garbage'})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertFalse(response.streaming)
+
+    def test_streaming_exports(self):
+        response = self.client.get(self.url, {'export': 'json'})
+        self.assertEqual(response['Content-Type'], 'application/json')
+        rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(sorted(r['items'] for r in rows), [0, 1, 5])
+        self.assertEqual(rows[0]['total'], 160.5)
+
+        response = self.client.get(self.url, {'export': 'csv'})
+        lines = b''.join(response.streaming_content).decode().strip().splitlines()
+        self.assertEqual(lines[0], 'id,date,customer,items,total,status')
+        self.assertEqual(len(lines), 4)
+
+class InventoryAuditReportTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_authenticate(user=self.user)
+        self.url = '/api/reports/inventory_audit/'
+
+        category = Category.objects.create(name='Skin', slug='skin')
+        # Threshold is per product: 4 units is low for one, fine for the other
+        self.low = Product.objects.create(name='A Low', price=10, category=category, stock_quantity=4, low_stock_threshold=5)
+        self.ok = Product.objects.create(name='B Ok', price=10, category=category, stock_quantity=4, low_stock_threshold=2)
+        self.out = Product.objects.create(name='C Out', price=10, stock_quantity=0)
+        self.untracked = Product.objects.create(name='D Untracked', price=10, stock_quantity=0, manage_stock=False)
+        self.variant_product = Product.objects.create(name='E Variants', price=20, stock_quantity=50, low_stock_threshold=3)
+        ProductVariant.objects.create(product=self.variant_product, attributes={'Size': 'S'}, price=20, stock_quantity=1)
+        self.variant = ProductVariant.objects.create(product=self.variant_product, attributes={'Size': 'M'}, price=20, stock_quantity=1)
+
+    def test_status_respects_threshold_and_variants(self):
+        statuses = dict(Product.objects.values_list('name', 'stock_status'))
+        self.assertEqual(statuses, {
+            'A Low': 'Low Stock',
+            'B Ok': 'In Stock',
+            'C Out': 'Out of Stock',
+            'D Untracked': 'In Stock',
+            'E Variants': 'Low Stock',
+        })
+
+        self.variant.stock_quantity = 10
+        self.variant.save()
+        self.variant_product.refresh_from_db()
+        self.assertEqual(self.variant_product.stock_status, 'In Stock')
+
+    def test_filter_and_totals(self):
+        response = self.client.get(self.url, {'status': 'Low Stock'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = response.data['results']
+        self.assertEqual([r['name'] for r in rows], ['A Low', 'E Variants'])
+        self.assertEqual(rows[0]['category'], 'Skin')
+        self.assertEqual(rows[1]['stock'], 2)
+        self.assertEqual(rows[1]['value'], 40.0)
+        self.assertEqual(response.data['totals'], {'total_value': 80.0, 'total_stock': 6})
+
+    def test_low_stock_feed(self):
+        response = self.client.get('/api/reports/low_stock/')
+        self.assertEqual([r['name'] for r in response.data], ['A Low', 'E Variants', 'C Out'])
+
+        response = self.client.get('/api/reports/low_stock/', {'include_out_of_stock': 'false'})
+        self.assertEqual(len(response.data), 2)
@@ -0,0 +1,94 @@
+import time
+from datetime import timedelta
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework import status
+from django.contrib.auth import get_user_model
+from content import sms
+from content.models import SMSMessage, SMSSettings
+from .fake_sms_gateway import FakeSMSGateway
+
+User = get_user_model()
+
+@override_settings(SMS_SYNC=True, SMS_RETRY_BACKOFF=0, SMS_TIMEOUT=(1, 1))
+class SMSQueueTest(TestCase):
+    def setUp(self):
+        self.gateway = FakeSMSGateway().start()
+        self.addCleanup(self.gateway.stop)
+        sms.reset_gateways()
+        self.addCleanup(sms.reset_gateways)
+        SMSSettings.objects.create(api_url=self.gateway.url, api_key='key', sender_id='SHOP', message_template='Code: {otp}')
+        self.client = APIClient()
+
+    def test_otp_is_queued_and_delivered_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.client.post('/api/users/generate-otp/', {'phone_number': '01711111111'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(callbacks), 1)
+
+        message = SMSMessage.objects.get()
+        self.assertEqual((message.kind, message.status, message.attempts), ('otp', 'Sent', 1))
+        self.assertEqual(self.gateway.sent, [('01711111111', f"Code: {response.data['debug_otp']}")])
+        self.assertEqual(message.message, sms.REDACTED) # The code isn't kept once sent
+
+    def test_expired_otp_is_dropped_not_sent(self):
+        message = sms.enqueue('01711111111', 'Code: 123456', kind='otp')
+        SMSMessage.objects.filter(id=message.id).update(created_at=timezone.now() - timedelta(minutes=10))
+        self.assertEqual(sms.process_outbox(), 0)
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.message), ('Failed', sms.REDACTED))
+        self.assertEqual(self.gateway.sent, [])
+
+    def test_otp_does_not_wait_for_a_slow_gateway(self):
+        self.gateway.delay = 2
+        started = time.monotonic()
+        with override_settings(SMS_SYNC=False):
+            # Nothing is handed to a worker until commit, and the request doesn't wait for it anyway
+            response = self.client.post('/api/users/generate-otp/', {'phone_number': '01711111111'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(SMSMessage.objects.get().status, 'Queued')
+
+    def test_retries_then_gives_up(self):
+        self.gateway.fail_next = 1
+        message = sms.enqueue('01711111111', 'hello')
+        sms.deliver(message.id)
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts, message.response_code), ('Queued', 1, 503))
+
+        self.assertEqual(sms.process_outbox(), 1)
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('Sent', 2))
+
+        self.gateway.fail_next = 10
+        with override_settings(SMS_MAX_ATTEMPTS=2):
+            failing = sms.enqueue('01722222222', 'hello')
+            sms.deliver(failing.id)
+            sms.process_outbox()
+        failing.refresh_from_db()
+        self.assertEqual((failing.status, failing.attempts), ('Failed', 2))
+
+    def test_rejected_number_is_not_retried(self):
+        self.gateway.reject_numbers.add('01799999999')
+        message = sms.enqueue('01799999999', 'hello')
+        sms.deliver(message.id)
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('Failed', 1))
+        self.assertIn('1001', message.error)
+
+    def test_admin_test_button_reports_gateway_answer(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_authenticate(user=admin)
+        response = self.client.post('/api/sms-settings/test_sms/', {'phone_number': '01711111111'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status_code'], 200)
+        self.assertEqual(SMSMessage.objects.get().kind, 'test')
+
+    def test_rate_limiter_spaces_sends(self):
+        limiter = sms.RateLimiter(20)
+        started = time.monotonic()
+        for _ in range(30):
+            limiter.acquire()
+        # 20 burst tokens, then 10 more at 20/s
+        self.assertGreaterEqual(time.monotonic() - started, 0.45)
@@ -0,0 +1,132 @@
+from datetime import timedelta
+from unittest import mock
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework import status
+from django.contrib.auth import get_user_model
+from content import sms
+from content.models import SMSSettings
+from orders.models import FollowUp
+from marketing import broadcasts
+from marketing.models import SMSBroadcast, SMSBroadcastRecipient
+from .fake_sms_gateway import FakeSMSGateway
+
+User = get_user_model()
+
+@override_settings(SMS_SYNC=True, SMS_RETRY_BACKOFF=0, SMS_TIMEOUT=(1, 1),
+                   SMS_BROADCAST_BATCH_SIZE=2, SMS_BROADCAST_WORKERS=2, SMS_BROADCAST_RATE_LIMIT=1000)
+class SMSBroadcastTest(TestCase):
+    def setUp(self):
+        self.gateway = FakeSMSGateway().start()
+        self.addCleanup(self.gateway.stop)
+        sms.reset_gateways()
+        self.addCleanup(sms.reset_gateways)
+        SMSSettings.objects.create(api_url=self.gateway.url, api_key='key', sender_id='SHOP')
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+        self.numbers = [f'0171000000{i}' for i in range(5)]
+        for i, number in enumerate(self.numbers):
+            customer = User.objects.create(username=f'c{i}', phone_number=number)
+            FollowUp.objects.create(customer=customer, is_interested_in_new_products=True)
+        # Interested twice, texted once; no phone, not texted
+        FollowUp.objects.create(customer=User.objects.get(username='c0'), is_interested_in_new_products=True)
+        FollowUp.objects.create(customer=User.objects.create(username='nophone'), is_interested_in_new_products=True)
+
+    def test_create_sends_in_batches(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/sms-broadcasts/', {
+                'name': 'New arrivals', 'message': 'New serums are in!', 'audience': 'interested'
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        broadcast = SMSBroadcast.objects.get()
+        self.assertEqual(broadcast.status, 'Completed')
+        self.assertEqual((broadcast.recipient_count, broadcast.sent_count, broadcast.failed_count), (5, 5, 0))
+        self.assertEqual(broadcast.created_by, self.admin)
+        self.assertEqual(sorted(len(numbers) for numbers in self.gateway.calls), [1, 2, 2])
+        self.assertEqual(sorted(number for number, _ in self.gateway.sent), self.numbers)
+
+        response = self.client.get(f'/api/sms-broadcasts/{broadcast.id}/recipients/', {'status': 'Sent'})
+        self.assertEqual(response.data['count'], 5)
+
+    def test_unknown_audience_is_rejected(self):
+        response = self.client.post('/api/sms-broadcasts/', {'name': 'x', 'message': 'x', 'audience': 'everyone'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rejected_batch_fails_only_its_recipients(self):
+        self.gateway.reject_numbers.add(self.numbers[0])
+        self.gateway.fail_next = 1 # One retryable hiccup along the way
+        broadcast = SMSBroadcast.objects.create(name='x', message='hello', audience='interested')
+        broadcasts.run_broadcast(broadcast.id)
+
+        broadcast.refresh_from_db()
+        self.assertEqual((broadcast.status, broadcast.sent_count, broadcast.failed_count), ('Completed', 3, 2))
+        failed = broadcast.recipients.filter(status='Failed')
+        self.assertIn(self.numbers[0], failed.values_list('phone_number', flat=True))
+        self.assertIn('1001', failed.first().error)
+
+    def test_resumes_after_a_dead_worker(self):
+        broadcast = SMSBroadcast.objects.create(name='x', message='hello', audience='interested')
+        broadcasts.build_recipients(broadcast)
+        recipients = list(broadcast.recipients.order_by('id'))
+        # The previous worker sent two, had one in flight, then died
+        SMSBroadcastRecipient.objects.filter(id__in=[r.id for r in recipients[:2]]).update(status='Sent')
+        SMSBroadcastRecipient.objects.filter(id=recipients[2].id).update(status='Sending')
+        SMSBroadcast.objects.filter(id=broadcast.id).update(
+            status='Running', sent_count=2, heartbeat_at=timezone.now() - timedelta(hours=1)
+        )
+
+        self.assertEqual(broadcasts.resume_stalled(), [broadcast.id])
+        broadcast.refresh_from_db()
+        self.assertEqual((broadcast.status, broadcast.sent_count, broadcast.failed_count), ('Completed', 4, 1))
+        self.assertEqual(sorted(number for number, _ in self.gateway.sent), sorted(r.phone_number for r in recipients[3:]))
+
+        # A live worker is left alone
+        SMSBroadcast.objects.filter(id=broadcast.id).update(status='Running', heartbeat_at=timezone.now())
+        self.assertEqual(broadcasts.resume_stalled(), [])
+
+    def test_pause_stops_between_rounds_and_resume_finishes(self):
+        broadcast = SMSBroadcast.objects.create(name='x', message='hello', audience='interested')
+        response = self.client.post(f'/api/sms-broadcasts/{broadcast.id}/pause/')
+        self.assertEqual(response.data['status'], 'Paused')
+        broadcasts.run_broadcast(broadcast.id)
+        self.assertEqual(self.gateway.requests, 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/sms-broadcasts/{broadcast.id}/resume/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        broadcast.refresh_from_db()
+        self.assertEqual((broadcast.status, broadcast.sent_count), ('Completed', 5))
+
+        response = self.client.post(f'/api/sms-broadcasts/{broadcast.id}/pause/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_replaced_run_stops_before_sending(self):
+        broadcast = SMSBroadcast.objects.create(name='x', message='hello', audience='interested')
+        broadcasts.build_recipients(broadcast)
+        # Paused and resumed: a newer run holds the broadcast now
+        SMSBroadcast.objects.filter(id=broadcast.id).update(status='Running', run_token='newer', heartbeat_at=timezone.now())
+        broadcasts._run(broadcast, 'older')
+        self.assertEqual(self.gateway.requests, 0)
+        self.assertEqual(broadcast.recipients.filter(status='Pending').count(), 5)
+
+    @override_settings(SMS_BROADCAST_STALE_SECONDS=1)
+    def test_in_flight_rows_of_another_run_are_not_resent(self):
+        broadcast = SMSBroadcast.objects.create(name='x', message='hello', audience='interested')
+        broadcasts.build_recipients(broadcast)
+        first = broadcast.recipients.order_by('id').first()
+        # An earlier run claimed this one just now and is still waiting on the gateway
+        SMSBroadcastRecipient.objects.filter(id=first.id).update(status='Sending', claim_token='older', claimed_at=timezone.now())
+
+        with mock.patch.object(broadcasts, 'SENDING_POLL_SECONDS', 0.1):
+            broadcasts.run_broadcast(broadcast.id)
+        self.assertNotIn(first.phone_number, [number for number, _ in self.gateway.sent])
+        self.assertEqual(len(self.gateway.sent), 4)
+        # Nobody reported back before the claim went stale, so it counts as interrupted, not re-sent
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.error), ('Failed', 'Interrupted, delivery unknown'))
+        broadcast.refresh_from_db()
+        self.assertEqual((broadcast.status, broadcast.sent_count, broadcast.failed_count), ('Completed', 4, 1))
@@ -0,0 +1,55 @@
+from django.test import TestCase
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework import status
+from django.contrib.auth import get_user_model
+from orders.models import Order
+
+User = get_user_model()
+
+class UserDirectoryTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password', role='Admin')
+        self.client.force_authenticate(user=self.admin)
+        self.rina = User.objects.create(username='rina', first_name='Rina', last_name='Akter', email='Rina@Example.com', phone_number='01711111111')
+        self.karim = User.objects.create(username='karim', first_name='Karim', last_name='Hossain', email='karim@example.com', phone_number='01822222222')
+
+    def _ids(self, params):
+        response = self.client.get('/api/users/', params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [row['id'] for row in response.data['results']]
+
+    def test_search_is_a_prefix_match_on_phone_email_and_name(self):
+        self.assertEqual(self._ids({'search': '01711'}), [self.rina.id])
+        self.assertEqual(self._ids({'search': 'rina@'}), [self.rina.id])
+        self.assertEqual(self._ids({'search': 'HOSS'}), [self.karim.id])
+        self.assertEqual(self._ids({'search': 'rina akt'}), [self.rina.id])
+        self.assertEqual(self._ids({'search': 'ina'}), [])
+
+    def test_filters_and_pagination(self):
+        self.assertEqual(self._ids({'is_staff': 'true'}), [self.admin.id])
+        self.assertEqual(self._ids({'role': 'Admin'}), [self.admin.id])
+        response = self.client.get('/api/users/', {'page_size': 2})
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual([row['id'] for row in response.data['results']], [self.karim.id, self.rina.id])
+
+    def test_directory_is_staff_only(self):
+        customer = APIClient()
+        customer.force_authenticate(user=self.rina)
+        self.assertEqual(customer.get('/api/users/', {'search': 'karim'}).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(customer.get(f'/api/users/{self.karim.id}/').status_code, status.HTTP_403_FORBIDDEN)
+        response = customer.get('/api/users/me/')
+        self.assertEqual((response.status_code, response.data['id']), (status.HTTP_200_OK, self.rina.id))
+
+    def test_order_stats_come_from_the_stats_table(self):
+        for total in (300, 200):
+            Order.objects.create(customer=self.rina, customer_name='Rina', phone='01711111111', subtotal=total, total=total,
+                                 shipping_address={'city': 'Dhaka'}, status='Delivered')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/users/')
+        rows = {row['id']: row for row in response.data['results']}
+        self.assertEqual((rows[self.rina.id]['order_count'], rows[self.rina.id]['total_spent']), (2, '500.00'))
+        self.assertEqual((rows[self.karim.id]['order_count'], rows[self.karim.id]['total_spent']), (0, '0.00'))
+        self.assertEqual(len(ctx.captured_queries), 2) # Count + page
@@ -0,0 +1,69 @@
+"""
+Token authentication with a short-lived cache of token -> user.
+
+Every authenticated call with DRF's TokenAuthentication joins authtoken_token to
+users_user; dashboards fire dozens per screen. CachedTokenAuthentication keeps the
+resolved user for AUTH_TOKEN_CACHE_SECONDS in the AUTH_TOKEN_CACHE alias. Entries
+are dropped when the token is deleted (logout, rotation, user deleted) and when the
+user is saved (deactivation, role or permission changes); see the receivers in
+users.models. Changes made with QuerySet.update() skip those signals and show up
+once the TTL runs out.
+
+Revocation only reaches every worker through a cache they all share (Redis/Memcached):
+a per-process cache would keep serving a logged-out token in the other workers. So
+nothing is cached while AUTH_TOKEN_CACHE is None, and users.checks warns at startup
+if it names a local-memory cache. If the cache errors, tokens are looked up in the DB.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+def _cache():
+    alias = getattr(settings, 'AUTH_TOKEN_CACHE', None)
+    return caches[alias] if alias else None
+
+
+def token_cache_key(key):
+    # Don't put raw credentials in cache keys
+    return 'authtoken:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def forget_token(key):
+    cache = _cache()
+    if cache is not None:
+        cache.delete(token_cache_key(key))
+
+
+def forget_user(user):
+    if _cache() is None:
+        return
+    for key in Token.objects.filter(user=user).values_list('key', flat=True):
+        forget_token(key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        cache = _cache()
+        if cache is None:
+            return super().authenticate_credentials(key)
+
+        cache_key = token_cache_key(key)
+        try:
+            user = cache.get(cache_key)
+        except Exception:
+            return super().authenticate_credentials(key) # Cache unreachable: look the token up
+        if user is not None:
+            token = Token(key=key, user_id=user.pk)
+            token.user = user
+            return user, token
+
+        user, token = super().authenticate_credentials(key) # Raises for unknown keys and inactive users
+        try:
+            cache.set(cache_key, user, getattr(settings, 'AUTH_TOKEN_CACHE_SECONDS', 60))
+        except Exception:
+            pass
+        return user, token
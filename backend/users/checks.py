@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register()
+def check_shared_caches(app_configs, **kwargs):
+    """AUTH_TOKEN_CACHE and OTP_CACHE must be shared by every worker, or revocations and attempt counts stay per process."""
+    warnings = []
+    for setting in ('AUTH_TOKEN_CACHE', 'OTP_CACHE'):
+        alias = getattr(settings, setting, None)
+        if not alias:
+            continue
+        backend = settings.CACHES.get(alias, {}).get('BACKEND', '')
+        if backend in LOCAL_BACKENDS:
+            warnings.append(Warning(
+                f"{setting} = '{alias}' uses {backend.rsplit('.', 1)[-1]}, which is private to each process.",
+                hint='Point it at a cache every worker shares (Redis/Memcached), or set it to None.',
+                id='users.W001',
+            ))
+    return warnings
@@ -0,0 +1,18 @@
+import time
+from django.core.management.base import BaseCommand
+from users.otp import purge_expired
+
+class Command(BaseCommand):
+    help = 'Deletes expired OTP codes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', type=int, default=0, help='Keep running, sleeping this many seconds between runs')
+
+    def handle(self, *args, **options):
+        while True:
+            count = purge_expired()
+            self.stdout.write(f"Purged {count} expired OTPs")
+
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
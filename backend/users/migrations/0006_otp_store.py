@@ -0,0 +1,48 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def drop_plaintext_codes(apps, schema_editor):
+    # Outstanding codes were stored in plain text and may repeat a phone; users just request a new one
+    apps.get_model('users', 'OTP').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_otp'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_plaintext_codes, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='otp',
+            name='otp_code',
+        ),
+        migrations.AddField(
+            model_name='otp',
+            name='code_hash',
+            field=models.CharField(default='', max_length=64),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='otp',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='otp',
+            name='expires_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='otp',
+            name='phone_number',
+            field=models.CharField(max_length=15, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='otp',
+            index=models.Index(fields=['expires_at'], name='otp_expires_idx'),
+        ),
+    ]
@@ -1,5 +1,8 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models.functions import Lower
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 
 class User(AbstractUser):
     phone_number = models.CharField(max_length=15, blank=True, null=True, unique=True)
@@ -11,13 +14,46 @@ class User(AbstractUser):
     billing_address = models.JSONField(default=dict, blank=True)
     shipping_address = models.JSONField(default=dict, blank=True)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Directory search is a case-insensitive prefix match (users.views.UserViewSet);
+            # phone_number is already covered by its unique index
+            models.Index(Lower('email'), name='user_email_lower_idx'),
+            models.Index(Lower('first_name'), name='user_first_name_lower_idx'),
+            models.Index(Lower('last_name'), name='user_last_name_lower_idx'),
+            # Staff are a handful of rows among every guest-checkout customer
+            models.Index(fields=['role'], condition=models.Q(is_staff=True), name='user_staff_role_idx'),
+        ]
+
     def __str__(self):
         return self.username
 
 class OTP(models.Model):
-    phone_number = models.CharField(max_length=15)
-    otp_code = models.CharField(max_length=6)
+    """Database side of the OTP store (see users.otp): one live code per phone, stored hashed."""
+    phone_number = models.CharField(max_length=15, unique=True)
+    code_hash = models.CharField(max_length=64)
+    attempts = models.PositiveSmallIntegerField(default=0) # Wrong guesses against this code
     created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # Verify is a lookup on the unique phone_number index; purge_otps range-scans expiry
+            models.Index(fields=['expires_at'], name='otp_expires_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.phone_number} - {self.otp_code}"
+        return f"{self.phone_number} - expires {self.expires_at}"
+
+@receiver(post_delete, sender='authtoken.Token')
+def forget_deleted_token(sender, instance, **kwargs):
+    from .authentication import forget_token
+    forget_token(instance.key)
+
+@receiver(post_save, sender=User)
+def forget_cached_tokens(sender, instance, created, update_fields=None, **kwargs):
+    # Logins only touch last_login; anything else (is_active, role, is_staff...) must not be served stale
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    from .authentication import forget_user
+    forget_user(instance)
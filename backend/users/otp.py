@@ -0,0 +1,133 @@
+"""
+One-time login codes.
+
+Codes are stored as an HMAC of phone + code (keyed with SECRET_KEY), expire after
+OTP_TTL_SECONDS and accept OTP_MAX_ATTEMPTS guesses before a new code is needed. Each
+guess takes an attempt atomically (cache incr / conditional UPDATE) before the
+comparison, so parallel requests can't exceed the limit.
+
+With OTP_CACHE set to a cache alias shared by every worker (Redis/Memcached) codes
+live only in the cache and expire with it. Without it, or whenever that cache
+errors, the OTP table is used: one row per phone, upserted on issue and read with
+one unique-index lookup on verify. Expired rows are removed by the purge_otps command.
+"""
+import hmac
+import secrets
+from datetime import timedelta
+from hashlib import sha256
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OTP
+
+
+class OTPError(Exception):
+    pass
+
+
+def _ttl():
+    return getattr(settings, 'OTP_TTL_SECONDS', 300)
+
+
+def _max_attempts():
+    return getattr(settings, 'OTP_MAX_ATTEMPTS', 5)
+
+
+def _hash(phone_number, code):
+    return hmac.new(settings.SECRET_KEY.encode(), f'{phone_number}:{code}'.encode(), sha256).hexdigest()
+
+
+def _cache():
+    alias = getattr(settings, 'OTP_CACHE', None)
+    return caches[alias] if alias else None
+
+
+def _keys(phone_number):
+    return f'otp:{phone_number}', f'otp:{phone_number}:attempts'
+
+
+def issue(phone_number):
+    """Create a fresh code for the phone, replacing any previous one. Returns the plain code."""
+    code = str(secrets.randbelow(900000) + 100000)
+    code_hash = _hash(phone_number, code)
+
+    cache = _cache()
+    if cache is not None:
+        code_key, attempts_key = _keys(phone_number)
+        try:
+            cache.set_many({code_key: code_hash, attempts_key: 0}, _ttl())
+            return code
+        except Exception:
+            pass # Cache unreachable: fall back to the table
+
+    now = timezone.now()
+    OTP.objects.bulk_create(
+        [OTP(phone_number=phone_number, code_hash=code_hash, attempts=0, created_at=now, expires_at=now + timedelta(seconds=_ttl()))],
+        update_conflicts=True, unique_fields=['phone_number'],
+        update_fields=['code_hash', 'attempts', 'created_at', 'expires_at'],
+    )
+    return code
+
+
+def verify(phone_number, code):
+    """Consume the phone's code if it matches; raises OTPError otherwise."""
+    cache = _cache()
+    if cache is not None:
+        try:
+            if _verify_cached(cache, phone_number, code):
+                return
+        except OTPError:
+            raise
+        except Exception:
+            pass
+    _verify_db(phone_number, code)
+
+
+def _verify_cached(cache, phone_number, code):
+    """True if the code was checked against the cache; False if the cache has none (try the table)."""
+    code_key, attempts_key = _keys(phone_number)
+    stored = cache.get(code_key)
+    if stored is None:
+        return False
+    # Take the attempt before comparing, so concurrent guesses can't get past the limit
+    try:
+        attempts = cache.incr(attempts_key)
+    except ValueError:
+        attempts = 1 if cache.add(attempts_key, 1, _ttl()) else cache.incr(attempts_key)
+    if attempts > _max_attempts():
+        raise OTPError('Too many attempts. Please request a new OTP')
+    if not hmac.compare_digest(stored, _hash(phone_number, code)):
+        raise OTPError('Invalid OTP')
+    # Single use: only the request that actually deletes the code wins
+    if not cache.delete(code_key):
+        raise OTPError('Invalid OTP')
+    cache.delete(attempts_key)
+    return True
+
+
+def _verify_db(phone_number, code):
+    otp = OTP.objects.filter(phone_number=phone_number).first()
+    if otp is None:
+        raise OTPError('Invalid OTP')
+    if otp.expires_at <= timezone.now():
+        otp.delete()
+        raise OTPError('OTP has expired. Please request a new one')
+    # Take the attempt before comparing, so concurrent guesses can't get past the limit
+    taken = OTP.objects.filter(pk=otp.pk, attempts__lt=_max_attempts()).update(attempts=F('attempts') + 1)
+    if not taken:
+        raise OTPError('Too many attempts. Please request a new OTP')
+    if not hmac.compare_digest(otp.code_hash, _hash(phone_number, code)):
+        raise OTPError('Invalid OTP')
+    # Conditional on the hash so a concurrent re-issue or double submit can't both succeed
+    deleted, _ = OTP.objects.filter(pk=otp.pk, code_hash=otp.code_hash).delete()
+    if not deleted:
+        raise OTPError('Invalid OTP')
+
+
+def purge_expired():
+    """Delete expired codes from the table. Returns how many were removed."""
+    deleted, _ = OTP.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
@@ -39,6 +39,14 @@ class UserSerializer(serializers.ModelSerializer):
         instance.save()
         return instance
 
+class UserDirectorySerializer(UserSerializer):
+    # Annotated by UserViewSet from orders.CustomerStats (orders not cancelled / delivered total)
+    order_count = serializers.IntegerField(read_only=True)
+    total_spent = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+
+    class Meta(UserSerializer.Meta):
+        fields = UserSerializer.Meta.fields + ['order_count', 'total_spent']
+
 class LoginSerializer(serializers.Serializer):
     email = serializers.EmailField()
     password = serializers.CharField(write_only=True)
@@ -4,7 +4,13 @@ from rest_framework.response import Response
 from django.contrib.auth import authenticate, get_user_model
 from django.contrib.auth.models import update_last_login
 from rest_framework.authtoken.models import Token
-from .serializers import UserSerializer, LoginSerializer, RegisterSerializer
+from django.db.models import Q, Value, DecimalField
+from django.db.models.functions import Coalesce, Lower
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework.exceptions import ValidationError
+from orders import rfm
+from orders.views import StandardResultsSetPagination
+from .serializers import UserSerializer, UserDirectorySerializer, LoginSerializer, RegisterSerializer
 
 User = get_user_model()
 
@@ -40,6 +46,14 @@ class LoginView(views.APIView):
             return Response({'error': 'Invalid credentials'}, status=status.HTTP_400_BAD_REQUEST)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class LogoutView(views.APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        # Deleting the token also drops it from the auth cache (users.models receivers)
+        Token.objects.filter(user=request.user).delete()
+        return Response({'success': True})
+
 class RegisterView(views.APIView):
     permission_classes = [permissions.AllowAny]
 
@@ -54,10 +68,59 @@ class RegisterView(views.APIView):
             }, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+def prefix_match(field, term):
+    """Case-insensitive prefix match as a range on Lower(field), so it can use the expression index."""
+    term = term.lower()
+    return Q(**{f'{field}__gte': term, f'{field}__lt': term + chr(0x10FFFF)})
+
 class UserViewSet(viewsets.ModelViewSet):
-    queryset = User.objects.all()
+    """Staff-only customer and team directory (with spend figures); any signed-in user manages their own profile at /users/me/."""
+    queryset = User.objects.all().order_by('-id')
     serializer_class = UserSerializer
-    permission_classes = [permissions.IsAuthenticated]
+    permission_classes = [permissions.IsAdminUser]
+    pagination_class = StandardResultsSetPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['role', 'is_staff', 'is_active']
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return UserDirectorySerializer
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action != 'list':
+            return queryset
+
+        # Guest checkout creates a user per phone, so the directory can be huge: every
+        # search term must prefix-match the phone, email or a name, each backed by an index
+        search = self.request.query_params.get('search', '').strip()
+        if search:
+            queryset = queryset.annotate(
+                email_lower=Lower('email'), first_name_lower=Lower('first_name'), last_name_lower=Lower('last_name')
+            )
+            for term in search.split()[:3]:
+                queryset = queryset.filter(
+                    Q(phone_number__gte=term, phone_number__lt=term + chr(0x10FFFF))
+                    | prefix_match('email_lower', term)
+                    | prefix_match('first_name_lower', term)
+                    | prefix_match('last_name_lower', term)
+                )
+            # Still newest first, but not by the primary key: ordering by id lets SQLite walk the
+            # whole table in id order instead of using the search indexes and sorting the few matches
+            queryset = queryset.order_by('-date_joined', '-id')
+
+        segment = self.request.query_params.get('segment')
+        if segment:
+            if segment not in rfm.SEGMENTS:
+                raise ValidationError({'segment': f"Unknown segment. Choose one of: {', '.join(rfm.SEGMENTS)}."})
+            queryset = queryset.filter(**rfm.segment_filter(segment, prefix='order_stats__')).order_by('-order_stats__last_order_at', '-id')
+
+        # Precomputed per customer (orders.followups.refresh_customers), one LEFT JOIN
+        return queryset.annotate(
+            order_count=Coalesce('order_stats__order_count', 0),
+            total_spent=Coalesce('order_stats__delivered_total', Value(0), output_field=DecimalField(max_digits=12, decimal_places=2)),
+        )
 
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -65,6 +128,11 @@ class UserViewSet(viewsets.ModelViewSet):
             return Response({'error': 'You cannot delete yourself.'}, status=status.HTTP_403_FORBIDDEN)
         return super().destroy(request, *args, **kwargs)
 
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAdminUser])
+    def segments(self, request):
+        """Customer count per RFM segment (orders.rfm); list them with ?segment=<name>."""
+        return Response(rfm.segment_counts())
+
     @action(detail=False, methods=['get', 'patch'], permission_classes=[permissions.IsAuthenticated])
     def me(self, request):
         user = request.user
@@ -78,11 +146,10 @@ class UserViewSet(viewsets.ModelViewSet):
                 return Response(serializer.data)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-import random
-import requests
-import urllib.parse
-from .models import OTP
+from . import otp
+from content import sms
 from content.models import SMSSettings
+from content.singletons import get_singleton
 
 class GenerateOTPView(views.APIView):
     permission_classes = [permissions.AllowAny]
@@ -96,7 +163,7 @@ class GenerateOTPView(views.APIView):
         # user_exists = User.objects.filter(phone_number=phone_number).exists()
 
         # Check SMS Settings
-        sms_settings = SMSSettings.objects.first()
+        sms_settings = get_singleton(SMSSettings, default=False)
         is_sms_active = sms_settings and sms_settings.is_active
 
         # If SMS is Inactive -> DIRECT LOGIN
@@ -120,36 +187,14 @@ class GenerateOTPView(views.APIView):
                 'message': 'Direct login successful'
             })
 
-        # Generate 6-digit OTP
-        otp_code = str(random.randint(100000, 999999))
+        # Generate 6-digit OTP (replaces any earlier code for this phone)
+        otp_code = otp.issue(phone_number)
         
-        # Save to DB (Clear old first)
-        OTP.objects.filter(phone_number=phone_number).delete()
-        OTP.objects.create(phone_number=phone_number, otp_code=otp_code)
+        # Queue the SMS; a background worker talks to the gateway so a slow provider can't stall login
+        message = sms_settings.message_template
+        message = message.replace('{otp}', otp_code).replace('{OTP}', otp_code)
+        sms.enqueue(phone_number, message, kind='otp')
         
-        # Send SMS via Gateway if active
-        try:
-            # Replace placeholder in template (Case Insensitive for user convenience)
-            message = sms_settings.message_template
-            message = message.replace('{otp}', otp_code).replace('{OTP}', otp_code)
-            
-            # Construct Payload
-            params = {
-                'api_key': sms_settings.api_key,
-                'type': 'text',
-                'number': phone_number,
-                'senderid': sms_settings.sender_id if sms_settings.sender_id else '',
-                'message': message
-            }
-            
-            # Use request.post or get based on doc? User said GET & POST. Let's use GET as query params are typical for this provider
-            response = requests.get(sms_settings.api_url, params=params)
-            print(f"SMS Response for {phone_number}: {response.text}")
-                
-        except Exception as e:
-            print(f"Failed to send SMS: {e}")
-        
-        # In a real app, send via SMS Gateway here.
         print(f"DEBUG OTP for {phone_number}: {otp_code}")
         
         return Response({'success': True, 'message': 'OTP sent successfully', 'debug_otp': otp_code})
@@ -165,28 +210,23 @@ class VerifyOTPView(views.APIView):
             return Response({'error': 'Phone number and OTP are required'}, status=status.HTTP_400_BAD_REQUEST)
             
         try:
-            otp_record = OTP.objects.get(phone_number=phone_number, otp_code=otp_code)
-            
-            # Check expiration here if needed (e.g. created_at > 5 mins ago)
-            
-            otp_record.delete() # Consume OTP
-            
-            # Get or Create User
-            user, created = User.objects.get_or_create(phone_number=phone_number)
-            
-            if created:
-                user.username = phone_number # Use phone as username for simplicity
-                user.set_unusable_password()
-                user.is_verified = True
-                user.save()
-            
-            token, _ = Token.objects.get_or_create(user=user)
-            update_last_login(None, user)
-            
-            return Response({
-                'token': token.key,
-                'user': UserSerializer(user).data
-            })
-            
-        except OTP.DoesNotExist:
-            return Response({'error': 'Invalid OTP'}, status=status.HTTP_400_BAD_REQUEST)
+            otp.verify(phone_number, str(otp_code)) # Checks expiry and attempts, consumes the code
+        except otp.OTPError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Get or Create User
+        user, created = User.objects.get_or_create(phone_number=phone_number)
+        
+        if created:
+            user.username = phone_number # Use phone as username for simplicity
+            user.set_unusable_password()
+            user.is_verified = True
+            user.save()
+        
+        token, _ = Token.objects.get_or_create(user=user)
+        update_last_login(None, user)
+        
+        return Response({
+            'token': token.key,
+            'user': UserSerializer(user).data
+        })
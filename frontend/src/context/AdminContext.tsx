@@ -103,8 +103,9 @@ export function AdminProvider({ children }: { children: ReactNode }) {
     // --- Actions ---
     const fetchStaff = async () => {
         try {
-            const res = await api.get('/users/');
-            const mappedStaff: Staff[] = res.data.map((u: any) => ({
+            // The user table also holds every customer; the staff page only needs staff accounts
+            const res = await api.get('/users/', { params: { is_staff: true, page_size: 1000 } });
+            const mappedStaff: Staff[] = res.data.results.map((u: any) => ({
                 id: u.id.toString(),
                 name: u.firstName ? `${u.firstName} ${u.lastName}`.trim() : u.username || u.email,
                 email: u.email,
@@ -230,6 +230,7 @@ export interface Order {
     paymentStatus: 'Pending' | 'Paid' | 'Failed' | 'Refunded';
     paymentMethod: string; // Changed from literal union to string to support dynamic names
     transactionId?: string; // New field for manual verification
+    couponCode?: string; // Redeemed by the backend when the order is placed
     total: number;
     subtotal: number;
     shipping: number;
@@ -1375,6 +1376,7 @@ export function ProductProvider({ children }: { children: ReactNode }) {
                 payment_status: order.paymentStatus,
                 payment_method: order.paymentMethod,
                 transaction_id: order.transactionId,
+                coupon_code: order.couponCode,
                 subtotal: order.subtotal,
                 shipping_cost: order.shipping,
                 total: order.total,
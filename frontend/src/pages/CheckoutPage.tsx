@@ -229,6 +229,7 @@ export default function CheckoutPage() {
             paymentStatus: 'Pending',
             paymentMethod: methodConfig.id, // CHANGED: Send ID (e.g. 'bkash') instead of Name
             transactionId: transactionId || undefined,
+            couponCode: coupon?.code,
             subtotal: total,
             shipping: shippingCost,
             fee: vat,
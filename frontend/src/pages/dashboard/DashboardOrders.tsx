@@ -254,7 +254,7 @@ export default function DashboardOrders() {
         const itemsWithBase64 = await Promise.all(initialItems.map(async (item: any) => {
             if (item.image && item.image.startsWith('http')) {
                 try {
-                    const proxyUrl = `orders/proxy_image/?url=${encodeURIComponent(item.image)}`;
+                    const proxyUrl = `orders/proxy_image/?mode=data_uri&url=${encodeURIComponent(item.image)}`;
                     const response = await api.get(proxyUrl);
                     if (response.data.image) {
                         return { ...item, image: response.data.image };